@@ -5,6 +5,82 @@ if [ -f ./config/default.env ]; then
     source ./config/default.env
 fi
 
+# дополнительные параметры тонкой настройки, которые не запрашиваются при установке, но сохраняются при переконфигурации
+ADVANCED_PARAMETERS=(
+    PTSB_MAX_CONNECTIONS
+    PTSB_MAX_KEEPALIVE_CONNECTIONS
+    PTSB_KEEPALIVE_EXPIRY
+    PTSB_USE_HTTP2
+    PTSB_CONNECT_TIMEOUT
+    PTSB_CHECK_FILE_TIMEOUT
+    PTSB_CHECK_URL_TIMEOUT
+    PTSB_GET_STATUS_TIMEOUT
+    PTSB_HEALTHCHECK_TIMEOUT
+    SCAN_POLL_INITIAL_DELAY
+    SCAN_POLL_MAX_INTERVAL
+    SCAN_POLL_BACKOFF_FACTOR
+    SCAN_POLL_MAX_WAIT
+    SCAN_POLL_MAX_ERRORS
+    SCAN_POLL_MAX_CONCURRENT
+    VERDICT_CACHE_TTL_CLEAN
+    VERDICT_CACHE_TTL_UNWANTED
+    VERDICT_CACHE_TTL_DANGEROUS
+    TG_FILES_CACHE_MAX_SIZE
+    STREAM_TG_UPLOADS
+    STREAM_BUFFER_CHUNKS
+    UPLOAD_CHUNK_SIZE
+    FSM_FLUSH_INTERVAL
+    FSM_CACHE_MAX_SIZE
+    FSM_STATE_TTL
+    FSM_CLEANUP_INTERVAL
+    DB_CACHE_SIZE_KIB
+    DB_BUSY_TIMEOUT_MS
+    DB_STATEMENT_CACHE_SIZE
+    USERS_CACHE_MAX_SIZE
+    USERS_CACHE_TTL
+    QUOTA_TIMEZONE
+    RATE_LIMIT_BURST_WINDOW
+    RATE_LIMIT_DEFAULT_BURST
+    RATE_LIMIT_DEFAULT_HOURLY
+    RATE_LIMIT_DEFAULT_DAILY
+    RATE_LIMIT_FLUSH_INTERVAL
+    SUBMISSION_MAX_CONCURRENT
+    SUBMISSION_QUEUE_UPDATE_INTERVAL
+    SUBMISSION_JOB_MAX_ATTEMPTS
+    TG_DOWNLOAD_STALL_TIMEOUT
+    TG_DOWNLOAD_MAX_RETRY_DELAY
+    TG_DOWNLOAD_PROGRESS_INTERVAL
+    TG_API_SERVER
+    TG_API_LOCAL_MODE
+    BATCH_COLLECT_DELAY
+    BATCH_MAX_FILES
+    BATCH_DOWNLOAD_CONCURRENCY
+    URL_BATCH_MAX_URLS
+    URL_LIST_MAX_FILE_SIZE
+    URL_VERDICT_CACHE_TTL_CLEAN
+    URL_VERDICT_CACHE_TTL_UNWANTED
+    URL_VERDICT_CACHE_TTL_DANGEROUS
+    URL_VERDICT_CACHE_LRU_SIZE
+    URL_TRACKING_PARAMS
+    INFLIGHT_CHARGE_POLICY
+    PTSB_CIRCUIT_FAILURE_THRESHOLD
+    PTSB_CIRCUIT_OPEN_DURATION
+    PTSB_HEALTHCHECK_INTERVAL
+    PTSB_HEALTH_HISTORY_SIZE
+    PTSB_RETRY_MAX_ATTEMPTS
+    PTSB_RETRY_BASE_DELAY
+    PTSB_RETRY_MAX_DELAY
+    PTSB_RETRY_DEADLINE
+    PTSB_NODES
+    PTSB_NODE_LATENCY_SMOOTHING
+    SYNC_SCAN_MAX_FILE_SIZE
+    SYNC_SCAN_MAX_WAIT
+    SYNC_SCAN_POLL_INTERVAL
+    PTSB_TIMEOUT_MIN
+    PTSB_TIMEOUT_SAFETY_FACTOR
+    PTSB_UPLOAD_ASSUMED_THROUGHPUT
+)
+
 echo " "
 echo "╔═══════════════════════════════════════════════════════════════════════════╗"
 echo "║                                  WELCOME                                  ║"
@@ -67,6 +143,10 @@ PROXY_USER=${PROXY_USER}
 PROXY_PASS=${PROXY_PASS}
 EOF
 
+for parameter in "${ADVANCED_PARAMETERS[@]}"; do
+    echo "${parameter}=${!parameter}" >> ./config/default.env
+done
+
 echo " "
 echo "═════════════════════════════════════════════════════════════════════════════"
 echo " "
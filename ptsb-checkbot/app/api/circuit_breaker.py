@@ -0,0 +1,148 @@
+# встроенные библиотеки
+import logging
+import os
+import time
+
+# встроенные классы
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+
+### параметры автоматического выключателя запросов к песочнице
+PTSB_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('PTSB_CIRCUIT_FAILURE_THRESHOLD') or 3)     # после скольких сбоев подряд перестать отправлять запросы в песочницу
+PTSB_CIRCUIT_OPEN_DURATION = float(os.getenv('PTSB_CIRCUIT_OPEN_DURATION') or 30)          # сколько секунд не отправлять запросы, прежде чем попробовать снова
+PTSB_HEALTH_HISTORY_SIZE = int(os.getenv('PTSB_HEALTH_HISTORY_SIZE') or 10)                # сколько последних проверок состояния API хранить для админа
+
+# состояния выключателя
+CIRCUIT_CLOSED = "closed"           # песочница доступна, запросы идут как обычно
+CIRCUIT_OPEN = "open"               # песочница недоступна, запросы сразу завершаются ошибкой
+CIRCUIT_HALF_OPEN = "half_open"     # пробный запрос: если он пройдет, выключатель замкнется
+
+logger = logging.getLogger("ptsb_checkbot")
+
+
+# кастомный класс для результата одной проверки состояния API
+@dataclass
+class HealthProbe:
+    """
+    Класс, описывающий одну проверку состояния API PTSB, выполненную фоновым опросом
+    """
+    checked_at: float
+    is_ok: bool
+    latency: float
+    error_message: Optional[str] = None
+
+
+# кастомный класс для ошибки отправки запроса при разомкнутом выключателе
+class CircuitOpenError(Exception):
+    """
+    Исключение, которое выбрасывается вместо запроса к песочнице, пока она считается недоступной
+    """
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"PTSB circuit is open, retry after {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+
+# автоматический выключатель запросов к песочнице
+class CircuitBreaker:
+    """
+    Circuit breaker для запросов к PTSB: после `PTSB_CIRCUIT_FAILURE_THRESHOLD` сетевых сбоев подряд
+    запросы перестают отправляться и сразу завершаются ошибкой, чтобы пользователи не ждали полный таймаут
+    недоступной песочницы. Через `PTSB_CIRCUIT_OPEN_DURATION` секунд пропускается один пробный запрос,
+    а успешная фоновая проверка состояния API замыкает выключатель сразу.
+    """
+
+    def __init__(
+            self,
+            failure_threshold: int = PTSB_CIRCUIT_FAILURE_THRESHOLD,
+            open_duration: float = PTSB_CIRCUIT_OPEN_DURATION,
+            name: str = "PTSB"
+        ) -> None:
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.open_duration = open_duration
+        self.failures_in_row = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.trial_in_flight = False
+        self.history: deque[HealthProbe] = deque(maxlen=PTSB_HEALTH_HISTORY_SIZE)
+
+    # текущее состояние выключателя
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CIRCUIT_CLOSED
+        if time.time() - self.opened_at < self.open_duration:
+            return CIRCUIT_OPEN
+        return CIRCUIT_HALF_OPEN
+
+    # через сколько секунд будет пропущен пробный запрос
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(self.opened_at + self.open_duration - time.time(), 0.0)
+
+    # разрешение на запрос
+    def before_request(self) -> None:
+        """
+        Проверяет, можно ли сейчас отправить запрос в песочницу. В полуоткрытом состоянии пропускает
+        только один пробный запрос, остальные ждут его результата.
+
+        Выбрасывает:
+            - `CircuitOpenError`, если запрос отправлять нельзя
+        """
+
+        state = self.state
+        if state == CIRCUIT_CLOSED:
+            return
+        if state == CIRCUIT_HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return
+        raise CircuitOpenError(self.retry_after())
+
+    # учет успешного запроса
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"{self.name} is available again, circuit is closed")
+        self.failures_in_row = 0
+        self.opened_at = None
+        self.last_error = None
+        self.trial_in_flight = False
+
+    # учет запроса, прерванного не из-за песочницы
+    def abort_request(self) -> None:
+        self.trial_in_flight = False
+
+    # учет сбоя запроса
+    def record_failure(self, error_message: str) -> None:
+        self.failures_in_row += 1
+        self.last_error = error_message
+        self.trial_in_flight = False
+
+        # пробный запрос не прошел или сбоев слишком много - снова не отправляем запросы
+        if self.opened_at is not None or self.failures_in_row >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"{self.name} failed {self.failures_in_row} times in row, circuit is open for {self.open_duration:g} seconds. Last error: {error_message}")
+            self.opened_at = time.time()
+
+    # учет фоновой проверки состояния API
+    def record_probe(self, probe: HealthProbe) -> None:
+        """
+        Сохраняет результат фоновой проверки состояния API в историю и учитывает его так же, как результат обычного запроса
+
+        Принимает:
+            - `probe` (HealthProbe): результат проверки
+        """
+
+        self.history.append(probe)
+        if probe.is_ok:
+            self.record_success()
+        else:
+            self.record_failure(probe.error_message or "Неизвестная ошибка.")
+
+    # последняя проверка состояния API
+    @property
+    def last_probe(self) -> Optional[HealthProbe]:
+        return self.history[-1] if self.history else None
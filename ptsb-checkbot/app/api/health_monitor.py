@@ -0,0 +1,99 @@
+# встроенные библиотеки
+import asyncio
+import logging
+import os
+import time
+
+# встроенные классы
+from typing import Optional
+
+# самописные
+from app.api import ptsb_client
+from app.api.circuit_breaker import HealthProbe, CIRCUIT_CLOSED
+from app.api.ptsb_client import ApiHeathCheck
+from app.api.sandbox_nodes import SandboxNode, SandboxNodePool
+
+
+### параметры фоновой проверки состояния API песочницы
+PTSB_HEALTHCHECK_INTERVAL = float(os.getenv('PTSB_HEALTHCHECK_INTERVAL') or 60)    # как часто проверять состояние API, пока песочница доступна (секунд)
+
+logger = logging.getLogger("ptsb_checkbot")
+
+
+# фоновая проверка состояния API песочницы
+class PtsbHealthMonitor:
+    """
+    Фоновая задача, которая периодически проверяет состояние API каждого узла PTSB и передает результат в выключатель узла.
+    Пока узел недоступен, проверка выполняется чаще - раз в `PTSB_CIRCUIT_OPEN_DURATION` секунд,
+    чтобы запросы пользователей снова пошли на узел сразу после его восстановления.
+    Результаты проверок хранятся в выключателях, поэтому админ видит состояние API без нового запроса.
+    """
+
+    def __init__(self, nodes: SandboxNodePool = ptsb_client.ptsb_nodes, interval: float = PTSB_HEALTHCHECK_INTERVAL) -> None:
+        self._nodes = nodes
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    # одна проверка состояния API узла
+    async def probe(self, node: SandboxNode) -> HealthProbe:
+        """
+        Проверяет состояние API узла PTSB и учитывает результат в выключателе узла
+
+        Принимает:
+            - `node` (SandboxNode): узел песочницы
+
+        Возвращает:
+            - `HealthProbe` (object of custom class): результат проверки
+        """
+
+        started_at = time.monotonic()
+        api_health_check: ApiHeathCheck = await ptsb_client.make_api_healthcheck(ptsb_node=node.address)
+        health_probe = HealthProbe(
+            checked_at=time.time(),
+            is_ok=api_health_check.is_ok,
+            latency=time.monotonic() - started_at,
+            error_message=api_health_check.error_message
+        )
+
+        if not health_probe.is_ok:
+            logger.warning(f"PTSB node {node.address} healthcheck failed in {health_probe.latency:.2f} seconds. Error: {health_probe.error_message}")
+        node.circuit.record_probe(health_probe)
+        return health_probe
+
+    # запуск фоновой проверки
+    def start(self) -> None:
+        """
+        Запускает фоновую задачу проверки состояния API. Первая проверка выполняется сразу.
+        """
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="ptsb_health_monitor")
+
+    # остановка фоновой проверки
+    async def stop(self) -> None:
+        """
+        Останавливает фоновую задачу проверки состояния API.
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # основной цикл проверки
+    async def _run(self) -> None:
+        while True:
+            # узлы проверяются одновременно, чтобы недоступный узел не задерживал проверку остальных
+            probe_results = await asyncio.gather(*(self.probe(node) for node in self._nodes), return_exceptions=True)
+            for node, probe_result in zip(self._nodes, probe_results):
+                if isinstance(probe_result, Exception):
+                    logger.error(f"Unexpected error while checking PTSB node {node.address} health", exc_info=probe_result)
+
+            interval = self._interval
+            for node in self._nodes:
+                if node.circuit.state != CIRCUIT_CLOSED:
+                    interval = min(interval, node.circuit.open_duration)
+            await asyncio.sleep(interval)
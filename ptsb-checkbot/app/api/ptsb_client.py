@@ -1,15 +1,26 @@
 # встроенные библиотеки
+import asyncio
+import email.utils
 import json
+import logging
 import os
+import random
+import time
 import urllib3
+import uuid
 
 # устанавливаемые библиотеки
+import aiofiles
 import httpx
 
 # встроенные классы
 from urllib.parse import urlencode, quote
 from dataclasses import dataclass
-from typing import Optional
+from typing import AsyncIterator, Callable, Optional
+
+# самописные классы
+from app.api.circuit_breaker import CircuitOpenError
+from app.api.sandbox_nodes import SandboxNode, SandboxNodePool, parse_nodes
 
 
 ### параметры подключения к песочнице
@@ -21,6 +32,49 @@ if not VERIFY_SSL_CONNECTIONS:
 # адрес песочницы
 PTSB_ROOT_ADDR = str(os.getenv('PTSB_ROOT_ADDR'))
 PTSB_TOKEN = str(os.getenv('PTSB_TOKEN'))
+# несколько узлов песочницы через запятую в виде `адрес|токен|вес`, если задан - PTSB_ROOT_ADDR не используется
+PTSB_NODES = os.getenv('PTSB_NODES') or ""
+
+### параметры пула подключений к песочнице
+PTSB_MAX_CONNECTIONS = int(os.getenv('PTSB_MAX_CONNECTIONS') or 20)                      # максимум одновременных соединений с песочницей
+PTSB_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('PTSB_MAX_KEEPALIVE_CONNECTIONS') or 10)  # сколько простаивающих соединений держать открытыми
+PTSB_KEEPALIVE_EXPIRY = float(os.getenv('PTSB_KEEPALIVE_EXPIRY') or 30)                  # через сколько секунд простоя закрывать соединение
+PTSB_USE_HTTP2 = bool(int(os.getenv('PTSB_USE_HTTP2') or 0))                             # использовать HTTP/2, если песочница его поддерживает
+
+### таймауты запросов к песочнице по эндпоинтам (секунд), для запросов, кроме установки соединения, - максимальные:
+### фактический таймаут рассчитывается по задержке и скорости загрузки на узел, измеренным на предыдущих запросах
+PTSB_CONNECT_TIMEOUT = float(os.getenv('PTSB_CONNECT_TIMEOUT') or 10)          # установка соединения, общая для всех запросов
+PTSB_CHECK_FILE_TIMEOUT = float(os.getenv('PTSB_CHECK_FILE_TIMEOUT') or 600)   # /scan/checkFile
+PTSB_CHECK_URL_TIMEOUT = float(os.getenv('PTSB_CHECK_URL_TIMEOUT') or 10)      # /scan/checkURL
+PTSB_GET_STATUS_TIMEOUT = float(os.getenv('PTSB_GET_STATUS_TIMEOUT') or 10)    # /scan/getStatus
+PTSB_HEALTHCHECK_TIMEOUT = float(os.getenv('PTSB_HEALTHCHECK_TIMEOUT') or 10)  # /maintenance/checkHealth
+
+### расчет таймаутов запросов к песочнице
+PTSB_TIMEOUT_MIN = float(os.getenv('PTSB_TIMEOUT_MIN') or 5)                                      # минимальный таймаут запроса (секунд)
+PTSB_TIMEOUT_SAFETY_FACTOR = float(os.getenv('PTSB_TIMEOUT_SAFETY_FACTOR') or 3)                  # во сколько раз таймаут больше ожидаемого времени запроса
+PTSB_UPLOAD_ASSUMED_THROUGHPUT = int(os.getenv('PTSB_UPLOAD_ASSUMED_THROUGHPUT') or 256 * 1024)   # скорость загрузки на узел, пока она еще не измерена (байт/сек)
+
+### повторные попытки запросов к песочнице при временных сбоях
+PTSB_RETRY_MAX_ATTEMPTS = int(os.getenv('PTSB_RETRY_MAX_ATTEMPTS') or 3)       # сколько всего попыток делать на один запрос
+PTSB_RETRY_BASE_DELAY = float(os.getenv('PTSB_RETRY_BASE_DELAY') or 0.5)       # базовая пауза перед повтором, удваивается с каждой попыткой (секунд)
+PTSB_RETRY_MAX_DELAY = float(os.getenv('PTSB_RETRY_MAX_DELAY') or 10)          # максимальная пауза перед повтором (секунд)
+PTSB_RETRY_DEADLINE = float(os.getenv('PTSB_RETRY_DEADLINE') or 30)            # после скольких секунд от первой попытки новые попытки не начинаются
+
+# временные ошибки, после которых можно повторить идемпотентный запрос (getStatus, checkHealth)
+_RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# ответы, при которых песочница точно не приняла запрос и задание не создала, - их можно повторить и для отправки на проверку
+_SAFE_RETRY_STATUS_CODES = frozenset({429, 503})
+
+# размер чанка, которым файл читается с диска при загрузке в песочницу (байт)
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE') or 64 * 1024)
+
+# общий клиент с пулом keep-alive соединений к песочнице, создается в main() и закрывается при остановке бота
+_ptsb_http_client: Optional[httpx.AsyncClient] = None
+
+# узлы песочницы, у каждого свой выключатель запросов и своя загрузка
+ptsb_nodes = SandboxNodePool(parse_nodes(PTSB_NODES, PTSB_TOKEN) or [SandboxNode(PTSB_ROOT_ADDR, PTSB_TOKEN)])
+
+logger = logging.getLogger("ptsb_checkbot")
 
 
 # кастомный класс для получения результатов загрузки файла на проверку 
@@ -32,6 +86,7 @@ class SendScanRequest:
     is_ok: bool
     scan_id: Optional[str] = None
     error_message: Optional[str] = None
+    ptsb_node: Optional[str] = None
 
 
 # кастомный класс для получения результатов проверки файла
@@ -47,6 +102,8 @@ class GetScanResust:
     threat: Optional[str] = None
     verdict: Optional[str] = None
     scan_error: Optional[str] = None
+    scan_state_code: Optional[str] = None
+    verdict_code: Optional[str] = None
 
 
 # кастомный класс для парсинга (маппинга) результатов проверки на описание результатов проверки
@@ -110,40 +167,315 @@ class CommonKnownErrors:
     error_413 = "Ошибка 413. Размер запроса превышает установленное ограничение."
     ssl_error = "Ошибка при проверке подлинности сертификата. Возможно, сертификат PTSB не является доверенным или между ботом и PTSB стоит SSL proxy."
     conn_error = "Ошибка соединения с PTSB. Возможно, сервис недоступен."
-    timeout_error = "Таймаут подключения. Не удалось подключиться к PTSB за 10 секунд ожидания."
+    timeout_error = f"Таймаут подключения. Не удалось подключиться к PTSB за {PTSB_CONNECT_TIMEOUT:g} секунд ожидания."
+    response_timeout_error = "Таймаут запроса. PTSB не ответил за отведенное время, возможно, он перегружен или канал до него стал медленнее обычного."
+    circuit_open = "PTSB временно недоступен: последние запросы к нему завершились ошибкой, поэтому новые запросы не отправляются."
 
+    # текст ошибки запроса, который не был отправлен, т.к. песочница недоступна
+    @classmethod
+    def circuit_open_error(cls, error: CircuitOpenError) -> str:
+        return f"{cls.circuit_open} Повторите попытку через {max(error.retry_after, 1):.0f} сек."
 
 
-# функция загрузки файлов на проверку в ptsb TODO переписать парсинг ошибок в соответствии с healthcheck
-async def send_file_to_scan(
-        path_to_file_to_upload: str,
-        check_priority: int,
-        passwords: list[str] = None
-    ) -> SendScanRequest:
+# создание общего клиента подключений к песочнице
+async def open_ptsb_client() -> httpx.AsyncClient:
     """
-    Отправляет файл на проверку в PTSB. Загружает файл на проверку в асинхронном режиме и дожидается результатов проверки.
-    
-    Параметры:
-        - `path_to_file_to_upload` (str): Полный путь к файлу, который будет отправлен на проверку в PTSB.
-        - `check_priority` (int): Приоритет проверки файлов от этого пользователя.
-        - `passwords` (list[str]): Набор паролей для распаковки (опциональное), по умолчанию отсутствует.
+    Создает общий для всего приложения клиент подключений к PTSB с пулом keep-alive соединений.
+    Повторный вызов возвращает уже созданный клиент.
 
     Возвращает:
-        - `SendScanResust` (object of custom class): Объект класса `SendScanResust`, содержащий информацию о `scan_id` созданного задания на проверку, либо `error_message` с описанием ошибки. 
+        - `httpx.AsyncClient`: Клиент, через который выполняются все запросы к PTSB.
     """
 
-    # формируем параметры запроса
-    request_headers = {
-        'X-API-Key': PTSB_TOKEN
-    }
+    global _ptsb_http_client
+
+    if _ptsb_http_client is None or _ptsb_http_client.is_closed:
+        _ptsb_http_client = httpx.AsyncClient(
+            verify=VERIFY_SSL_CONNECTIONS,
+            http2=PTSB_USE_HTTP2,
+            limits=httpx.Limits(
+                max_connections=PTSB_MAX_CONNECTIONS,
+                max_keepalive_connections=PTSB_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=PTSB_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(PTSB_GET_STATUS_TIMEOUT, connect=PTSB_CONNECT_TIMEOUT)
+        )
+
+    return _ptsb_http_client
+
+
+# закрытие общего клиента подключений к песочнице
+async def close_ptsb_client() -> None:
+    """
+    Закрывает общий клиент подключений к PTSB вместе со всеми открытыми соединениями пула.
+    """
+
+    global _ptsb_http_client
+
+    if _ptsb_http_client is not None:
+        await _ptsb_http_client.aclose()
+        _ptsb_http_client = None
+
+
+# расчет таймаута конкретного запроса к узлу
+def _request_timeout(
+        node: SandboxNode,
+        path: str,
+        max_timeout: float,
+        payload_size: Optional[int] = None
+    ) -> httpx.Timeout:
+    """
+    Рассчитывает таймаут запроса к узлу песочницы по измеренным на нем задержке и скорости загрузки:
+    ожидаемое время запроса - задержка узла и, если в запросе загружается файл, время передачи его тела,
+    умноженное на `PTSB_TIMEOUT_SAFETY_FACTOR` и ограниченное снизу `PTSB_TIMEOUT_MIN`, а сверху - таймаутом эндпоинта.
+    Пока по узлу нет ни одного замера задержки, запросу без тела дается таймаут эндпоинта целиком,
+    а пока не измерена скорость загрузки, она считается равной `PTSB_UPLOAD_ASSUMED_THROUGHPUT`.
+    Время установки соединения ограничивается отдельно, общим для всех запросов `PTSB_CONNECT_TIMEOUT`.
+
+    Принимает:
+        - `node` (SandboxNode): узел песочницы
+        - `path` (str): путь запроса, нужен только для журнала
+        - `max_timeout` (float): таймаут эндпоинта, больше которого таймаут не бывает (секунд)
+        - `payload_size` (int): размер загружаемого тела запроса в байтах, `None` - запрос без файла
+
+    Возвращает:
+        - `httpx.Timeout`: таймаут запроса
+    """
+
+    if payload_size is None and node.latency is None:
+        timeout = max_timeout
+        basis = "no latency measured yet"
+    else:
+        expected_duration = node.latency or 0.0
+        basis = f"latency {expected_duration:.2f}s"
+        if payload_size is not None:
+            throughput = node.upload_throughput or PTSB_UPLOAD_ASSUMED_THROUGHPUT
+            expected_duration += payload_size / throughput
+            basis += f", {payload_size} bytes at {throughput / 1024:.0f} KiB/s{'' if node.upload_throughput else ' (assumed)'}"
+        timeout = min(max(expected_duration * PTSB_TIMEOUT_SAFETY_FACTOR, PTSB_TIMEOUT_MIN), max_timeout)
+
+    # загрузки файлов редкие и долгие, их таймауты видны всегда, а таймауты частых коротких запросов - только в отладке
+    log_level = logging.INFO if payload_size is not None else logging.DEBUG
+    logger.log(log_level, f"Timeout for {node.url(path.split('?')[0])} is {timeout:.1f} seconds ({basis}, limits {PTSB_TIMEOUT_MIN:g}-{max_timeout:g}s)")
+
+    return httpx.Timeout(timeout, connect=PTSB_CONNECT_TIMEOUT)
+
+
+# учет времени запроса в задержке и скорости загрузки узла
+def _record_node_timing(
+        node: SandboxNode,
+        elapsed: float,
+        measure_latency: bool,
+        payload_size: Optional[int],
+        timed_out: bool = False
+    ) -> None:
+    if measure_latency:
+        node.record_latency(elapsed, timed_out=timed_out)
+    if payload_size is not None:
+        node.record_upload(payload_size, elapsed, timed_out=timed_out)
+
+
+# отправка запроса в песочницу с учетом ее доступности
+async def _post(
+        node: SandboxNode,
+        path: str,
+        use_circuit: bool = True,
+        measure_latency: bool = True,
+        payload_size: Optional[int] = None,
+        **request_kwargs
+    ) -> httpx.Response:
+    """
+    Отправляет POST запрос на узел песочницы через общий клиент. Пока узел считается недоступным, запрос не отправляется.
+    Результат запроса учитывается выключателем узла: сетевая ошибка или ответ 5xx - сбой, любой другой ответ - успех.
+    Пока запрос выполняется, он учитывается в загрузке узла, а время его выполнения - в задержке и скорости загрузки узла.
+    Если в запросе загружается файл с диска (`payload_size`), таймаут из `request_kwargs` ограничивает всю загрузку целиком,
+    а не только каждую операцию чтения и записи по отдельности.
+
+    Принимает:
+        - `node` (SandboxNode): узел песочницы
+        - `path` (str): путь запроса вместе с параметрами
+        - `use_circuit` (bool): учитывать выключатель; проверка состояния API идет в обход него, ее результат учитывает сам фоновый опрос
+        - `measure_latency` (bool): учитывать время ответа в средней задержке узла; загрузка файла зависит от его размера, а не от узла
+        - `payload_size` (int): размер загружаемого файла в байтах, по которому считается скорость загрузки на узел, `None` - запрос без файла
+          или файл, скорость передачи которого зависит не от узла, например поток из ТГ
+        - `request_kwargs`: параметры запроса `httpx.AsyncClient.post`
+
+    Возвращает:
+        - `httpx.Response`: ответ песочницы
+
+    Выбрасывает:
+        - `CircuitOpenError`, если песочница недоступна и запрос не отправлялся
+        - `httpx.RequestError` при ошибке выполнения запроса
+    """
+
+    if use_circuit:
+        node.circuit.before_request()
+
+    # httpx ограничивает таймаутом каждую операцию чтения и записи, поэтому медленная загрузка большого файла
+    # без общего ограничения могла бы идти сколько угодно долго
+    request_timeout = request_kwargs.get('timeout')
+    total_timeout = None
+    if payload_size is not None and isinstance(request_timeout, httpx.Timeout) and request_timeout.read is not None:
+        total_timeout = request_timeout.read + (request_timeout.connect or 0.0)
+
+    node.in_flight += 1
+    started_at = time.monotonic()
+    try:
+        async_client = await open_ptsb_client()
+        try:
+            response = await asyncio.wait_for(async_client.post(node.url(path), **request_kwargs), total_timeout)
+        except asyncio.TimeoutError:
+            raise httpx.ReadTimeout(f"Request was not completed in {total_timeout:g} seconds") from None
+    except httpx.TransportError as e:
+        # узел не ответил за таймаут - значит, он медленнее, чем казалось, и это тоже замер, иначе следующий таймаут будет таким же коротким
+        if isinstance(e, (httpx.ReadTimeout, httpx.WriteTimeout)):
+            _record_node_timing(node, time.monotonic() - started_at, measure_latency, payload_size, timed_out=True)
+        if use_circuit:
+            node.circuit.record_failure(f"{type(e).__name__}: {e}")
+        raise
+    except BaseException:
+        if use_circuit:
+            node.circuit.abort_request()
+        raise
+    finally:
+        node.in_flight -= 1
+
+    # быстрый отказ перегруженного узла не должен делать его привлекательнее остальных
+    if response.status_code < 500:
+        _record_node_timing(node, time.monotonic() - started_at, measure_latency, payload_size)
+
+    if not use_circuit:
+        return response
+    if response.status_code >= 500:
+        node.circuit.record_failure(f"Ошибка {response.status_code}")
+    else:
+        node.circuit.record_success()
+    return response
+
+
+# сколько секунд песочница просит подождать перед повтором запроса
+def _parse_retry_after(response: httpx.Response) -> Optional[float]:
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+
+    # Retry-After бывает числом секунд или HTTP датой
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+# пауза перед повтором запроса: экспоненциальный рост с полным случайным разбросом, но не меньше Retry-After
+def _retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    delay = random.uniform(0, min(PTSB_RETRY_MAX_DELAY, PTSB_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+    retry_after = _parse_retry_after(response) if response is not None else None
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+# отправка запроса в песочницу с повторами при временных сбоях
+async def _post_with_retry(
+        path: str,
+        build_request: Callable[[SandboxNode], dict],
+        is_idempotent: bool,
+        node: Optional[SandboxNode] = None,
+        is_replayable: bool = True,
+        use_circuit: bool = True,
+        measure_latency: bool = True,
+        payload_size: Optional[int] = None
+    ) -> tuple[SandboxNode, httpx.Response]:
+    """
+    Отправляет POST запрос в песочницу через `_post` и повторяет его при временных сбоях с экспоненциальной паузой
+    и случайным разбросом, учитывая `Retry-After`. Всего делается не больше `PTSB_RETRY_MAX_ATTEMPTS` попыток,
+    и новая попытка не начинается, если пауза перед ней выйдет за `PTSB_RETRY_DEADLINE` секунд от первой попытки.
+
+    Идемпотентный запрос повторяется после любой сетевой ошибки и ответов 429 и 5xx. Запрос на проверку повторяется,
+    только если песочница его точно не получила (не удалось подключиться) или явно отказалась принимать (429, 503),
+    чтобы одно задание не было создано дважды.
+
+    Если узел не указан, для каждой попытки выбирается наименее загруженный узел, и повтор по возможности уходит
+    на другой узел, а не на тот, который только что не справился.
+
+    Принимает:
+        - `path` (str): путь запроса вместе с параметрами
+        - `build_request` (Callable[[SandboxNode], dict]): формирует параметры запроса `httpx.AsyncClient.post` к узлу для каждой попытки
+        - `is_idempotent` (bool): повтор запроса ничего не меняет в песочнице
+        - `node` (SandboxNode): узел, которому отправляются все попытки, `None` - выбирать узел самостоятельно
+        - `is_replayable` (bool): тело запроса можно сформировать заново; поток, который уже прочитан, повторить нельзя
+        - `use_circuit` (bool): учитывать выключатель узла
+        - `measure_latency` (bool): учитывать время ответа в средней задержке узла
+        - `payload_size` (int): размер загружаемого файла в байтах, `None` - запрос без файла или файл, скорость передачи которого зависит не от узла
+
+    Возвращает:
+        - `tuple[SandboxNode, httpx.Response]`: узел и ответ последней попытки
+
+    Выбрасывает:
+        - `CircuitOpenError`, если песочница недоступна и запрос не отправлялся
+        - `httpx.RequestError` при ошибке выполнения последней попытки
+    """
+
+    deadline = time.monotonic() + PTSB_RETRY_DEADLINE
+    failed_nodes: set[str] = set()
+    attempt = 1
+
+    while True:
+        attempt_node = node or ptsb_nodes.pick(exclude=failed_nodes)
+        response: Optional[httpx.Response] = None
+        transport_error: Optional[httpx.TransportError] = None
+        try:
+            response = await _post(
+                attempt_node,
+                path,
+                use_circuit=use_circuit,
+                measure_latency=measure_latency,
+                payload_size=payload_size,
+                **build_request(attempt_node)
+            )
+        except httpx.TransportError as e:
+            # до подключения тело запроса еще не читалось, поэтому такой запрос можно повторить в любом случае
+            is_sent = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+            if (is_sent and not is_idempotent) or attempt >= PTSB_RETRY_MAX_ATTEMPTS:
+                raise
+            transport_error = e
+            error_text = f"{type(e).__name__}: {e}"
+        else:
+            retry_status_codes = _RETRY_STATUS_CODES if is_idempotent else _SAFE_RETRY_STATUS_CODES
+            if response.status_code not in retry_status_codes or not is_replayable or attempt >= PTSB_RETRY_MAX_ATTEMPTS:
+                return attempt_node, response
+            error_text = f"Ошибка {response.status_code}"
+
+        failed_nodes.add(attempt_node.address)
+        url = attempt_node.url(path)
+
+        delay = _retry_delay(attempt, response)
+        if time.monotonic() + delay >= deadline:
+            logger.warning(f"Request to {url} failed ({error_text}), no time left in retry budget after attempt №{attempt}")
+            if transport_error is not None:
+                raise transport_error
+            return attempt_node, response
+
+        logger.info(f"Request to {url} failed ({error_text}), retrying in {delay:.1f} seconds (attempt №{attempt + 1} of {PTSB_RETRY_MAX_ATTEMPTS})")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+# формирование пути checkFile с параметрами проверки
+def _build_check_file_path(check_priority: int, passwords: list[str] = None) -> str:
     scan_parameters = {
         'async_result': 'true',
         'short_result': 'true',
         'priority': check_priority
     }
     
-    #формируем URL для обращения на endpoint метод для запуска проверки файла
-    scan_file_url = f"https://{PTSB_ROOT_ADDR}/api/v1/scan/checkFile"
+    #формируем путь до endpoint метода для запуска проверки файла, адрес узла подставляется при отправке
+    scan_file_url = "/api/v1/scan/checkFile"
 
     # добавляем к ней параметры проверки
     full_scan_file_url = f"{scan_file_url}?{urlencode(scan_parameters)}"
@@ -154,42 +486,222 @@ async def send_file_to_scan(
         passwords_encoded = quote(passwords_json, safe='')
         full_scan_file_url += f"&passwords_for_unpack={passwords_encoded}"
 
+    return full_scan_file_url
+
+
+# разбор ответа песочницы на запрос создания задания
+def _parse_send_scan_response(node: SandboxNode, response: httpx.Response) -> SendScanRequest:
+    # если http статус код 200, то возвращаем результат вместе с узлом, на котором создано задание, и не паримся дальше
+    if response.status_code == 200:
+        response_data = response.json()
+        current_scan_id = response_data.get("data", {}).get("scan_id")
+        return SendScanRequest(is_ok=True, scan_id=current_scan_id, ptsb_node=node.address)
+
+    # если http статус код 401
+    if response.status_code == 401:
+        return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.error_401)
+    
+    # если http статус код 403:
+    if response.status_code == 403:
+        return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.error_403)
+
+    # если http статус код 413:
+    if response.status_code == 413:
+        return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.error_413)
+
+    # если ошибок нет в http, то проверяем, есть ли ошибки в response с запросом на проверку
+    response_data = response.json()
+    if response_data.get("errors"):
+        error_message = response_data["errors"][0].get("message", f"Не удалось определить причину ошибки.\nОтвет в сыром виде:{response.text}")
+        return SendScanRequest(is_ok=False, error_message=error_message)
+
+    return SendScanRequest(is_ok=False, error_message=f"Ошибка {response.status_code}. Подробностей по ошибке нет.")
+
+
+# multipart тело запроса checkFile, собираемое из потока чанков без буферизации файла целиком
+def _multipart_file_body(
+        file_name: str,
+        file_size: int,
+        file_chunks: AsyncIterator[bytes]
+    ) -> tuple[dict, AsyncIterator[bytes]]:
+    """
+    Формирует заголовки и тело `multipart/form-data` запроса с одним полем `file`. Размер файла известен заранее,
+    поэтому `Content-Length` выставляется точно и запрос не уходит в `chunked` кодировке.
+
+    Принимает:
+        - `file_name` (str): имя файла, которое увидит песочница
+        - `file_size` (int): точный размер файла в байтах
+        - `file_chunks` (AsyncIterator[bytes]): поток содержимого файла
+
+    Возвращает:
+        - `tuple[dict, AsyncIterator[bytes]]`: заголовки запроса и генератор тела запроса
+    """
+
+    boundary = uuid.uuid4().hex
+    safe_file_name = file_name.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+    preamble = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{safe_file_name}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8")
+    epilogue = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    headers = {
+        'Content-Type': f"multipart/form-data; boundary={boundary}",
+        'Content-Length': str(len(preamble) + file_size + len(epilogue))
+    }
+
+    async def body() -> AsyncIterator[bytes]:
+        yield preamble
+        async for chunk in file_chunks:
+            yield chunk
+        yield epilogue
+
+    return headers, body()
+
+
+# чтение файла с диска чанками фиксированного размера в один переиспользуемый буфер
+async def _read_file_chunks(path_to_file: str) -> AsyncIterator[memoryview]:
+    """
+    Читает файл асинхронно чанками по `UPLOAD_CHUNK_SIZE` байт. Все чанки читаются в один и тот же буфер,
+    поэтому память на одну загрузку не зависит от размера файла. Каждый чанк действителен только до запроса следующего:
+    httpx успевает отправить его в сокет раньше, чем генератор продолжит работу.
+
+    Принимает:
+        - `path_to_file` (str): полный путь к файлу
+
+    Возвращает:
+        - `AsyncIterator[memoryview]`: поток чанков файла
+    """
+
+    buffer = bytearray(UPLOAD_CHUNK_SIZE)
+    buffer_view = memoryview(buffer)
+
+    async with aiofiles.open(path_to_file, 'rb') as file_to_upload:
+        while read_size := await file_to_upload.readinto(buffer):
+            yield buffer_view[:read_size]
+
+
+# функция загрузки файлов на проверку в ptsb TODO переписать парсинг ошибок в соответствии с healthcheck
+async def send_file_to_scan(
+        path_to_file_to_upload: str,
+        check_priority: int,
+        passwords: list[str] = None
+    ) -> SendScanRequest:
+    """
+    Отправляет файл на проверку в PTSB. Загружает файл на проверку в асинхронном режиме и дожидается результатов проверки.
+    Файл читается с диска и передается потоком, целиком в память он не загружается.
+    
+    Параметры:
+        - `path_to_file_to_upload` (str): Полный путь к файлу, который будет отправлен на проверку в PTSB.
+        - `check_priority` (int): Приоритет проверки файлов от этого пользователя.
+        - `passwords` (list[str]): Набор паролей для распаковки (опциональное), по умолчанию отсутствует.
+
+    Возвращает:
+        - `SendScanResust` (object of custom class): Объект класса `SendScanResust`, содержащий информацию о `scan_id` созданного задания на проверку, либо `error_message` с описанием ошибки. 
+    """
+
     try:
-        async with httpx.AsyncClient(verify=VERIFY_SSL_CONNECTIONS, timeout=60) as async_client:
-            with open(path_to_file_to_upload, 'rb') as file_to_upload:
-                files = {
-                    'file': (file_to_upload)
-                }
-
-                response = await async_client.post(
-                    full_scan_file_url,
-                    headers=request_headers,
-                    files=files
-                )
-            
-        # если http статус код 200, то возвращаем результат и не паримся дальше
-        if response.status_code == 200:
-            response_data = response.json()
-            current_scan_id = response_data.get("data", {}).get("scan_id")
-            return SendScanRequest(is_ok=True, scan_id=current_scan_id)
+        file_size = os.path.getsize(path_to_file_to_upload)
+    except OSError as e:
+        return SendScanRequest(is_ok=False, error_message=f"Не удалось прочитать файл для отправки на проверку: {e}")
+
+    # файл с диска можно прочитать заново, поэтому запрос можно повторить, даже если песочница уже получила его тело
+    return await _send_file_body_to_scan(
+        file_name=os.path.basename(path_to_file_to_upload),
+        file_size=file_size,
+        open_file_chunks=lambda: _read_file_chunks(path_to_file_to_upload),
+        check_priority=check_priority,
+        passwords=passwords,
+        is_replayable=True
+    )
+
+
+# функция потоковой загрузки файла на проверку в ptsb без сохранения его на диск
+async def send_stream_to_scan(
+        file_name: str,
+        file_size: int,
+        file_chunks: AsyncIterator[bytes],
+        check_priority: int,
+        passwords: list[str] = None
+    ) -> SendScanRequest:
+    """
+    Отправляет файл на проверку в PTSB, передавая его содержимое потоком по мере поступления чанков.
+    Используется, чтобы файл из ТГ шел в песочницу напрямую, минуя диск.
+    
+    Параметры:
+        - `file_name` (str): Имя файла, которое увидит песочница.
+        - `file_size` (int): Точный размер файла в байтах.
+        - `file_chunks` (AsyncIterator[bytes]): Поток содержимого файла.
+        - `check_priority` (int): Приоритет проверки файлов от этого пользователя.
+        - `passwords` (list[str]): Набор паролей для распаковки (опциональное), по умолчанию отсутствует.
 
-        # если http статус код 401
-        if response.status_code == 401:
-            return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.error_401)
-        
-        # если http статус код 403:
-        if response.status_code == 403:
-            return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.error_403)
+    Возвращает:
+        - `SendScanResust` (object of custom class): Объект класса `SendScanResust`, содержащий информацию о `scan_id` созданного задания на проверку, либо `error_message` с описанием ошибки. 
+    """
 
-        # если http статус код 413:
-        if response.status_code == 413:
-            return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.error_413)
+    # поток из ТГ читается один раз, поэтому запрос повторяется, только если до песочницы не удалось подключиться
+    return await _send_file_body_to_scan(
+        file_name=file_name,
+        file_size=file_size,
+        open_file_chunks=lambda: file_chunks,
+        check_priority=check_priority,
+        passwords=passwords,
+        is_replayable=False
+    )
+
+
+# загрузка содержимого файла на проверку с повторами при временных сбоях
+async def _send_file_body_to_scan(
+        file_name: str,
+        file_size: int,
+        open_file_chunks: Callable[[], AsyncIterator[bytes]],
+        check_priority: int,
+        passwords: Optional[list[str]],
+        is_replayable: bool
+    ) -> SendScanRequest:
 
-        # если ошибок нет в http, то проверяем, есть ли ошибки в response с запросом на проверку ссылки
-        response_data = response.json()
-        if response_data.get("errors"):
-            error_message = response_data["errors"][0].get("message", f"Не удалось определить причину ошибки.\nОтвет в сыром виде:{response.text}")
-            return SendScanRequest(is_ok=False, error_message=error_message)
+    # формируем параметры запроса
+    full_scan_file_path = _build_check_file_path(check_priority, passwords)
+
+    # файл с диска уходит со скоростью канала до узла, поэтому таймаут его загрузки считается по размеру файла и скорости узла,
+    # а поток из ТГ идет со скоростью скачивания из ТГ: для него таймаут эндпоинта действует на каждую операцию,
+    # а зависание самого ТГ отслеживает TG_DOWNLOAD_STALL_TIMEOUT
+    payload_size = file_size if is_replayable else None
+
+    # тело запроса формируется для каждой попытки заново, т.к. генератор тела одноразовый
+    def build_request(node: SandboxNode) -> dict:
+        multipart_headers, multipart_body = _multipart_file_body(file_name, file_size, open_file_chunks())
+        if payload_size is not None:
+            request_timeout = _request_timeout(node, full_scan_file_path, PTSB_CHECK_FILE_TIMEOUT, payload_size=payload_size)
+        else:
+            logger.info(f"Timeout for {node.url(full_scan_file_path.split('?')[0])} is {PTSB_CHECK_FILE_TIMEOUT:g} seconds per operation (file is streamed from TG)")
+            request_timeout = httpx.Timeout(PTSB_CHECK_FILE_TIMEOUT, connect=PTSB_CONNECT_TIMEOUT)
+        return {
+            'headers': {
+                'X-API-Key': node.token,
+                **multipart_headers
+            },
+            'content': multipart_body,
+            'timeout': request_timeout
+        }
+
+    try:
+        node, response = await _post_with_retry(
+            full_scan_file_path,
+            build_request,
+            is_idempotent=False,
+            is_replayable=is_replayable,
+            measure_latency=False,
+            payload_size=payload_size
+        )
+
+        return _parse_send_scan_response(node, response)
+
+    # песочница недоступна, запрос даже не отправлялся
+    except CircuitOpenError as e:
+        return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.circuit_open_error(e))
 
     # обрабатываем ошибки, которые больше по сетевой части, нежели по состоянию АПИ песка
     except httpx.ConnectError as e:
@@ -199,6 +711,9 @@ async def send_file_to_scan(
     
     except httpx.ConnectTimeout:
         return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.timeout_error)
+
+    except (httpx.ReadTimeout, httpx.WriteTimeout):
+        return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.response_timeout_error)
     
     except httpx.RequestError as e:
         return SendScanRequest(is_ok=False, error_message=f"Ошибка выполнения запроса: {e}")
@@ -207,8 +722,6 @@ async def send_file_to_scan(
         return SendScanRequest(is_ok=False, error_message=f"Неизвестная ошибка: {e}")
 
 
-
-
 # функция загрузки ссылок на проверку в ptsb
 async def send_link_to_scan(
         checking_link: str,
@@ -228,9 +741,6 @@ async def send_link_to_scan(
 
     try:
         # парметры запроса отправки на проверку
-        request_headers = {
-            'X-API-Key': PTSB_TOKEN
-        }
         scan_parameters = {
             'async_result': 'true',
             'short_result': 'true',
@@ -238,8 +748,8 @@ async def send_link_to_scan(
             'url': checking_link 
         }
 
-        # формируем ссылку до сервиса проверки ссылок
-        check_links_url = f"https://{PTSB_ROOT_ADDR}/api/v1/scan/checkURL"
+        # формируем путь до сервиса проверки ссылок, адрес узла подставляется при отправке
+        check_links_url = "/api/v1/scan/checkURL"
 
         # добавляем пароли, если требуется
         if passwords:
@@ -248,15 +758,22 @@ async def send_link_to_scan(
             passwords_encoded = quote(passwords_json, safe='')
             check_links_url += f"?passwords_for_unpack={passwords_encoded}"
 
-        # открываем подключение, отправляем запрос
-        async with httpx.AsyncClient(verify=VERIFY_SSL_CONNECTIONS, timeout=10) as check_url_conn:
-            response = await check_url_conn.post(check_links_url, headers=request_headers, json=scan_parameters)
+        # отправляем запрос на наименее загруженный узел, повторяя его, только если песочница его точно не приняла
+        node, response = await _post_with_retry(
+            check_links_url,
+            lambda node: {
+                'headers': {'X-API-Key': node.token},
+                'json': scan_parameters,
+                'timeout': _request_timeout(node, check_links_url, PTSB_CHECK_URL_TIMEOUT)
+            },
+            is_idempotent=False
+        )
 
         # если http статус код 200, то возвращаем результат и не паримся дальше
         if response.status_code == 200:
             response_data = response.json()
             current_scan_id = response_data.get("data", {}).get("scan_id")
-            return SendScanRequest(is_ok=True, scan_id=current_scan_id)
+            return SendScanRequest(is_ok=True, scan_id=current_scan_id, ptsb_node=node.address)
 
         # если http статус код 401
         if response.status_code == 401:
@@ -276,6 +793,13 @@ async def send_link_to_scan(
             error_message = response_data["errors"][0].get("message", f"Не удалось определить причину ошибки.\nОтвет в сыром виде:{response.text}")
             return SendScanRequest(is_ok=False, error_message=error_message)
 
+        # ответ без описания ошибки, например 5xx от прокси перед песочницей
+        return SendScanRequest(is_ok=False, error_message=f"Ошибка {response.status_code}. Подробностей по ошибке нет.")
+
+    # песочница недоступна, запрос даже не отправлялся
+    except CircuitOpenError as e:
+        return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.circuit_open_error(e))
+
     # обрабатываем ошибки, которые больше по сетевой части, нежели по состоянию АПИ песка
     except httpx.ConnectError as e:
         if "CERTIFICATE_VERIFY_FAILED" in str(e).upper():
@@ -284,6 +808,9 @@ async def send_link_to_scan(
     
     except httpx.ConnectTimeout:
         return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.timeout_error)
+
+    except (httpx.ReadTimeout, httpx.WriteTimeout):
+        return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.response_timeout_error)
     
     except httpx.RequestError as e:
         return SendScanRequest(is_ok=False, error_message=f"Ошибка выполнения запроса: {e}")
@@ -294,13 +821,15 @@ async def send_link_to_scan(
 
 # отпрвка запроса на получение результатов сканирования по scan_id
 async def get_scan_results(
-    scan_id: str
+    scan_id: str,
+    ptsb_node: Optional[str] = None
     ) -> GetScanResust:
     """
-    Получает результаты проверки задания по его `scan_id`.
+    Получает результаты проверки задания по его `scan_id` с того узла песочницы, на котором задание создано.
     
     Параметры:
         - `scan_id` (str): ID задания, результаты которого нужно получить
+        - `ptsb_node` (str): адрес узла, на котором создано задание, `None` - основной узел
     
     Возвращает:
         - `GetScanResust` (object of custom class): Объект класса `GetScanResust` c информацией о результатах запроса
@@ -308,19 +837,24 @@ async def get_scan_results(
     
     try:
         # параметры запроса для получения вердикта по сканированию по scan_id
-        request_headers = {
-            'X-API-Key': PTSB_TOKEN
-        }
         request_parameters = {
             'scan_id': scan_id
         }
 
-        # формируем ссылку до сервиса получаения результатов
-        get_results_url = f"https://{PTSB_ROOT_ADDR}/api/v1/scan/getStatus"
-
-        # отправляем запрос
-        async with httpx.AsyncClient(verify=VERIFY_SSL_CONNECTIONS, timeout=10) as get_res_conn:
-            response = await get_res_conn.post(get_results_url, headers=request_headers, json=request_parameters)
+        # формируем путь до сервиса получаения результатов
+        get_results_url = "/api/v1/scan/getStatus"
+
+        # отправляем запрос, получение статуса ничего не меняет в песочнице, поэтому его можно повторять при любых временных сбоях
+        _, response = await _post_with_retry(
+            get_results_url,
+            lambda node: {
+                'headers': {'X-API-Key': node.token},
+                'json': request_parameters,
+                'timeout': _request_timeout(node, get_results_url, PTSB_GET_STATUS_TIMEOUT)
+            },
+            is_idempotent=True,
+            node=ptsb_nodes.get(ptsb_node)
+        )
         
         # смотрим, что пришел ответ со статус кодом 200
         if response.status_code == 200:
@@ -328,12 +862,12 @@ async def get_scan_results(
             # проверяем, что блок данных result существует
             result_data = response_data.get("data", {}).get("result") 
             if result_data:
-                # получаем статус проведенного сканирования
-                scan_state = result_data.get("scan_state")
-                scan_state = ScanVerdictMapper.get_state_desc(scan_state)
+                # получаем статус проведенного сканирования, сырое значение сохраняем для кэша вердиктов
+                scan_state_code = result_data.get("scan_state")
+                scan_state = ScanVerdictMapper.get_state_desc(scan_state_code)
                 # получаем вердикт по заданию
-                verdict = result_data.get("verdict")
-                verdict = ScanVerdictMapper.get_verdict_desc(verdict)
+                verdict_code = result_data.get("verdict")
+                verdict = ScanVerdictMapper.get_verdict_desc(verdict_code)
                 # угрозу тоже получаем, но ни на что не маппим
                 threat = result_data.get("threat") if result_data.get("threat") else "Безопасный."
                 errors = response_data.get("data", {}).get("result", {}).get("errors")
@@ -343,8 +877,8 @@ async def get_scan_results(
                     scan_error = errors.get("type")
                     scan_error = ScanVerdictMapper.get_error_desc(scan_error)
 
-                    return GetScanResust(is_ok=True, is_scan_ready=True, scan_state=scan_state, threat=threat, verdict=verdict, scan_error=scan_error)
-                return GetScanResust(is_ok=True, is_scan_ready=True, scan_state=scan_state, threat=threat, verdict=verdict)
+                    return GetScanResust(is_ok=True, is_scan_ready=True, scan_state=scan_state, threat=threat, verdict=verdict, scan_error=scan_error, scan_state_code=scan_state_code, verdict_code=verdict_code)
+                return GetScanResust(is_ok=True, is_scan_ready=True, scan_state=scan_state, threat=threat, verdict=verdict, scan_state_code=scan_state_code, verdict_code=verdict_code)
             else:
                 # оповещаем, что результатов сканирования еще нет
                 return GetScanResust(is_ok=True, is_scan_ready=False)
@@ -365,6 +899,10 @@ async def get_scan_results(
         # если мы никуда вообще не попали
         return GetScanResust(is_ok=False, error_message="Неизвестная ошибка.")
     
+    # песочница недоступна, запрос даже не отправлялся
+    except CircuitOpenError as e:
+        return GetScanResust(is_ok=False, error_message=CommonKnownErrors.circuit_open_error(e))
+
     # обрабатываем всякие ошибочки
     except httpx.ConnectError as e:
         if "CERTIFICATE_VERIFY_FAILED" in str(e).upper():
@@ -373,6 +911,9 @@ async def get_scan_results(
     
     except httpx.ConnectTimeout:
         return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.timeout_error)
+
+    except (httpx.ReadTimeout, httpx.WriteTimeout):
+        return SendScanRequest(is_ok=False, error_message=CommonKnownErrors.response_timeout_error)
     
     except httpx.RequestError as e:
         return SendScanRequest(is_ok=False, error_message=f"Ошибка выполнения запроса: {e}")
@@ -382,24 +923,31 @@ async def get_scan_results(
 
     
 # проверка состояния API
-async def make_api_healthcheck() -> ApiHeathCheck:
+async def make_api_healthcheck(ptsb_node: Optional[str] = None) -> ApiHeathCheck:
     """
     Функция для проверки состояния API PTSB.
+
+    Параметры:
+        - `ptsb_node` (str): адрес узла песочницы, `None` - основной узел
     
     Возращает:
         - `ApiHeathCheck`(object of custom class): Объект класса `ApiHeathCheck` с информацией о состоянии API.
     """
 
     try:
-        # заголовки запроса, только токен
-        request_headers = {
-            'X-API-Key': PTSB_TOKEN
-        }
         # health_check_url
-        heathcheck_url = f"https://{PTSB_ROOT_ADDR}/api/v1/maintenance/checkHealth"
-        # открываем подключение, отправляем запрос
-        async with httpx.AsyncClient(verify=VERIFY_SSL_CONNECTIONS, timeout=10) as async_health_client:
-            response = await async_health_client.post(heathcheck_url, headers=request_headers)
+        heathcheck_url = "/api/v1/maintenance/checkHealth"
+        # отправляем запрос в обход выключателя, повторяя его при временных сбоях, в заголовках только токен
+        _, response = await _post_with_retry(
+            heathcheck_url,
+            lambda node: {
+                'headers': {'X-API-Key': node.token},
+                'timeout': _request_timeout(node, heathcheck_url, PTSB_HEALTHCHECK_TIMEOUT)
+            },
+            is_idempotent=True,
+            node=ptsb_nodes.get(ptsb_node),
+            use_circuit=False
+        )
         
         # проверка на 401ю
         if response.text == "Authorization required" and response.status_code == 401:
@@ -436,6 +984,9 @@ async def make_api_healthcheck() -> ApiHeathCheck:
     
     except httpx.ConnectTimeout:
         return ApiHeathCheck(is_ok=False, error_message=CommonKnownErrors.timeout_error)
+
+    except (httpx.ReadTimeout, httpx.WriteTimeout):
+        return ApiHeathCheck(is_ok=False, error_message=CommonKnownErrors.response_timeout_error)
     
     except httpx.RequestError as e:
         return ApiHeathCheck(is_ok=False, error_message=f"Ошибка выполнения запроса: {e}")
@@ -0,0 +1,219 @@
+# встроенные библиотеки
+import logging
+import os
+import random
+
+# встроенные классы
+from typing import Iterable, Iterator, Optional
+
+# самописные
+from app.api.circuit_breaker import CircuitBreaker, CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN
+
+
+### параметры выбора узла песочницы
+PTSB_NODE_LATENCY_SMOOTHING = float(os.getenv('PTSB_NODE_LATENCY_SMOOTHING') or 0.3)    # вес последнего замера в средней задержке и скорости загрузки узла (0-1), чем больше, тем быстрее они реагируют на изменения
+
+# задержка, с которой считается узел, пока по нему не было ни одного замера, и минимальная задержка в оценке загрузки (секунд)
+_MIN_NODE_LATENCY = 0.05
+# загрузки меньшего размера почти целиком состоят из задержки узла, поэтому скорость по ним не считается (байт)
+_MIN_THROUGHPUT_SAMPLE_SIZE = 256 * 1024
+
+logger = logging.getLogger("ptsb_checkbot")
+
+
+# узел песочницы
+class SandboxNode:
+    """
+    Один экземпляр PTSB, в который бот отправляет задания: адрес, токен и вес узла, его собственный выключатель запросов,
+    количество выполняющихся сейчас запросов к нему, средняя задержка его ответов и средняя скорость загрузки файлов на него.
+    """
+
+    def __init__(self, address: str, token: str, weight: float = 1.0) -> None:
+        self.address = address
+        self.token = token
+        self.weight = weight
+        self.circuit = CircuitBreaker(name=f"PTSB node {address}")
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.upload_throughput: Optional[float] = None
+
+    # полный адрес запроса к узлу
+    def url(self, path: str) -> str:
+        return f"https://{self.address}{path}"
+
+    # ссылка на задание в веб интерфейсе узла
+    def task_url(self, scan_id: str) -> str:
+        return self.url(f"/tasks/{scan_id}")
+
+    # учет задержки ответа узла
+    def record_latency(self, latency: float, timed_out: bool = False) -> None:
+        # запрос не дождался ответа, значит, задержка не меньше замера, и средняя сразу поднимается до него,
+        # иначе следующие запросы получат такой же короткий таймаут
+        if timed_out:
+            self.latency = max(self.latency or 0.0, latency)
+        elif self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += PTSB_NODE_LATENCY_SMOOTHING * (latency - self.latency)
+
+    # учет скорости загрузки файла на узел
+    def record_upload(self, payload_size: int, elapsed: float, timed_out: bool = False) -> None:
+        """
+        Учитывает загрузку файла в средней скорости загрузки на узел. Из времени загрузки вычитается средняя задержка узла,
+        чтобы скорость не занижалась на небольших файлах. Если загрузка не уложилась в таймаут, скорость была не больше замера,
+        и средняя сразу опускается до него.
+
+        Принимает:
+            - `payload_size` (int): размер тела запроса в байтах
+            - `elapsed` (float): сколько секунд заняла загрузка вместе с ответом узла
+            - `timed_out` (bool): загрузка прервана по таймауту
+        """
+
+        if payload_size < _MIN_THROUGHPUT_SAMPLE_SIZE:
+            return
+
+        transfer_time = max(elapsed - (self.latency or 0.0), _MIN_NODE_LATENCY)
+        throughput = payload_size / transfer_time
+        if timed_out:
+            self.upload_throughput = min(self.upload_throughput or throughput, throughput)
+        elif self.upload_throughput is None:
+            self.upload_throughput = throughput
+        else:
+            self.upload_throughput += PTSB_NODE_LATENCY_SMOOTHING * (throughput - self.upload_throughput)
+
+    # оценка загрузки узла, меньше - лучше
+    def load_score(self) -> float:
+        """
+        Оценивает, сколько придется ждать ответа узла на новый запрос: средняя задержка, умноженная на количество
+        выполняющихся запросов вместе с новым, и поделенная на вес узла.
+
+        Возвращает:
+            - `float`: оценка загрузки узла
+        """
+
+        return (self.in_flight + 1) * max(self.latency or 0.0, _MIN_NODE_LATENCY) / self.weight
+
+
+# функция разбора списка узлов песочницы
+def parse_nodes(raw_nodes: str, default_token: str) -> list[SandboxNode]:
+    """
+    Разбирает список узлов песочницы из параметра `PTSB_NODES`: узлы перечисляются через запятую
+    в виде `адрес|токен|вес`. Токен и вес можно не указывать, тогда используются общий токен и вес 1.
+
+    Принимает:
+        - `raw_nodes` (str): значение параметра
+        - `default_token` (str): токен для узлов, у которых он не указан
+
+    Возвращает:
+        - `list[SandboxNode]` (list): узлы в порядке перечисления, пустой список, если параметр не задан
+
+    Выбрасывает:
+        - `ValueError`, если узел описан с ошибкой
+    """
+
+    nodes: list[SandboxNode] = []
+    addresses: set[str] = set()
+
+    for raw_node in raw_nodes.split(","):
+        if not raw_node.strip():
+            continue
+
+        node_parts = [node_part.strip() for node_part in raw_node.split("|")]
+        if len(node_parts) > 3:
+            raise ValueError(f"PTSB node '{raw_node.strip()}' must be set as address|token|weight")
+
+        # адрес указывается так же, как в PTSB_ROOT_ADDR, - без схемы, но схему и / в конце прощаем
+        address = node_parts[0].removeprefix("https://").rstrip("/")
+        token = node_parts[1] if len(node_parts) > 1 and node_parts[1] else default_token
+        try:
+            weight = float(node_parts[2]) if len(node_parts) > 2 and node_parts[2] else 1.0
+        except ValueError:
+            raise ValueError(f"PTSB node '{address}' has invalid weight '{node_parts[2]}'") from None
+
+        if not address:
+            raise ValueError(f"PTSB node '{raw_node.strip()}' has no address")
+        if weight <= 0:
+            raise ValueError(f"PTSB node '{address}' must have positive weight")
+        if address in addresses:
+            raise ValueError(f"PTSB node '{address}' is listed twice")
+
+        addresses.add(address)
+        nodes.append(SandboxNode(address, token, weight))
+
+    return nodes
+
+
+# набор узлов песочницы
+class SandboxNodePool:
+    """
+    Все узлы PTSB, между которыми распределяются задания. Новое задание уходит на наименее загруженный
+    из доступных узлов, а результаты по нему запрашиваются у того узла, на котором оно создано.
+    Первый узел считается основным: к нему относятся задания, узел которых не известен, например созданные
+    до появления нескольких узлов.
+    """
+
+    def __init__(self, nodes: list[SandboxNode]) -> None:
+        if not nodes:
+            raise ValueError("At least one PTSB node is required")
+        self.nodes = nodes
+        self._nodes_by_address = {node.address: node for node in nodes}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __iter__(self) -> Iterator[SandboxNode]:
+        return iter(self.nodes)
+
+    # основной узел
+    @property
+    def default(self) -> SandboxNode:
+        return self.nodes[0]
+
+    # узел, на котором создано задание
+    def get(self, address: Optional[str]) -> SandboxNode:
+        """
+        Возвращает узел по адресу, сохраненному вместе с заданием
+
+        Принимает:
+            - `address` (str): адрес узла или `None`, если он не сохранен
+
+        Возвращает:
+            - `SandboxNode` (object of custom class): узел с этим адресом, а если его нет в списке узлов - основной узел
+        """
+
+        if address is None:
+            return self.default
+
+        node = self._nodes_by_address.get(address)
+        if node is None:
+            logger.warning(f"PTSB node {address} is not configured anymore, using {self.default.address} instead")
+            return self.default
+        return node
+
+    # выбор узла для нового задания
+    def pick(self, exclude: Iterable[str] = ()) -> SandboxNode:
+        """
+        Выбирает узел для нового задания: среди доступных узлов - с наименьшей оценкой загрузки (`SandboxNode.load_score`),
+        при равной оценке - случайный. Восстанавливающийся узел выбирается, только если доступных нет,
+        а если недоступны все узлы - тот, который восстановится раньше остальных, и запрос к нему завершится ошибкой выключателя.
+
+        Принимает:
+            - `exclude` (Iterable[str]): адреса узлов, которые уже не справились с этим запросом; если кроме них узлов нет, они тоже участвуют в выборе
+
+        Возвращает:
+            - `SandboxNode` (object of custom class): выбранный узел
+        """
+
+        excluded_addresses = set(exclude)
+        candidates = [node for node in self.nodes if node.address not in excluded_addresses] or self.nodes
+
+        for circuit_state in (CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN):
+            available_nodes = [node for node in candidates if node.circuit.state == circuit_state]
+            if not available_nodes:
+                continue
+
+            load_scores = {node.address: node.load_score() for node in available_nodes}
+            best_score = min(load_scores.values())
+            return random.choice([node for node in available_nodes if load_scores[node.address] == best_score])
+
+        return min(candidates, key=lambda node: node.circuit.retry_after())
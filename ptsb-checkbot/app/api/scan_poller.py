@@ -0,0 +1,301 @@
+# встроенные библиотеки
+import asyncio
+import heapq
+import logging
+import os
+import time
+
+# встроенные классы
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+# самописные
+from app.api import ptsb_client
+from app.api.ptsb_client import GetScanResust
+from app.api.circuit_breaker import CIRCUIT_CLOSED, CIRCUIT_OPEN
+
+
+### параметры расписания опроса результатов проверки
+SCAN_POLL_INITIAL_DELAY = float(os.getenv('SCAN_POLL_INITIAL_DELAY') or 5)      # через сколько секунд после создания задания делать первый запрос
+SCAN_POLL_MAX_INTERVAL = float(os.getenv('SCAN_POLL_MAX_INTERVAL') or 60)       # максимальный интервал между запросами по одному заданию (секунд)
+SCAN_POLL_BACKOFF_FACTOR = float(os.getenv('SCAN_POLL_BACKOFF_FACTOR') or 1.5)  # во сколько раз увеличивается интервал, пока результата нет
+SCAN_POLL_MAX_WAIT = float(os.getenv('SCAN_POLL_MAX_WAIT') or 3 * 60 * 60)      # сколько секунд ждать результатов, прежде чем сдаться (PTSB хранит задания 3 часа)
+SCAN_POLL_MAX_ERRORS = int(os.getenv('SCAN_POLL_MAX_ERRORS') or 5)              # сколько ошибок API подряд допускается по одному заданию
+SCAN_POLL_MAX_CONCURRENT = int(os.getenv('SCAN_POLL_MAX_CONCURRENT') or 10)     # сколько запросов getStatus выполнять одновременно
+
+### параметры быстрой проверки небольших файлов и ссылок
+SYNC_SCAN_MAX_FILE_SIZE = int(os.getenv('SYNC_SCAN_MAX_FILE_SIZE') or 1024 * 1024)  # файлы до какого размера считаются небольшими (байт), ссылки - всегда
+SYNC_SCAN_MAX_WAIT = float(os.getenv('SYNC_SCAN_MAX_WAIT') or 10)                   # сколько секунд ждать вердикт по небольшому объекту до сообщения о созданном задании, 0 - не ждать
+SYNC_SCAN_POLL_INTERVAL = float(os.getenv('SYNC_SCAN_POLL_INTERVAL') or 1)          # через сколько секунд после создания задания делать первый запрос по небольшому объекту
+
+logger = logging.getLogger("ptsb_checkbot")
+
+
+# кастомный класс для отслеживаемого задания на проверку
+@dataclass
+class PendingScan:
+    """
+    Класс, описывающий задание на проверку, результаты которого ожидает пользователь
+    """
+    scan_id: str
+    tg_user_id: int
+    chat_id: int
+    user_role: str
+    can_get_links: bool
+    created_at: float = field(default_factory=time.time)
+    next_poll_at: float = 0.0
+    poll_interval: float = SCAN_POLL_INITIAL_DELAY
+    errors_in_row: int = 0
+    sha256: Optional[str] = None
+    url: Optional[str] = None
+    ptsb_node: Optional[str] = None
+
+
+# функция проверки, что объект небольшой и вердикт по нему стоит подождать сразу
+def is_sync_scan(scan_type: str, file_size: Optional[int], file_path: Optional[str] = None) -> bool:
+    """
+    Определяет, проверяется ли объект в гибридном режиме: небольшие файлы и ссылки PTSB обычно проверяет за несколько секунд,
+    поэтому их результаты опрашиваются с `SYNC_SCAN_POLL_INTERVAL`, а не с `SCAN_POLL_INITIAL_DELAY`,
+    и вердикт ждется сразу в течение `SYNC_SCAN_MAX_WAIT` секунд.
+
+    Принимает:
+        - `scan_type` (str): тип задания, `file` или `url`
+        - `file_size` (int): размер файла в байтах, `None` - не известен
+        - `file_path` (str): путь к скачанному файлу, по которому берется размер, если он не известен
+
+    Возвращает:
+        - `bool`: проверять ли объект в гибридном режиме
+    """
+
+    if SYNC_SCAN_MAX_WAIT <= 0:
+        return False
+    if scan_type == "url":
+        return True
+    if file_size is None and file_path:
+        try:
+            file_size = os.path.getsize(file_path)
+        except OSError:
+            return False
+    return file_size is not None and file_size <= SYNC_SCAN_MAX_FILE_SIZE
+
+
+# колбэки, которые вызываются при получении результатов или при отказе от ожидания
+OnScanReady = Callable[[PendingScan, GetScanResust], Awaitable[None]]
+OnScanFailed = Callable[[PendingScan, str], Awaitable[None]]
+
+
+# фоновый опрос результатов проверки заданий
+class ScanResultsPoller:
+    """
+    Фоновый механизм, который отслеживает все созданные задания по их `scan_id`, опрашивает `getStatus`
+    с увеличивающимся интервалом и передает готовый вердикт в колбэк, вместо того чтобы пользователь
+    сам нажимал кнопку обновления статуса.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, PendingScan] = {}
+        self._schedule: list[tuple[float, str]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._poll_tasks: set[asyncio.Task] = set()
+        self._on_ready: Optional[OnScanReady] = None
+        self._on_failed: Optional[OnScanFailed] = None
+        self._waiters: dict[str, list[asyncio.Future]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    # постановка задания на отслеживание
+    def track(self, pending_scan: PendingScan) -> None:
+        """
+        Добавляет задание в список отслеживаемых. Первый запрос статуса будет выполнен через `SCAN_POLL_INITIAL_DELAY` секунд.
+
+        Принимает:
+            - `pending_scan` (PendingScan): задание, результаты которого нужно получить
+        """
+
+        if pending_scan.scan_id in self._pending:
+            return
+
+        if not pending_scan.next_poll_at:
+            pending_scan.next_poll_at = time.time() + pending_scan.poll_interval
+
+        self._pending[pending_scan.scan_id] = pending_scan
+        self._reschedule(pending_scan)
+
+    # проверка, что результатов задания еще ждут
+    def is_tracked(self, scan_id: str) -> bool:
+        return scan_id in self._pending
+
+    # отслеживаемое задание по его ID
+    def get(self, scan_id: str) -> Optional[PendingScan]:
+        return self._pending.get(scan_id)
+
+    # ожидание результатов задания
+    async def wait(self, scan_id: str, timeout: float) -> bool:
+        """
+        Ждет, пока опрос не закончит отслеживать задание: результаты получены и переданы в колбэк или получить их не удалось.
+        Само ожидание ничего не запрашивает, запросы по заданию идут по его обычному расписанию.
+
+        Принимает:
+            - `scan_id` (str): ID задания
+            - `timeout` (float): сколько секунд ждать
+
+        Возвращает:
+            - `True`, если колбэк по заданию уже выполнен
+            - `False`, если за `timeout` секунд результатов не было
+        """
+
+        if scan_id not in self._pending:
+            return True
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(scan_id, []).append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(scan_id)
+            if waiters is not None and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[scan_id]
+
+    # оповещение ожидающих, что задание больше не отслеживается
+    def _wake_waiters(self, scan_id: str) -> None:
+        for waiter in self._waiters.pop(scan_id, []):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    # запуск фонового опроса
+    def start(self, on_ready: OnScanReady, on_failed: OnScanFailed) -> None:
+        """
+        Запускает фоновую задачу опроса результатов.
+
+        Принимает:
+            - `on_ready` (OnScanReady): вызывается, когда по заданию получен вердикт
+            - `on_failed` (OnScanFailed): вызывается, когда результаты получить не удалось
+        """
+
+        self._on_ready = on_ready
+        self._on_failed = on_failed
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="scan_results_poller")
+
+    # остановка фонового опроса
+    async def stop(self) -> None:
+        """
+        Останавливает фоновую задачу опроса результатов.
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        poll_tasks = list(self._poll_tasks)
+        for poll_task in poll_tasks:
+            poll_task.cancel()
+        await asyncio.gather(*poll_tasks, return_exceptions=True)
+
+    # планирование следующего запроса по заданию
+    def _reschedule(self, pending_scan: PendingScan) -> None:
+        heapq.heappush(self._schedule, (pending_scan.next_poll_at, pending_scan.scan_id))
+        # основной цикл мог уснуть до более позднего запроса, пока это задание опрашивалось
+        self._wakeup.set()
+
+    # основной цикл опроса
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(SCAN_POLL_MAX_CONCURRENT)
+
+        while True:
+            # ждем, пока не наступит время ближайшего запроса или пока не добавят новое задание
+            self._wakeup.clear()
+            timeout = None
+            if self._schedule:
+                timeout = max(self._schedule[0][0] - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                continue
+            except asyncio.TimeoutError:
+                pass
+
+            # забираем все задания, время опроса которых наступило
+            now = time.time()
+            due_scans: list[PendingScan] = []
+            while self._schedule and self._schedule[0][0] <= now:
+                _, scan_id = heapq.heappop(self._schedule)
+                pending_scan = self._pending.get(scan_id)
+                if pending_scan is not None:
+                    due_scans.append(pending_scan)
+
+            # каждое задание опрашивается отдельной задачей, чтобы медленный узел не задерживал опрос остальных заданий,
+            # а цикл сразу возвращался к расписанию
+            for pending_scan in due_scans:
+                poll_task = asyncio.create_task(self._poll_one(pending_scan, semaphore), name=f"scan_poll_{pending_scan.scan_id}")
+                self._poll_tasks.add(poll_task)
+                poll_task.add_done_callback(self._poll_tasks.discard)
+
+    # опрос одного задания
+    async def _poll_one(self, pending_scan: PendingScan, semaphore: asyncio.Semaphore) -> None:
+        # узел песочницы, на котором создано задание, недоступен - не отправляем запрос, а ждем, пока его снова можно будет опросить
+        ptsb_circuit = ptsb_client.ptsb_nodes.get(pending_scan.ptsb_node).circuit
+        if ptsb_circuit.state == CIRCUIT_OPEN:
+            pending_scan.next_poll_at = time.time() + max(ptsb_circuit.retry_after(), 1)
+            self._reschedule(pending_scan)
+            return
+
+        async with semaphore:
+            scan_results: GetScanResust = await ptsb_client.get_scan_results(scan_id=pending_scan.scan_id, ptsb_node=pending_scan.ptsb_node)
+
+        try:
+            # вердикт готов - отдаем его и больше задание не отслеживаем
+            if scan_results.is_ok and scan_results.is_scan_ready:
+                self._pending.pop(pending_scan.scan_id, None)
+                try:
+                    await self._on_ready(pending_scan, scan_results)
+                finally:
+                    self._wake_waiters(pending_scan.scan_id)
+                return
+
+            # ошибки API считаем подряд, чтобы не бросать задание из-за одного сбоя сети
+            # пока узел песочницы недоступен целиком, ошибки не считаем: задание ждет его восстановления
+            if not scan_results.is_ok and ptsb_circuit.state != CIRCUIT_CLOSED:
+                logger.info(f"Polling scan_id={pending_scan.scan_id} postponed, PTSB is unavailable")
+            elif not scan_results.is_ok:
+                pending_scan.errors_in_row += 1
+                logger.warning(f"Polling scan_id={pending_scan.scan_id} failed ({pending_scan.errors_in_row}/{SCAN_POLL_MAX_ERRORS}). Error: {scan_results.error_message}")
+                if pending_scan.errors_in_row >= SCAN_POLL_MAX_ERRORS:
+                    self._pending.pop(pending_scan.scan_id, None)
+                    try:
+                        await self._on_failed(pending_scan, scan_results.error_message)
+                    finally:
+                        self._wake_waiters(pending_scan.scan_id)
+                    return
+            else:
+                pending_scan.errors_in_row = 0
+
+            # результатов нет слишком долго
+            if time.time() - pending_scan.created_at >= SCAN_POLL_MAX_WAIT:
+                self._pending.pop(pending_scan.scan_id, None)
+                try:
+                    await self._on_failed(pending_scan, "Превышено время ожидания результатов проверки.")
+                finally:
+                    self._wake_waiters(pending_scan.scan_id)
+                return
+
+        except Exception:
+            logger.error(f"Unexpected error while handling results for scan_id={pending_scan.scan_id}", exc_info=True)
+            self._pending.pop(pending_scan.scan_id, None)
+            self._wake_waiters(pending_scan.scan_id)
+            return
+
+        # результата пока нет - увеличиваем интервал и планируем следующий запрос
+        pending_scan.poll_interval = min(pending_scan.poll_interval * SCAN_POLL_BACKOFF_FACTOR, SCAN_POLL_MAX_INTERVAL)
+        pending_scan.next_poll_at = time.time() + pending_scan.poll_interval
+        self._reschedule(pending_scan)
@@ -0,0 +1,209 @@
+# встроенные библиотеки
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+# встроенные классы
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+
+### параметры очереди отправки заданий
+SUBMISSION_MAX_CONCURRENT = int(os.getenv('SUBMISSION_MAX_CONCURRENT') or 3)                    # сколько заданий одновременно загружать в песочницу
+SUBMISSION_QUEUE_UPDATE_INTERVAL = float(os.getenv('SUBMISSION_QUEUE_UPDATE_INTERVAL') or 3)    # не чаще скольких секунд сообщать пользователю его место в очереди
+
+logger = logging.getLogger("ptsb_checkbot")
+
+
+# колбэк, который получает место задания в очереди (начиная с 1)
+OnQueuePosition = Callable[[int], Awaitable[None]]
+
+
+# кастомный класс для задания в очереди
+@dataclass
+class _QueuedSubmission:
+    """
+    Класс, описывающий задание, которое ждет своей очереди на загрузку в песочницу
+    """
+    tg_user_id: int
+    check_priority: int
+    start_tag: float
+    finish_tag: float
+    seq: int
+    granted: asyncio.Event = field(default_factory=asyncio.Event)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+
+    # порядок выдачи: меньшая виртуальная метка окончания, при равенстве - больший приоритет, затем порядок поступления
+    def sort_key(self) -> tuple[float, int, int]:
+        return (self.finish_tag, -self.check_priority, self.seq)
+
+
+# очередь отправки заданий в песочницу
+class SubmissionQueue:
+    """
+    Планировщик между хэндлерами и `ptsb_client`: одновременно в песочницу загружается не больше
+    `SUBMISSION_MAX_CONCURRENT` заданий, остальные ждут в очереди.
+
+    Очередь справедливая (weighted fair queuing): каждое задание получает виртуальную метку окончания,
+    которая растет с числом заданий пользователя в очереди и шагом `1 / check_priority`. Поэтому пачка заданий
+    одного пользователя не задерживает остальных, а задания с большим приоритетом проходят раньше,
+    но не отнимают у пользователей с низким приоритетом возможность отправить задание совсем.
+    """
+
+    def __init__(self, max_concurrent: int = SUBMISSION_MAX_CONCURRENT) -> None:
+        self._max_concurrent = max(max_concurrent, 1)
+        self._active = 0
+        self._waiting: list[tuple[tuple[float, int, int], _QueuedSubmission]] = []
+        self._virtual_time = 0.0
+        self._last_finish: dict[int, float] = {}
+        self._queued_per_user: dict[int, int] = {}
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    # постановка задания в очередь
+    def _enqueue(self, tg_user_id: int, check_priority: int) -> _QueuedSubmission:
+        weight = max(check_priority or 1, 1)
+        start_tag = max(self._virtual_time, self._last_finish.get(tg_user_id, 0.0))
+        entry = _QueuedSubmission(
+            tg_user_id=tg_user_id,
+            check_priority=weight,
+            start_tag=start_tag,
+            finish_tag=start_tag + 1 / weight,
+            seq=next(self._seq)
+        )
+        self._last_finish[tg_user_id] = entry.finish_tag
+        self._queued_per_user[tg_user_id] = self._queued_per_user.get(tg_user_id, 0) + 1
+        heapq.heappush(self._waiting, (entry.sort_key(), entry))
+        return entry
+
+    # учет того, что задание пользователя покинуло очередь
+    def _forget(self, entry: _QueuedSubmission) -> None:
+        left = self._queued_per_user.get(entry.tg_user_id, 1) - 1
+        if left > 0:
+            self._queued_per_user[entry.tg_user_id] = left
+            return
+
+        self._queued_per_user.pop(entry.tg_user_id, None)
+        # пользователь без заданий в очереди начнет с текущего виртуального времени, его метку хранить незачем
+        if self._last_finish.get(entry.tg_user_id, 0.0) <= self._virtual_time:
+            self._last_finish.pop(entry.tg_user_id, None)
+
+    # выдача свободных мест заданиям из очереди
+    def _dispatch(self) -> None:
+        dispatched = False
+        while self._active < self._max_concurrent and self._waiting:
+            _, entry = heapq.heappop(self._waiting)
+            self._virtual_time = max(self._virtual_time, entry.start_tag)
+            self._active += 1
+            self._forget(entry)
+            entry.granted.set()
+            entry.wakeup.set()
+            dispatched = True
+
+        # очередь опустела - накопленные метки пользователей больше ни на что не влияют
+        if not self._waiting:
+            self._last_finish.clear()
+
+        # места в очереди сдвинулись - будим ожидающих, чтобы они обновили свою позицию
+        if dispatched:
+            for _, waiting_entry in self._waiting:
+                waiting_entry.wakeup.set()
+
+    # место задания в очереди
+    def _position(self, entry: _QueuedSubmission) -> int:
+        entry_key = entry.sort_key()
+        return 1 + sum(1 for key, _ in self._waiting if key < entry_key)
+
+    # ожидание своей очереди
+    async def _wait_turn(self, entry: _QueuedSubmission, on_position: Optional[OnQueuePosition]) -> None:
+        last_position: Optional[int] = None
+        last_reported_at = 0.0
+
+        while True:
+            entry.wakeup.clear()
+            if entry.granted.is_set():
+                return
+
+            position = self._position(entry)
+            if on_position is not None and position != last_position:
+                last_position = position
+                last_reported_at = time.monotonic()
+                try:
+                    await on_position(position)
+                except Exception:
+                    logger.warning(f"Failed to report queue position to user {entry.tg_user_id}", exc_info=True)
+
+            await entry.wakeup.wait()
+
+            # позицию сообщаем не чаще раза в интервал, но свою очередь замечаем сразу
+            delay = last_reported_at + SUBMISSION_QUEUE_UPDATE_INTERVAL - time.monotonic()
+            if delay > 0 and not entry.granted.is_set():
+                try:
+                    await asyncio.wait_for(entry.granted.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    # получение места для загрузки
+    async def acquire(self, tg_user_id: int, check_priority: int, on_position: Optional[OnQueuePosition] = None) -> None:
+        """
+        Ждет, пока для задания освободится место для загрузки в песочницу. Если место есть сразу, возвращается без ожидания.
+
+        Принимает:
+            - `tg_user_id` (int): TG ID пользователя, отправляющего задание
+            - `check_priority` (int): приоритет проверки пользователя
+            - `on_position` (OnQueuePosition): вызывается с местом задания в очереди, пока оно ждет
+        """
+
+        entry = self._enqueue(tg_user_id, check_priority)
+        self._dispatch()
+        if entry.granted.is_set():
+            return
+
+        try:
+            await self._wait_turn(entry, on_position)
+        except BaseException:
+            # ожидание прервали - убираем задание из очереди или возвращаем уже выданное место
+            if entry.granted.is_set():
+                self.release()
+            else:
+                self._waiting = [(key, queued) for key, queued in self._waiting if queued is not entry]
+                heapq.heapify(self._waiting)
+                self._forget(entry)
+            raise
+
+    # освобождение места для загрузки
+    def release(self) -> None:
+        """
+        Освобождает место для загрузки и отдает его следующему заданию в очереди
+        """
+
+        self._active = max(self._active - 1, 0)
+        self._dispatch()
+
+    # место для загрузки на время блока with
+    @asynccontextmanager
+    async def slot(self, tg_user_id: int, check_priority: int, on_position: Optional[OnQueuePosition] = None) -> AsyncIterator[None]:
+        """
+        Занимает место для загрузки на время блока `async with` и освобождает его после
+
+        Принимает:
+            - `tg_user_id` (int): TG ID пользователя, отправляющего задание
+            - `check_priority` (int): приоритет проверки пользователя
+            - `on_position` (OnQueuePosition): вызывается с местом задания в очереди, пока оно ждет
+        """
+
+        await self.acquire(tg_user_id, check_priority, on_position)
+        try:
+            yield
+        finally:
+            self.release()
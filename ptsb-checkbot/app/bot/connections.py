@@ -7,6 +7,7 @@ import os
 ## устанавливаемые
 # для настройки работы прокси
 from aiogram.client.session.aiohttp import AiohttpSession   # сессия через проксю
+from aiogram.client.telegram import TelegramAPIServer       # адрес собственного Bot API сервера
 from aiohttp import BasicAuth                               # авторизация на проксе
 
 
@@ -17,6 +18,10 @@ PROXY_PORT = str(os.getenv('PROXY_PORT')) if os.getenv('PROXY_PORT') else None
 PROXY_USER = str(os.getenv('PROXY_USER')) if os.getenv('PROXY_USER') else None  # пользователь подключения
 PROXY_PASS = str(os.getenv('PROXY_PASS')) if os.getenv('PROXY_PASS') else None  # пароль для авторизации
 
+# использование локального Bot API сервера, который позволяет скачивать файлы больше 20 МБ
+TG_API_SERVER = str(os.getenv('TG_API_SERVER')) if os.getenv('TG_API_SERVER') else None   # адрес сервера, например http://telegram-bot-api:8081
+TG_API_LOCAL_MODE = bool(int(os.getenv('TG_API_LOCAL_MODE') or 0))                       # сервер запущен с --local и отдает файлы по пути на общем диске
+
 
 # создание сессии с серверами ТГ #TODO поддержка доп протоколов
 def create_session_to_tg() -> AiohttpSession:
@@ -41,4 +46,8 @@ def create_session_to_tg() -> AiohttpSession:
         else:
             session_kwargs['proxy'] = proxy_url
 
+    # подключение к собственному Bot API серверу вместо api.telegram.org
+    if TG_API_SERVER:
+        session_kwargs['api'] = TelegramAPIServer.from_base(TG_API_SERVER, is_local=TG_API_LOCAL_MODE)
+
     return AiohttpSession(**session_kwargs)
\ No newline at end of file
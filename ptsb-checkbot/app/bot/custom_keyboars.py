@@ -27,6 +27,7 @@ BTN_MANAGE_APP_RETURN = "🔙 Вернуться в главное меню"
 
 # меню админа для взаимодействия с песочницей
 BTN_SANDBOX_MENU_CHECK_API = "✅ Проверить состояние API"
+BTN_SANDBOX_MENU_RESET_VERDICT = "♻️ Сбросить сохраненный вердикт"
 BTN_SANDBOX_MENU_RETURN = "🔙 Вернуться в главное меню"
 
 # отправка файлов на проверку
@@ -36,7 +37,7 @@ BTN_SANDBOX_MENU_SEND_URL = "🔗 Отправить ссылку на пров
 # общее взаимодействие с песочницей
 BTN_SANDBOX_MENU_GET_STATS = "📊 Получить сведения о проверках"
 BTN_SANDBOX_MENU_SEND_TO_SCAN = "⏫ Отправить на проверку"
-BTN_SANDBOX_MENU_SCAN_RESULT = "🔄 Обновить статус задания"
+BTN_SANDBOX_MENU_SEND_TO_SCAN_NO_CACHE = "🔁 Проверить заново, не используя сохраненный вердикт"
 
 # клавиатура "проверить свое состояние"
 check_status_keyboard = ReplyKeyboardMarkup(
@@ -89,6 +90,7 @@ admin_manage_app_keyboard = ReplyKeyboardMarkup(
 admin_main_sandbox_keyboard = ReplyKeyboardMarkup(
     keyboard= [
         [KeyboardButton(text=BTN_SANDBOX_MENU_CHECK_API)],
+        [KeyboardButton(text=BTN_SANDBOX_MENU_RESET_VERDICT)],
         [KeyboardButton(text=BTN_SANDBOX_MENU_SEND_FILE)],
         [KeyboardButton(text=BTN_SANDBOX_MENU_SEND_URL)],
         [KeyboardButton(text=BTN_SANDBOX_MENU_GET_STATS)],
@@ -115,10 +117,11 @@ send_to_scan_keyboard = ReplyKeyboardMarkup(
     resize_keyboard=True
 )
 
-# клавиатура "получить результаты проверки" задания
-get_scan_results_keyboard = ReplyKeyboardMarkup(
+# клавиатура "отправить на проверку" для админа, который может проверить ссылку заново в обход сохраненного вердикта
+admin_send_to_scan_keyboard = ReplyKeyboardMarkup(
     keyboard=[
-        [KeyboardButton(text=BTN_SANDBOX_MENU_SCAN_RESULT)]
+        [KeyboardButton(text=BTN_SANDBOX_MENU_SEND_TO_SCAN)],
+        [KeyboardButton(text=BTN_SANDBOX_MENU_SEND_TO_SCAN_NO_CACHE)]
     ],
     resize_keyboard=True
-)
\ No newline at end of file
+)
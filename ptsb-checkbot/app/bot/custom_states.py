@@ -31,6 +31,8 @@ class SandboxProfileCreation(StatesGroup):
     CREATE_max_checks = State()         # Состояние при создании пользователя, ввод максимально доступного кол-ва проверок в день
     CREATE_check_priority = State()     # Состояние при создании пользователя, ввод приоритета проверки заданий от пользователя
     CREATE_can_get_links = State()      # Состояние при создании пользователя, ввод возможности получать ссылки пользователем на проверку
+    CREATE_timezone = State()           # Состояние при создании пользователя, ввод часового пояса, по которому считаются сутки для проверок
+    CREATE_rate_limits = State()        # Состояние при создании пользователя, ввод ограничений частоты отправки заданий (всплеск/час/сутки)
 
 # возможные состояния всех пользователей (доступны и админу и пользователю)
 class UserStates(StatesGroup):
@@ -45,10 +47,10 @@ class SandboxInteractionStates(UserStates):
     Класс действий взаимодействия с профилем песочницы
     """
     check_api_health = State()              # ADMIN состояние, когда админ нажимает "проверить API"
+    input_verdict_to_reset = State()        # ADMIN состояние, ввод SHA-256 файла, вердикт по которому нужно сбросить
     sandbox_admin_menu = State()            # ADMIN состояние, когда админ находится в мейн меню sandbox взаимодействия
     sandbox_user_menu = State()             # USER состояние, когда юзер находится в мейн меню sandbox взаимодействия
     input_url_to_scan = State()             # USER состояние, ввод ссылки на проверку
     upload_file_to_scan = State()           # USER состояние, загрузка файла на проверку
     send_req_for_scan = State()             # USER состояние, отправика задания на проверку со всеми данными
-    get_scan_results = State()              # USER состояние, попытка узнать результаты проверки
     
\ No newline at end of file
@@ -15,6 +15,7 @@ class InputSandboxProfileParameters:
     max_available_checks = "max_available_checks"
     check_priority = "check_priority"
     can_get_links = "can_get_links"
+    timezone = "timezone"
 
 # параметры пользователей при взаимодействии с функционалом песочницы
 class SandboxInteractionsParameters:
@@ -25,8 +26,14 @@ class SandboxInteractionsParameters:
     scan_priority = "scan_priority"
     url_to_scan = "url_to_scan"
     file_to_scan = "file_to_scan"
+    file_sha256 = "file_sha256"
+    file_unique_id = "file_unique_id"
+    tg_file_path = "tg_file_path"
+    file_name = "file_name"
+    file_size = "file_size"
     scan_type = "scan_type"
     list_of_pwds = "list_of_pwds"
-    scan_id = "scan_id"
     can_get_links = "can_get_links"
-    file_uploaded = "file_uploaded"
\ No newline at end of file
+    file_uploaded = "file_uploaded"
+    batch_files = "batch_files"
+    urls_to_scan = "urls_to_scan"
\ No newline at end of file
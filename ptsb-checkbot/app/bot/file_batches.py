@@ -0,0 +1,66 @@
+### либы
+## встроенные
+import asyncio
+import os
+
+## встроенные классы
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+### классы
+## устанавливаемые
+from aiogram.types import Message                           # сообщения пользователя с документами
+
+
+### константы
+BATCH_COLLECT_DELAY = float(os.getenv('BATCH_COLLECT_DELAY') or 1.5)     # сколько секунд ждать следующий файл, прежде чем считать пачку собранной
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES') or 10)                # сколько файлов можно отправить на проверку одной пачкой
+BATCH_DOWNLOAD_CONCURRENCY = int(os.getenv('BATCH_DOWNLOAD_CONCURRENCY') or 3)   # сколько файлов пачки скачивать из ТГ одновременно
+
+
+# пачка файлов, которую пользователь еще досылает
+@dataclass
+class _CollectingBatch:
+    messages: list[Message] = field(default_factory=list)
+    version: int = 0
+
+
+# сборщик пачек файлов
+class FileBatchCollector:
+    """
+    Собирает документы, которые пользователь прислал альбомом или несколькими сообщениями подряд, в одну пачку.
+    ТГ присылает каждый файл альбома отдельным сообщением, поэтому пачка считается собранной,
+    когда от пользователя `BATCH_COLLECT_DELAY` секунд не было новых файлов.
+    """
+
+    def __init__(self, collect_delay: float = BATCH_COLLECT_DELAY) -> None:
+        self._collect_delay = collect_delay
+        self._batches: dict[int, _CollectingBatch] = {}
+
+    # добавление файла в пачку
+    async def collect(self, tg_user_id: int, message: Message) -> Optional[list[Message]]:
+        """
+        Добавляет сообщение с документом в пачку пользователя и ждет, пока пользователь не перестанет присылать файлы
+
+        Принимает:
+            - `tg_user_id` (int): TG ID пользователя
+            - `message` (Message): сообщение с документом
+
+        Возвращает:
+            - `list[Message]`: все сообщения пачки в порядке отправки, если это сообщение было последним в пачке
+            - `None`, если после него пришли еще файлы и пачку вернет вызов для последнего из них
+        """
+
+        batch = self._batches.setdefault(tg_user_id, _CollectingBatch())
+        batch.messages.append(message)
+        batch.version += 1
+        version = batch.version
+
+        await asyncio.sleep(self._collect_delay)
+
+        if self._batches.get(tg_user_id) is not batch or batch.version != version:
+            return None
+
+        del self._batches[tg_user_id]
+        return sorted(batch.messages, key=lambda batch_message: batch_message.message_id)
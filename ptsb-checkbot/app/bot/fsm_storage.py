@@ -0,0 +1,223 @@
+### либы
+## встроенные
+import asyncio
+import json
+import logging
+import os
+import time
+
+## встроенные классы
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Optional
+
+
+### классы
+## устанавливаемые
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+## самописные
+from app.db import database
+
+
+### константы
+# название таблицы для этого модуля
+TABLE_NAME = "fsm_states"
+
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL') or 1)              # как часто сбрасывать накопленные изменения состояний в БД (секунд)
+FSM_CACHE_MAX_SIZE = int(os.getenv('FSM_CACHE_MAX_SIZE') or 1000)             # сколько состояний держать в памяти, самые давно не использованные вытесняются
+FSM_STATE_TTL = float(os.getenv('FSM_STATE_TTL') or 30 * 24 * 60 * 60)        # через сколько секунд простоя состояние пользователя удаляется, 0 - хранить бессрочно
+FSM_CLEANUP_INTERVAL = float(os.getenv('FSM_CLEANUP_INTERVAL') or 60 * 60)    # как часто удалять из БД устаревшие состояния (секунд)
+
+logger = logging.getLogger("ptsb_checkbot")
+
+
+# состояние одного пользователя
+@dataclass
+class _FsmRecord:
+    state: Optional[str] = None
+    data: dict[str, Any] = field(default_factory=dict)
+    updated_at: float = field(default_factory=time.time)
+
+
+# хранилище состояний FSM в SQLite
+class SqliteStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в БД приложения, которое переживает перезапуск бота.
+
+    Последние использованные состояния лежат в памяти (не больше `FSM_CACHE_MAX_SIZE`), поэтому чтение обычно не трогает БД.
+    Изменения копятся и раз в `FSM_FLUSH_INTERVAL` секунд записываются в БД одной транзакцией.
+    Состояния, к которым не обращались дольше `FSM_STATE_TTL` секунд, удаляются.
+    """
+
+    def __init__(self, key_builder: Optional[KeyBuilder] = None) -> None:
+        self._key_builder = key_builder or DefaultKeyBuilder()
+        self._cache: OrderedDict[str, _FsmRecord] = OrderedDict()
+        self._dirty: dict[str, _FsmRecord] = {}
+        self._flushing: dict[str, _FsmRecord] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_cleanup_at: float = 0.0
+
+    # функция инициализации таблицы с состояниями
+    async def create_table_if_not_exists(self) -> None:
+        """
+        Создает таблицу `fsm_states` если ее еще не существует в БД приложения
+        """
+
+        async with database.connect() as db:
+            await db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+                    storage_key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT,
+                    updated_at REAL
+                )
+            """)
+            await db.commit()
+
+    # получение состояния из памяти или из БД
+    async def _get_record(self, key: StorageKey) -> _FsmRecord:
+        storage_key = self._key_builder.build(key)
+        now = time.time()
+
+        record = self._cache.get(storage_key)
+        if record is None:
+            # состояние могло быть вытеснено из памяти, но еще не записано в БД
+            record = self._dirty.get(storage_key) or self._flushing.get(storage_key)
+        if record is None:
+            record = await self._load_record(storage_key)
+
+        if FSM_STATE_TTL and now - record.updated_at > FSM_STATE_TTL:
+            record = _FsmRecord()
+
+        self._cache[storage_key] = record
+        self._cache.move_to_end(storage_key)
+        while len(self._cache) > FSM_CACHE_MAX_SIZE:
+            self._cache.popitem(last=False)
+
+        return record
+
+    async def _load_record(self, storage_key: str) -> _FsmRecord:
+        async with database.connect() as db:
+            cursor = await db.execute(
+                f'SELECT state, data, updated_at FROM {TABLE_NAME} WHERE storage_key = ?',
+                (storage_key,)
+            )
+            data = await cursor.fetchone()
+
+        if data is None:
+            return _FsmRecord()
+
+        return _FsmRecord(state=data[0], data=json.loads(data[1]) if data[1] else {}, updated_at=data[2])
+
+    # пометка состояния к записи в БД
+    def _mark_dirty(self, key: StorageKey, record: _FsmRecord) -> None:
+        record.updated_at = time.time()
+        self._dirty[self._key_builder.build(key)] = record
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop(), name="fsm_storage_flusher")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._get_record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+
+        record = await self._get_record(key)
+        record.data = data.copy()
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = await self._get_record(key)
+        return record.data.copy()
+
+    # фоновая запись накопленных изменений
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(FSM_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.error("Failed to flush FSM states to db, will retry", exc_info=True)
+
+    # запись накопленных изменений в БД
+    async def flush(self) -> None:
+        """
+        Записывает в БД все накопленные изменения состояний одной транзакцией и удаляет устаревшие состояния.
+        """
+
+        async with self._flush_lock:
+            now = time.time()
+            need_cleanup = FSM_STATE_TTL and now - self._last_cleanup_at >= FSM_CLEANUP_INTERVAL
+            if not self._dirty and not need_cleanup:
+                return
+
+            self._flushing, self._dirty = self._dirty, {}
+
+            # пустые состояния в БД не храним
+            rows_to_save = [
+                (storage_key, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at)
+                for storage_key, record in self._flushing.items()
+                if record.state is not None or record.data
+            ]
+            keys_to_delete = [
+                (storage_key,)
+                for storage_key, record in self._flushing.items()
+                if record.state is None and not record.data
+            ]
+
+            try:
+                async with database.connect() as db:
+                    await db.executemany(
+                        f'INSERT OR REPLACE INTO {TABLE_NAME} (storage_key, state, data, updated_at) VALUES (?, ?, ?, ?)',
+                        rows_to_save
+                    )
+                    await db.executemany(f'DELETE FROM {TABLE_NAME} WHERE storage_key = ?', keys_to_delete)
+                    if need_cleanup:
+                        await db.execute(f'DELETE FROM {TABLE_NAME} WHERE updated_at < ?', (now - FSM_STATE_TTL,))
+                        self._last_cleanup_at = now
+                    await db.commit()
+            except Exception:
+                # не записанное вернем в очередь, если его не успели изменить заново
+                for storage_key, record in self._flushing.items():
+                    self._dirty.setdefault(storage_key, record)
+                raise
+            finally:
+                self._flushing = {}
+
+    # данные всех сохраненных состояний
+    async def get_all_data(self) -> list[dict[str, Any]]:
+        """
+        Возвращает данные всех состояний, включая еще не записанные в БД изменения.
+        Нужна, чтобы найти, например, файлы, которые пользователи загрузили, но еще не отправили на проверку.
+        """
+
+        await self.flush()
+        async with database.connect() as db:
+            cursor = await db.execute(f'SELECT data FROM {TABLE_NAME}')
+            rows = await cursor.fetchall()
+
+        return [json.loads(row[0]) for row in rows if row[0]]
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+        # при остановке бота сохраняем все, что не успели записать
+        await self.flush()
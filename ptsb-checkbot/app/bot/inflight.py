@@ -0,0 +1,156 @@
+### либы
+## встроенные
+import asyncio
+import hashlib
+import os
+
+## встроенные классы
+from typing import Callable, Optional, Union
+
+
+### классы
+## самописные
+from app.bot import urls                                    # канонические ссылки
+from app.db.submission_jobs_functions import SubmissionJobFromDb
+
+
+### константы
+# политика списания проверок за задание, присоединенное к уже выполняющейся проверке такого же файла или ссылки
+INFLIGHT_CHARGE_FREE = "free"       # проверка возвращается пользователю, как при вердикте из кэша
+INFLIGHT_CHARGE_FULL = "charge"     # проверка списывается, как за обычное задание
+
+INFLIGHT_CHARGE_POLICY = (os.getenv('INFLIGHT_CHARGE_POLICY') or INFLIGHT_CHARGE_FREE).strip().lower()
+# опечатка в политике не должна молча превращаться в бесплатные проверки
+if INFLIGHT_CHARGE_POLICY not in (INFLIGHT_CHARGE_FREE, INFLIGHT_CHARGE_FULL):
+    raise ValueError(f"INFLIGHT_CHARGE_POLICY must be '{INFLIGHT_CHARGE_FREE}' or '{INFLIGHT_CHARGE_FULL}', got '{INFLIGHT_CHARGE_POLICY}'")
+
+
+# функция получения ключа одинаковых заданий
+def job_key(job: SubmissionJobFromDb) -> Optional[str]:
+    """
+    Возвращает ключ, по которому одинаковые задания объединяются в одну проверку: файл определяется по SHA-256,
+    а пока хэш не известен (потоковая передача) - по `file_unique_id` ТГ, ссылка - по канонической ссылке.
+    Пароли для распаковки тоже входят в ключ, т.к. с другими паролями результат проверки может отличаться.
+
+    Принимает:
+        - `job` (SubmissionJobFromDb): задание на отправку
+
+    Возвращает:
+        - `str`: ключ задания
+        - `None`, если задание не с чем сравнить
+    """
+
+    if job.scan_type == "url" and job.url:
+        key = f"url:{urls.canonicalize_url(job.url)}"
+    elif job.file_sha256:
+        key = f"sha256:{job.file_sha256}"
+    elif job.file_unique_id:
+        key = f"tg:{job.file_unique_id}"
+    else:
+        return None
+
+    if job.passwords:
+        passwords_hash = hashlib.sha256("\n".join(sorted(set(job.passwords))).encode()).hexdigest()
+        key = f"{key}|{passwords_hash}"
+    return key
+
+
+# объединение одновременных одинаковых заданий
+class InflightScans:
+    """
+    Single-flight для заданий в песочницу: когда один и тот же файл или ссылку одновременно отправляют несколько
+    пользователей (например, письмо из одной рассылки), в песочницу загружается только первое задание.
+    Остальные ждут, пока оно загрузится, и присоединяются к его `scan_id`, а вердикт получают вместе с ним.
+    Если первое задание загрузить не удалось, загрузку берет на себя следующее из ожидающих.
+    """
+
+    def __init__(self, is_scan_active: Optional[Callable[[str], bool]] = None) -> None:
+        self._is_scan_active = is_scan_active
+        self._uploads: dict[str, asyncio.Event] = {}
+        self._scan_ids: dict[str, str] = {}
+        self._keys_by_scan_id: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._scan_ids)
+
+    # присоединение к выполняющейся проверке или начало новой
+    async def join(self, key: str) -> Union[str, asyncio.Event]:
+        """
+        Возвращает `scan_id` проверки с таким же ключом, если она уже создана и ее результатов еще ждут.
+        Если такое же задание сейчас загружается, сначала дожидается окончания его загрузки.
+        Если возвращается событие загрузки, задание загружает сам вызвавший и по окончании обязан
+        передать это событие в `finish_upload`.
+
+        Принимает:
+            - `key` (str): ключ задания (`job_key`)
+
+        Возвращает:
+            - `str`: ID задания в песочнице, к которому нужно присоединиться
+            - `asyncio.Event`: событие загрузки, если задание нужно загрузить самому
+        """
+
+        while True:
+            scan_id = self._scan_ids.get(key)
+            if scan_id is not None:
+                # результаты уже получены или опрос прекращен - присоединяться не к чему
+                if self._is_scan_active is None or self._is_scan_active(scan_id):
+                    return scan_id
+                self.forget(scan_id)
+
+            upload = self._uploads.get(key)
+            if upload is None:
+                upload = asyncio.Event()
+                self._uploads[key] = upload
+                return upload
+
+            await upload.wait()
+
+    # окончание загрузки задания
+    def finish_upload(self, key: str, scan_id: Optional[str], upload: asyncio.Event) -> None:
+        """
+        Сообщает ожидающим заданиям, что загрузка закончилась. Повторный вызов ничего не меняет,
+        в том числе если загрузку такого же задания уже начал кто-то другой.
+
+        Принимает:
+            - `key` (str): ключ задания
+            - `scan_id` (str): ID созданного задания в песочнице или `None`, если загрузить не удалось
+            - `upload` (asyncio.Event): событие загрузки, которое вернул `join`
+        """
+
+        # загрузка уже завершена раньше, а под этим ключом может идти загрузка следующего задания
+        if self._uploads.get(key) is not upload:
+            return
+
+        # результаты могли быть получены еще до окончания загрузки - тогда присоединяться уже не к чему
+        if scan_id is not None and (self._is_scan_active is None or self._is_scan_active(scan_id)):
+            self.register(key, scan_id)
+
+        del self._uploads[key]
+        upload.set()
+
+    # запоминание уже созданного задания
+    def register(self, key: str, scan_id: str) -> None:
+        """
+        Запоминает задание, созданное в песочнице, чтобы к нему присоединялись такие же задания.
+        Используется и при возобновлении заданий после перезапуска бота.
+
+        Принимает:
+            - `key` (str): ключ задания
+            - `scan_id` (str): ID задания в песочнице
+        """
+
+        self._scan_ids.setdefault(key, scan_id)
+        self._keys_by_scan_id.setdefault(scan_id, set()).add(key)
+
+    # забывание задания, результаты которого уже отправлены
+    def forget(self, scan_id: str) -> None:
+        """
+        Убирает задание из выполняющихся: следующие такие же задания будут загружены заново
+
+        Принимает:
+            - `scan_id` (str): ID задания в песочнице
+        """
+
+        for key in self._keys_by_scan_id.pop(scan_id, set()):
+            if self._scan_ids.get(key) == scan_id:
+                del self._scan_ids[key]
@@ -0,0 +1,36 @@
+### либы
+## встроенные классы
+from typing import Any, Awaitable, Callable
+
+
+### классы
+## устанавливаемые
+from aiogram import BaseMiddleware                          # базовый класс мидлварей
+from aiogram.types import TelegramObject, User              # событие ТГ и его автор
+
+## самописные
+from app.db import users_functions                          # пользователи вместе с профилями из БД
+
+
+# мидлварь, которая один раз за событие достает пользователя и его профиль
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Перед вызовом хэндлера достает автора события из БД вместе с его профилем взаимодействия с песочницей
+    (одним запросом и через кэш) и передает их в хэндлер как `user_entity` и `user_sandbox_profile`.
+    Хэндлеру не нужно самому ходить в БД, чтобы проверить, существует ли пользователь и не заблокирован ли он.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+        ) -> Any:
+
+        event_from_user: User = data.get("event_from_user")
+        if event_from_user is not None:
+            user_entity, user_sandbox_profile = await users_functions.get_user_with_profile(event_from_user.id)
+            data["user_entity"] = user_entity
+            data["user_sandbox_profile"] = user_sandbox_profile
+
+        return await handler(event, data)
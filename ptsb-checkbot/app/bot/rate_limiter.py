@@ -0,0 +1,337 @@
+### либы
+## встроенные
+import asyncio
+import logging
+import math
+import os
+import time
+
+## встроенные классы
+from dataclasses import dataclass
+from typing import Optional
+
+
+### классы
+## самописные
+from app.db import rate_limits_functions                    # сохранение счетчиков между перезапусками
+from app.db.rate_limits_functions import RateWindowFromDb
+from app.db.sandbox_profiles_functions import UserProfileFromDb
+
+
+### константы
+RATE_LIMIT_BURST_WINDOW = int(os.getenv('RATE_LIMIT_BURST_WINDOW') or 60)             # длина окна для ограничения всплесков (секунд)
+RATE_LIMIT_DEFAULT_BURST = int(os.getenv('RATE_LIMIT_DEFAULT_BURST') or 5)            # сколько заданий можно отправить за RATE_LIMIT_BURST_WINDOW, если в профиле не задано
+RATE_LIMIT_DEFAULT_HOURLY = int(os.getenv('RATE_LIMIT_DEFAULT_HOURLY') or 0)          # сколько заданий можно отправить за час, если в профиле не задано (0 - без ограничения)
+RATE_LIMIT_DEFAULT_DAILY = int(os.getenv('RATE_LIMIT_DEFAULT_DAILY') or 0)            # сколько заданий можно отправить за скользящие сутки, если в профиле не задано (0 - без ограничения)
+RATE_LIMIT_FLUSH_INTERVAL = float(os.getenv('RATE_LIMIT_FLUSH_INTERVAL') or 30)       # как часто сохранять счетчики в БД (секунд)
+
+HOUR_WINDOW = 60 * 60
+DAY_WINDOW = 24 * 60 * 60
+
+logger = logging.getLogger("ptsb_checkbot")
+
+
+# ограничения частоты для одного пользователя
+@dataclass
+class RateLimits:
+    """
+    Ограничения частоты отправки заданий: сколько заданий можно отправить за окно всплеска, за час и за сутки.
+    `0` - без ограничения.
+    """
+    burst: int
+    hourly: int
+    daily: int
+
+    # пары (длина окна, ограничение) для действующих ограничений
+    def windows(self) -> list[tuple[int, int]]:
+        return [
+            (window_seconds, limit)
+            for window_seconds, limit in ((RATE_LIMIT_BURST_WINDOW, self.burst), (HOUR_WINDOW, self.hourly), (DAY_WINDOW, self.daily))
+            if limit > 0
+        ]
+
+    # сколько заданий можно отправить за один раз, `None` - без ограничения
+    def max_amount(self) -> Optional[int]:
+        return min((limit for _, limit in self.windows()), default=None)
+
+
+# функция получения ограничений частоты из профиля пользователя
+def limits_from_profile(user_profile: UserProfileFromDb) -> RateLimits:
+    """
+    Возвращает ограничения частоты из профиля пользователя, незаданные ограничения заменяются значениями по умолчанию
+
+    Принимает:
+        - `user_profile` (UserProfileFromDb): профиль взаимодействия с песочницей
+
+    Возвращает:
+        - `RateLimits`: ограничения частоты
+    """
+
+    return RateLimits(
+        burst=RATE_LIMIT_DEFAULT_BURST if user_profile.burst_limit is None else user_profile.burst_limit,
+        hourly=RATE_LIMIT_DEFAULT_HOURLY if user_profile.hourly_limit is None else user_profile.hourly_limit,
+        daily=RATE_LIMIT_DEFAULT_DAILY if user_profile.daily_limit is None else user_profile.daily_limit
+    )
+
+
+# функция разбора ограничений частоты из ввода админа
+def parse_limits(text: str) -> Optional[RateLimits]:
+    """
+    Разбирает ограничения частоты, введенные в виде `всплеск/час/сутки`, например `5/30/100`
+
+    Принимает:
+        - `text` (str): ввод админа
+
+    Возвращает:
+        - `RateLimits`: ограничения частоты
+        - `None`, если ввод не удалось разобрать
+    """
+
+    parts = text.strip().split("/")
+    if len(parts) != 3:
+        return None
+
+    try:
+        burst, hourly, daily = (int(part) for part in parts)
+    except ValueError:
+        return None
+
+    if min(burst, hourly, daily) < 0:
+        return None
+
+    return RateLimits(burst=burst, hourly=hourly, daily=daily)
+
+
+# функция для вывода ограничения в сообщениях
+def format_limit(limit: int) -> str:
+    return str(limit) if limit > 0 else "без ограничения"
+
+
+# функция для вывода времени ожидания в сообщениях
+def format_wait_time(seconds: float) -> str:
+    seconds = math.ceil(seconds)
+    if seconds < 60:
+        return f"{seconds} сек."
+    if seconds < HOUR_WINDOW:
+        return f"{math.ceil(seconds / 60)} мин."
+    return f"{seconds // HOUR_WINDOW} ч. {math.ceil(seconds % HOUR_WINDOW / 60)} мин."
+
+
+# счетчик скользящего окна
+class _SlidingWindow:
+    """
+    Счетчик отправок за скользящее окно. Хранит количество отправок в текущем и предыдущем фиксированных окнах
+    и оценивает количество за последние `window_seconds` секунд как сумму текущего и доли предыдущего,
+    поэтому занимает константную память независимо от ограничения.
+    """
+
+    def __init__(self, window_seconds: int, window_start: float, current_count: int = 0, previous_count: int = 0) -> None:
+        self.window_seconds = window_seconds
+        self.window_start = window_start
+        self.current_count = current_count
+        self.previous_count = previous_count
+
+    # сдвиг фиксированных окон к текущему моменту
+    def _roll(self, now: float) -> None:
+        passed_windows = int((now - self.window_start) // self.window_seconds)
+        if passed_windows >= 1:
+            self.previous_count = self.current_count if passed_windows == 1 else 0
+            self.current_count = 0
+            self.window_start += passed_windows * self.window_seconds
+
+    # сколько ждать, пока можно будет сделать еще `amount` отправок
+    def seconds_until_allowed(self, limit: int, now: float, amount: int = 1) -> float:
+        # столько отправок сразу не уложится в ограничение никогда
+        if amount > limit:
+            return math.inf
+
+        self._roll(now)
+        elapsed = now - self.window_start
+
+        if self.previous_count * (1 - elapsed / self.window_seconds) + self.current_count + amount <= limit:
+            return 0.0
+
+        # в текущем окне место есть, ждем, пока доля предыдущего окна уменьшится
+        if self.current_count + amount <= limit:
+            return self.window_seconds * (1 - (limit - self.current_count - amount) / self.previous_count) - elapsed
+
+        # ждем следующего окна, в котором текущее станет предыдущим
+        return (self.window_seconds - elapsed) + max(self.window_seconds * (1 - (limit - amount) / self.current_count), 0)
+
+    def hit(self, now: float, amount: int = 1) -> None:
+        self._roll(now)
+        self.current_count += amount
+
+    # возврат отправок, учтенных в момент `acquired_at`
+    def release(self, now: float, acquired_at: float, amount: int = 1) -> None:
+        self._roll(now)
+        if acquired_at >= self.window_start:
+            self.current_count = max(self.current_count - amount, 0)
+        elif acquired_at >= self.window_start - self.window_seconds:
+            self.previous_count = max(self.previous_count - amount, 0)
+
+    def is_expired(self, now: float) -> bool:
+        return now - self.window_start >= 2 * self.window_seconds
+
+
+# ограничитель частоты отправки заданий
+class SubmissionRateLimiter:
+    """
+    Ограничение частоты отправки заданий на проверку по скользящим окнам: всплеск, час и сутки.
+    Счетчики живут в памяти, раз в `RATE_LIMIT_FLUSH_INTERVAL` секунд и при остановке бота сохраняются в БД
+    и загружаются из нее при старте, поэтому перезапуск бота не обнуляет ограничения.
+    """
+
+    def __init__(self) -> None:
+        self._windows: dict[tuple[int, int], _SlidingWindow] = {}
+        self._dirty: set[tuple[int, int]] = set()
+        self._flusher: Optional[asyncio.Task] = None
+
+    # загрузка счетчиков из БД
+    async def load(self) -> None:
+        """
+        Загружает из БД счетчики, которые еще влияют на ограничение частоты
+        """
+
+        for window in await rate_limits_functions.fetch_active_windows(time.time()):
+            self._windows[(window.tg_user_id, window.window_seconds)] = _SlidingWindow(
+                window_seconds=window.window_seconds,
+                window_start=window.window_start,
+                current_count=window.current_count,
+                previous_count=window.previous_count
+            )
+
+    def _get_window(self, tg_user_id: int, window_seconds: int, now: float) -> _SlidingWindow:
+        key = (tg_user_id, window_seconds)
+        if key not in self._windows:
+            self._windows[key] = _SlidingWindow(window_seconds=window_seconds, window_start=now)
+        return self._windows[key]
+
+    # проверка без списания
+    def seconds_until_allowed(self, tg_user_id: int, limits: RateLimits, amount: int = 1) -> float:
+        """
+        Возвращает, через сколько секунд пользователь сможет отправить следующие `amount` заданий. Ничего не списывает.
+
+        Принимает:
+            - `tg_user_id` (int): TG ID пользователя
+            - `limits` (RateLimits): ограничения частоты пользователя
+            - `amount` (int): сколько заданий отправляется сразу
+
+        Возвращает:
+            - `float`: сколько секунд ждать, `0` - отправить можно сейчас, `math.inf` - столько заданий сразу не отправить никогда
+        """
+
+        now = time.time()
+        return max(
+            (
+                self._get_window(tg_user_id, window_seconds, now).seconds_until_allowed(limit, now, amount)
+                for window_seconds, limit in limits.windows()
+            ),
+            default=0.0
+        )
+
+    # проверка со списанием
+    def try_acquire(self, tg_user_id: int, limits: RateLimits, amount: int = 1) -> float:
+        """
+        Учитывает отправку `amount` заданий, если она укладывается во все ограничения пользователя.
+        Пачка учитывается как столько отправок, сколько в ней заданий.
+
+        Принимает:
+            - `tg_user_id` (int): TG ID пользователя
+            - `limits` (RateLimits): ограничения частоты пользователя
+            - `amount` (int): сколько заданий отправляется сразу
+
+        Возвращает:
+            - `float`: `0`, если отправка учтена, иначе через сколько секунд можно будет отправить задания (`math.inf` - никогда)
+        """
+
+        wait_time = self.seconds_until_allowed(tg_user_id, limits, amount)
+        if wait_time > 0:
+            return wait_time
+
+        now = time.time()
+        for window_seconds, _ in limits.windows():
+            self._get_window(tg_user_id, window_seconds, now).hit(now, amount)
+            self._dirty.add((tg_user_id, window_seconds))
+        return 0.0
+
+    # возврат учтенной отправки
+    def release(self, tg_user_id: int, acquired_at: float, amount: int = 1) -> None:
+        """
+        Возвращает в ограничение частоты отправки, которые были учтены, но так и не дошли до песочницы:
+        проверку не удалось зарезервировать или загрузка не удалась. Отправки старше двух окон уже не влияют на ограничение.
+
+        Принимает:
+            - `tg_user_id` (int): TG ID пользователя
+            - `acquired_at` (float): когда отправки были учтены (unix time)
+            - `amount` (int): сколько отправок вернуть
+        """
+
+        now = time.time()
+        for key, window in self._windows.items():
+            if key[0] == tg_user_id:
+                window.release(now, acquired_at, amount)
+                self._dirty.add(key)
+
+    # сохранение измененных счетчиков в БД
+    async def flush(self) -> None:
+        """
+        Сохраняет измененные счетчики в БД и забывает те, что уже не влияют на ограничение частоты
+        """
+
+        now = time.time()
+        dirty, self._dirty = self._dirty, set()
+
+        changed_windows: list[RateWindowFromDb] = []
+        for key in dirty:
+            window = self._windows.get(key)
+            if window is not None:
+                changed_windows.append(RateWindowFromDb(
+                    tg_user_id=key[0],
+                    window_seconds=window.window_seconds,
+                    window_start=window.window_start,
+                    current_count=window.current_count,
+                    previous_count=window.previous_count
+                ))
+
+        try:
+            await rate_limits_functions.save_windows(changed_windows, now)
+        except Exception:
+            self._dirty |= dirty
+            raise
+
+        for key in [key for key, window in self._windows.items() if window.is_expired(now)]:
+            del self._windows[key]
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(RATE_LIMIT_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.error("Failed to save rate limit counters to db, will retry", exc_info=True)
+
+    # запуск фонового сохранения
+    def start(self) -> None:
+        """
+        Запускает фоновое сохранение счетчиков в БД
+        """
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop(), name="rate_limiter_flusher")
+
+    # остановка фонового сохранения
+    async def stop(self) -> None:
+        """
+        Останавливает фоновое сохранение и сохраняет счетчики в последний раз
+        """
+
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+        await self.flush()
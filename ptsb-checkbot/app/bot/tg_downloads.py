@@ -0,0 +1,282 @@
+### либы
+## встроенные
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import time
+
+## встроенные классы
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+
+### классы
+## устанавливаемые
+import aiofiles                                             # чтение файлов локального Bot API сервера
+import aiohttp                                              # запросы к файловому серверу ТГ с заголовком Range
+from aiogram import Bot                                     # бот, через сессию которого качаем файл
+
+
+### константы
+# сколько чанков может лежать в буфере между скачиванием из ТГ и загрузкой в песочницу
+STREAM_BUFFER_CHUNKS = int(os.getenv('STREAM_BUFFER_CHUNKS') or 8)
+
+# докачка файлов из ТГ
+TG_DOWNLOAD_STALL_TIMEOUT = float(os.getenv('TG_DOWNLOAD_STALL_TIMEOUT') or 30)          # через сколько секунд без новых данных переподключаться и продолжать с того же места
+TG_DOWNLOAD_MAX_RETRY_DELAY = float(os.getenv('TG_DOWNLOAD_MAX_RETRY_DELAY') or 60)      # максимальная пауза между попытками докачки (секунд)
+TG_DOWNLOAD_PROGRESS_INTERVAL = float(os.getenv('TG_DOWNLOAD_PROGRESS_INTERVAL') or 3)   # не чаще скольких секунд сообщать о ходе скачивания
+
+logger = logging.getLogger("ptsb_checkbot")
+
+# колбэк, который получает количество скачанных байт и размер файла, если он известен
+OnDownloadProgress = Callable[[int, Optional[int]], Awaitable[None]]
+
+# маркер конца потока в очереди чанков
+_END_OF_STREAM = None
+
+
+# потоковое скачивание файла из ТГ без сохранения на диск
+class TgFileStream:
+    """
+    Асинхронный поток чанков файла с серверов ТГ. Скачивание идет в фоне и складывает чанки в ограниченную очередь,
+    а потребитель (например, тело запроса `checkFile`) забирает их из нее. Так в памяти одновременно находится
+    не больше `STREAM_BUFFER_CHUNKS` чанков, а медленная сторона притормаживает быструю.
+
+    Попутно считается SHA-256 содержимого, доступный после полного прочтения потока.
+    """
+
+    def __init__(
+            self,
+            bot: Bot,
+            file_path: str,
+            timeout: int,
+            chunk_size: int
+        ) -> None:
+        self._bot = bot
+        self._file_path = file_path
+        self._timeout = timeout
+        self._chunk_size = chunk_size
+        self._hash = hashlib.sha256()
+        self.bytes_read: int = 0
+        self.is_complete: bool = False
+        self.error: Optional[BaseException] = None
+
+    @property
+    def sha256(self) -> Optional[str]:
+        """
+        SHA-256 файла, если поток был прочитан до конца, иначе `None`
+        """
+        return self._hash.hexdigest() if self.is_complete else None
+
+    # источник чанков: сервер ТГ или файл локального Bot API сервера
+    def _open_source(self) -> AsyncIterator[bytes]:
+        if self._bot.session.api.is_local:
+            return self._read_local_file(self._bot.session.api.wrap_local_file.to_local(self._file_path))
+
+        return self._bot.session.stream_content(
+            url=self._bot.session.api.file_url(self._bot.token, self._file_path),
+            timeout=self._timeout,
+            chunk_size=self._chunk_size,
+            raise_for_status=True
+        )
+
+    async def _read_local_file(self, local_path: str) -> AsyncIterator[bytes]:
+        async with aiofiles.open(local_path, "rb") as local_file:
+            while chunk := await local_file.read(self._chunk_size):
+                yield chunk
+
+    # фоновое скачивание в очередь
+    async def _produce(self, queue: asyncio.Queue) -> None:
+        source = self._open_source()
+        try:
+            async for chunk in source:
+                await queue.put(chunk)
+        except Exception as error:
+            self.error = error
+        finally:
+            await source.aclose()
+
+        # при отмене сюда не доходим: потребителя уже нет и ждать места в очереди некому
+        await queue.put(_END_OF_STREAM)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_CHUNKS)
+        producer = asyncio.create_task(self._produce(queue))
+
+        try:
+            while (chunk := await queue.get()) is not _END_OF_STREAM:
+                self._hash.update(chunk)
+                self.bytes_read += len(chunk)
+                yield chunk
+
+            # ошибку скачивания пробрасываем потребителю, чтобы тот прервал загрузку в песочницу
+            if self.error is not None:
+                raise self.error
+            self.is_complete = True
+
+        finally:
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+
+
+# ошибка скачивания файла после всех попыток
+class TgDownloadError(Exception):
+    """
+    Файл не удалось скачать из ТГ: попытки докачки закончились, не продвинув скачивание
+    """
+
+
+# скачивание файла из ТГ с докачкой после обрывов
+class ResumableTgDownload:
+    """
+    Скачивает файл с серверов ТГ (или с локального Bot API сервера) на диск. После обрыва соединения скачивание
+    продолжается с последнего записанного байта запросом с заголовком `Range`, а не начинается заново.
+
+    Пауза между попытками растет экспоненциально, пока попытки ничего не докачивают, и сбрасывается,
+    как только соединение снова начинает отдавать данные. Скачивание прекращается после `max_retries`
+    попыток подряд без продвижения.
+    """
+
+    def __init__(
+            self,
+            bot: Bot,
+            file_path: str,
+            destination: str,
+            file_size: Optional[int],
+            timeout: int,
+            chunk_size: int,
+            max_retries: int,
+            retry_delay: float,
+            on_progress: Optional[OnDownloadProgress] = None
+        ) -> None:
+        self._bot = bot
+        self._file_path = file_path
+        self._destination = destination
+        self._file_size = file_size
+        self._timeout = timeout
+        self._chunk_size = chunk_size
+        self._max_retries = max(max_retries, 1)
+        self._retry_delay = retry_delay
+        self._on_progress = on_progress
+        self._last_progress_at = 0.0
+        self.bytes_downloaded: int = 0
+        self.attempts: int = 0
+
+    @property
+    def is_complete(self) -> bool:
+        return self._file_size is not None and self.bytes_downloaded >= self._file_size
+
+    # сообщение о ходе скачивания не чаще раза в интервал
+    async def _report_progress(self, force: bool = False) -> None:
+        if self._on_progress is None:
+            return
+
+        now = time.monotonic()
+        if not force and now - self._last_progress_at < TG_DOWNLOAD_PROGRESS_INTERVAL:
+            return
+
+        self._last_progress_at = now
+        try:
+            await self._on_progress(self.bytes_downloaded, self._file_size)
+        except Exception:
+            logger.warning(f"Failed to report download progress of file {self._file_path}", exc_info=True)
+
+    # запись чанков в файл с нужного места
+    async def _write_chunks(self, chunks: AsyncIterator[bytes], restart: bool) -> None:
+        if restart:
+            self.bytes_downloaded = 0
+
+        async with aiofiles.open(self._destination, "wb" if restart else "ab") as destination_file:
+            async for chunk in chunks:
+                await destination_file.write(chunk)
+                self.bytes_downloaded += len(chunk)
+                await self._report_progress()
+
+    # чтение файла локального Bot API сервера с нужного места
+    async def _read_local_file(self, local_path: str, offset: int) -> AsyncIterator[bytes]:
+        async with aiofiles.open(local_path, "rb") as local_file:
+            await local_file.seek(offset)
+            while chunk := await local_file.read(self._chunk_size):
+                yield chunk
+
+    # одна попытка скачивания начиная с уже скачанного
+    async def _download_from_offset(self) -> None:
+        offset = self.bytes_downloaded
+
+        # локальный Bot API сервер отдает путь к файлу на общем диске
+        if self._bot.session.api.is_local:
+            local_path = self._bot.session.api.wrap_local_file.to_local(self._file_path)
+            await self._write_chunks(self._read_local_file(local_path, offset), restart=offset == 0)
+            return
+
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        session = await self._bot.session.create_session()
+        async with session.get(
+            self._bot.session.api.file_url(self._bot.token, self._file_path),
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=self._timeout, sock_read=TG_DOWNLOAD_STALL_TIMEOUT)
+        ) as response:
+
+            # запрошенный диапазон начинается за концом файла - значит, файл уже скачан целиком
+            if offset and response.status == 416:
+                return
+
+            response.raise_for_status()
+
+            # сервер не умеет отдавать часть файла - придется качать его заново
+            restart = offset == 0 or response.status != 206
+            if offset and restart:
+                logger.warning(f"TG file server ignored Range request for file {self._file_path}, downloading it from the beginning")
+
+            await self._write_chunks(response.content.iter_chunked(self._chunk_size), restart=restart)
+
+    # скачивание файла целиком
+    async def download(self) -> None:
+        """
+        Скачивает файл в `destination`, докачивая его после обрывов соединения
+
+        Исключения:
+            - `TgDownloadError`: файл не удалось скачать за `max_retries` попыток подряд без продвижения
+        """
+
+        failures_in_row = 0
+        retry_delay = self._retry_delay
+
+        while True:
+            self.attempts += 1
+            bytes_before_attempt = self.bytes_downloaded
+            try:
+                await self._download_from_offset()
+                if self._file_size is None or self.bytes_downloaded >= self._file_size:
+                    break
+
+                raise aiohttp.ClientPayloadError(f"Connection closed after {self.bytes_downloaded} of {self._file_size} bytes")
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as download_error:
+
+                # соединение успело что-то отдать - оно живое, начинаем паузы сначала
+                if self.bytes_downloaded > bytes_before_attempt:
+                    failures_in_row = 0
+                    retry_delay = self._retry_delay
+                else:
+                    failures_in_row += 1
+
+                if failures_in_row >= self._max_retries:
+                    raise TgDownloadError(
+                        f"Не удалось скачать файл после {self.attempts} попыток, скачано {self.bytes_downloaded} байт: {download_error!r}"
+                    ) from download_error
+
+                # случайная добавка к паузе, чтобы одновременные скачивания не переподключались разом
+                pause = retry_delay * random.uniform(0.5, 1.0)
+                logger.warning(
+                    f"Attempt №{self.attempts} to download file {self._file_path} stopped at {self.bytes_downloaded} bytes: {download_error!r}. "
+                    f"Resuming in {pause:.1f} seconds"
+                )
+                await asyncio.sleep(pause)
+                retry_delay = min(retry_delay * 2, TG_DOWNLOAD_MAX_RETRY_DELAY)
+
+        await self._report_progress(force=True)
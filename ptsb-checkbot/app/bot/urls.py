@@ -0,0 +1,256 @@
+### либы
+## встроенные
+import codecs
+import csv
+import os
+import re
+
+## встроенные классы
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+### классы
+## устанавливаемые
+from aiogram.types import Message                           # сообщения пользователя со ссылками
+
+
+### константы
+URL_BATCH_MAX_URLS = int(os.getenv('URL_BATCH_MAX_URLS') or 100)                     # сколько ссылок можно отправить на проверку одной пачкой
+URL_LIST_MAX_FILE_SIZE = int(os.getenv('URL_LIST_MAX_FILE_SIZE') or 1024 * 1024)     # максимальный размер файла со списком ссылок (байт)
+
+URL_LIST_EXTENSIONS = (".txt", ".csv", ".tsv", ".list")     # расширения файлов, которые считаются списками ссылок
+
+# параметры запроса, которые добавляют рассылки и соцсети для отслеживания переходов, на содержимое ссылки они не влияют
+# `*` в конце - все параметры с таким началом
+URL_TRACKING_PARAMS = tuple(
+    param.strip().lower()
+    for param in (os.getenv('URL_TRACKING_PARAMS') or "utm_*,fbclid,gclid,dclid,yclid,msclkid,igshid,mc_cid,mc_eid,_openstat,ref_src").split(",")
+    if param.strip()
+)
+
+_URL_PATTERN = re.compile(r"(?:https?|ftp)://[^\s<>\"'`]+|www\.[^\s<>\"'`]+", re.IGNORECASE)
+_TRAILING_PUNCTUATION = ".,;:!?)]}>'\""
+_DEFAULT_PORTS = {"http": 80, "https": 443, "ftp": 21}
+
+
+# результат разбора ссылок
+@dataclass
+class ParsedUrls:
+    """
+    Класс, возвращающий ссылки, найденные в сообщении или файле: нормализованные и без повторов, в порядке появления
+    """
+    urls: list[str] = field(default_factory=list)
+    duplicates: int = 0          # сколько ссылок повторялось
+    invalid: int = 0             # сколько найденных строк не удалось разобрать как ссылку
+    is_truncated: bool = False   # ссылок больше, чем можно отправить, лишние отброшены
+
+
+# функция нормализации ссылки
+def normalize_url(raw_url: str) -> Optional[str]:
+    """
+    Приводит ссылку к единому виду, чтобы одинаковые ссылки не отправлялись на проверку дважды:
+    добавляет схему, если ее нет, приводит схему и хост к нижнему регистру, убирает порт по умолчанию и фрагмент после `#`
+
+    Принимает:
+        - `raw_url` (str): ссылка от пользователя
+
+    Возвращает:
+        - `str`: нормализованная ссылка
+        - `None`, если строка не похожа на ссылку
+    """
+
+    url = raw_url.strip().rstrip(_TRAILING_PUNCTUATION)
+    if not url or any(char.isspace() for char in url):
+        return None
+    if "://" not in url:
+        url = f"http://{url}"
+
+    try:
+        url_parts = urlsplit(url)
+        port = url_parts.port
+    except ValueError:
+        return None
+
+    # хост должен быть доменом с точкой или IP адресом
+    scheme = url_parts.scheme.lower()
+    hostname = url_parts.hostname
+    if scheme not in _DEFAULT_PORTS or not hostname or ("." not in hostname and ":" not in hostname):
+        return None
+
+    # домены в юникоде приводим к punycode, как их увидит песочница
+    host = hostname.lower()
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass
+    if ":" in host:
+        host = f"[{host}]"
+
+    netloc = host
+    if url_parts.username is not None:
+        userinfo = url_parts.username if url_parts.password is None else f"{url_parts.username}:{url_parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    if port is not None and port != _DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+
+    return urlunsplit((scheme, netloc, url_parts.path or "/", url_parts.query, ""))
+
+
+# функция проверки, что параметр запроса нужен только для отслеживания переходов
+def _is_tracking_param(param_name: str) -> bool:
+    param_name = param_name.lower()
+    return any(
+        param_name.startswith(tracking_param[:-1]) if tracking_param.endswith("*") else param_name == tracking_param
+        for tracking_param in URL_TRACKING_PARAMS
+    )
+
+
+# функция получения канонической ссылки
+def canonicalize_url(raw_url: str) -> str:
+    """
+    Возвращает каноническую ссылку для кэша вердиктов: к нормализованной ссылке дополнительно применяются
+    удаление параметров отслеживания (`URL_TRACKING_PARAMS`), сортировка остальных параметров и удаление `/` в конце пути.
+    Так копии одной ссылки из рассылки, отличающиеся только этим, получают один и тот же вердикт.
+    В песочницу отправляется сама ссылка, а не каноническая.
+
+    Принимает:
+        - `raw_url` (str): ссылка
+
+    Возвращает:
+        - `str`: каноническая ссылка
+    """
+
+    url = normalize_url(raw_url) or raw_url.strip()
+    url_parts = urlsplit(url)
+
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(url_parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    )
+
+    return urlunsplit((url_parts.scheme, url_parts.netloc, url_parts.path.rstrip("/") or "/", urlencode(query), ""))
+
+
+# функция поиска ссылок в строке
+def find_urls(text: str) -> list[str]:
+    return _URL_PATTERN.findall(text)
+
+
+# функция получения ссылок из сообщения
+def extract_message_urls(message: Message) -> list[str]:
+    """
+    Возвращает все ссылки из текста или подписи сообщения. Берутся ссылки, которые ТГ сам разметил
+    (в том числе скрытые под текстом), а если разметки нет - ссылки, найденные в тексте
+
+    Принимает:
+        - `message` (Message): сообщение пользователя
+
+    Возвращает:
+        - `list[str]`: найденные ссылки в порядке появления, еще не нормализованные
+    """
+
+    text = message.text or message.caption or ""
+    entities = message.entities or message.caption_entities or []
+
+    found_urls: list[str] = []
+    for entity in entities:
+        if entity.type == "url":
+            found_urls.append(entity.extract_from(text))
+        elif entity.type == "text_link" and entity.url:
+            found_urls.append(entity.url)
+
+    return found_urls or find_urls(text)
+
+
+# функция сбора уникальных ссылок
+def collect_urls(raw_urls: Iterable[str], max_urls: int = URL_BATCH_MAX_URLS, parsed: Optional[ParsedUrls] = None) -> ParsedUrls:
+    """
+    Нормализует ссылки и убирает повторы. Ссылки сверх `max_urls` отбрасываются.
+
+    Принимает:
+        - `raw_urls` (Iterable[str]): найденные ссылки
+        - `max_urls` (int): сколько ссылок можно взять
+        - `parsed` (ParsedUrls): уже собранные ссылки, к которым добавляются новые
+
+    Возвращает:
+        - `ParsedUrls` (object of custom class): собранные ссылки
+    """
+
+    parsed = parsed if parsed is not None else ParsedUrls()
+    seen_urls = set(parsed.urls)
+
+    for raw_url in raw_urls:
+        url = normalize_url(raw_url)
+        if url is None:
+            parsed.invalid += 1
+            continue
+        if url in seen_urls:
+            parsed.duplicates += 1
+            continue
+        if len(parsed.urls) >= max_urls:
+            parsed.is_truncated = True
+            break
+
+        seen_urls.add(url)
+        parsed.urls.append(url)
+
+    return parsed
+
+
+# функция чтения списка ссылок из файла
+async def read_url_list(chunks: AsyncIterable[bytes], file_name: str, max_urls: int = URL_BATCH_MAX_URLS) -> ParsedUrls:
+    """
+    Читает ссылки из текстового файла по мере скачивания, не собирая его целиком в памяти.
+    В CSV и TSV файлах ссылки ищутся в каждой ячейке, в остальных - в каждой строке.
+    Чтение прекращается, как только набрано `max_urls` ссылок.
+
+    Принимает:
+        - `chunks` (AsyncIterable[bytes]): содержимое файла чанками
+        - `file_name` (str): имя файла, по расширению выбирается разделитель ячеек
+        - `max_urls` (int): сколько ссылок можно взять
+
+    Возвращает:
+        - `ParsedUrls` (object of custom class): собранные ссылки
+    """
+
+    extension = os.path.splitext(file_name.lower())[1]
+    delimiter = {".csv": ",", ".tsv": "\t"}.get(extension)
+
+    # в списках ссылки часто пишут без схемы, поэтому строка или ячейка из одного слова тоже считается ссылкой
+    def item_urls(item: str) -> list[str]:
+        item = item.strip()
+        found_urls = find_urls(item)
+        if not found_urls and item and not any(char.isspace() for char in item):
+            found_urls = [item]
+        return found_urls
+
+    # ищем ссылки в одной строке файла
+    def line_urls(line: str) -> list[str]:
+        if delimiter is None:
+            return item_urls(line)
+
+        found_urls: list[str] = []
+        for row in csv.reader([line], delimiter=delimiter):
+            for cell in row:
+                found_urls.extend(item_urls(cell))
+        return found_urls
+
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    parsed = ParsedUrls()
+    tail = ""
+
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).splitlines(keepends=True)
+        # последняя строка может продолжиться в следующем чанке
+        tail = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+
+        for line in lines:
+            collect_urls(line_urls(line), max_urls, parsed)
+            if parsed.is_truncated:
+                return parsed
+
+    collect_urls(line_urls(tail + decoder.decode(b"", final=True)), max_urls, parsed)
+    return parsed
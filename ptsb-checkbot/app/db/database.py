@@ -0,0 +1,119 @@
+# встроенные либы
+import asyncio
+import os
+
+# встроенные классы
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+# устанавливаемые либы
+import aiosqlite
+
+
+# задаем путь до БД приложения
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_DIR = os.path.join(PROJECT_ROOT, "database")
+DB_NAME = "kernel_base.db"
+FULL_PATH_TO_KERNEL_DB = os.path.join(DB_DIR, DB_NAME)
+
+# инициализируем директорию к БД и саму по себе БД
+if not os.path.exists(DB_DIR):
+    os.mkdir(DB_DIR)
+if not os.path.exists(FULL_PATH_TO_KERNEL_DB):
+    with open(FULL_PATH_TO_KERNEL_DB, "w"):
+        pass
+
+# настройки подключения к БД
+DB_CACHE_SIZE_KIB = int(os.getenv('DB_CACHE_SIZE_KIB') or 8 * 1024)            # размер страничного кэша SQLite (КиБ)
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS') or 5000)              # сколько ждать снятия блокировки БД, прежде чем вернуть ошибку (мс)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE') or 256)     # сколько подготовленных SQL запросов держать в кэше соединения
+
+# общее на все приложение соединение с БД
+_kernel_db: Optional[aiosqlite.Connection] = None
+_kernel_db_open_lock = asyncio.Lock()
+_kernel_db_usage_lock = asyncio.Lock()
+
+
+# функция открытия общего соединения с БД приложения
+async def open_kernel_db() -> aiosqlite.Connection:
+    """
+    Открывает одно долгоживущее соединение с БД приложения, через которое работают все функции модулей `app.db`.
+    БД переводится в режим WAL, поэтому чтение (например, снятие бекапа) не блокирует запись.
+    Повторный вызов возвращает уже открытое соединение.
+
+    Возвращает:
+        - `aiosqlite.Connection`: общее соединение с БД
+    """
+
+    global _kernel_db
+
+    async with _kernel_db_open_lock:
+        if _kernel_db is None:
+            # sqlite3 кэширует подготовленные запросы внутри соединения, поэтому повторные запросы не компилируются заново
+            kernel_db = await aiosqlite.connect(FULL_PATH_TO_KERNEL_DB, cached_statements=DB_STATEMENT_CACHE_SIZE)
+            await kernel_db.execute("PRAGMA journal_mode = WAL")
+            await kernel_db.execute("PRAGMA synchronous = NORMAL")
+            await kernel_db.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KIB}")
+            await kernel_db.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+            await kernel_db.execute("PRAGMA temp_store = MEMORY")
+            _kernel_db = kernel_db
+
+    return _kernel_db
+
+
+# функция закрытия общего соединения с БД приложения
+async def close_kernel_db() -> None:
+    """
+    Закрывает общее соединение с БД приложения, перед этим переносит журнал WAL в основной файл БД.
+    """
+
+    global _kernel_db
+
+    async with _kernel_db_open_lock:
+        if _kernel_db is not None:
+            async with _kernel_db_usage_lock:
+                await _kernel_db.execute("PRAGMA optimize")
+                await _kernel_db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                await _kernel_db.close()
+            _kernel_db = None
+
+
+# получение общего соединения с БД для выполнения запросов
+@asynccontextmanager
+async def connect() -> AsyncIterator[aiosqlite.Connection]:
+    """
+    Выдает общее соединение с БД приложения на время блока `async with`. Блоки выполняются по очереди,
+    поэтому запросы разных корутин не перемешиваются в одной транзакции. Незафиксированные изменения
+    фиксируются при выходе из блока, а если блок завершился ошибкой - откатываются.
+
+    Возвращает:
+        - `aiosqlite.Connection`: общее соединение с БД
+    """
+
+    kernel_db = await open_kernel_db()
+
+    async with _kernel_db_usage_lock:
+        try:
+            yield kernel_db
+        except BaseException:
+            await kernel_db.rollback()
+            raise
+        if kernel_db.in_transaction:
+            await kernel_db.commit()
+
+
+# функция снятия бекапа БД приложения
+async def backup_kernel_db(path_to_backup: str) -> None:
+    """
+    Сохраняет согласованную копию БД приложения в отдельный файл через backup API SQLite. В отличие от копирования файла БД,
+    в копию попадает и то, что еще лежит в журнале WAL.
+
+    Принимает:
+        - `path_to_backup` (str): полный путь к файлу, в который будет сохранена копия
+    """
+
+    kernel_db = await open_kernel_db()
+
+    async with aiosqlite.connect(path_to_backup) as backup_db:
+        async with _kernel_db_usage_lock:
+            await kernel_db.backup(backup_db)
@@ -0,0 +1,161 @@
+# встроенные либы
+import logging
+
+# встроенные классы
+from typing import Awaitable, Callable
+
+# устанавливаемые либы
+import aiosqlite
+
+# самописные либы
+from app.db import database
+
+
+logger = logging.getLogger("ptsb_checkbot")
+
+
+# пересоздание таблицы с первичным ключом tg_user_id
+async def _rebuild_with_tg_user_id_pk(db: aiosqlite.Connection, table_name: str, columns_definition: str) -> None:
+    """
+    Пересоздает таблицу так, чтобы `tg_user_id` стал ее первичным ключом. Если у пользователя было несколько строк,
+    остается самая первая - именно ее бот и читал до появления ключа.
+
+    Принимает:
+        - `db` (aiosqlite.Connection): соединение с БД, в котором открыта транзакция миграции
+        - `table_name` (str): название таблицы
+        - `columns_definition` (str): описание колонок новой таблицы, первой колонкой должен идти `tg_user_id`
+    """
+
+    cursor = await db.execute(f"PRAGMA table_info({table_name})")
+    columns = await cursor.fetchall()
+
+    # таблица уже создана с ключом (новая установка)
+    if any(column[1] == "tg_user_id" and column[5] for column in columns):
+        return
+
+    column_names = ", ".join(column[1] for column in columns)
+
+    cursor = await db.execute(f"SELECT COUNT(*) - COUNT(DISTINCT tg_user_id) FROM {table_name}")
+    duplicates_amount = (await cursor.fetchone())[0]
+    if duplicates_amount:
+        logger.warning(f"Table {table_name} has {duplicates_amount} duplicate rows by tg_user_id, only the first row for each user is kept")
+
+    await db.execute(f"CREATE TABLE {table_name}_new ({columns_definition})")
+    await db.execute(f"""
+        INSERT INTO {table_name}_new ({column_names})
+        SELECT {column_names} FROM {table_name}
+        WHERE rowid IN (SELECT MIN(rowid) FROM {table_name} WHERE tg_user_id IS NOT NULL GROUP BY tg_user_id)
+    """)
+    await db.execute(f"DROP TABLE {table_name}")
+    await db.execute(f"ALTER TABLE {table_name}_new RENAME TO {table_name}")
+
+
+# миграция 1: первичные ключи для пользователей и их профилей, индексы для фоновых задач
+async def _migration_1_primary_keys(db: aiosqlite.Connection) -> None:
+    await _rebuild_with_tg_user_id_pk(db, "users", """
+        tg_user_id INTEGER PRIMARY KEY,
+        user_role TEXT,
+        comment TEXT,
+        created_by INTEGER,
+        creation_date TEXT,
+        update_date TEXT,
+        is_blocked INTEGER
+    """)
+    await _rebuild_with_tg_user_id_pk(db, "sandbox_profiles", """
+        tg_user_id INTEGER PRIMARY KEY,
+        max_available_checks INTEGER,
+        remaining_checks INTEGER,
+        total_checks INTEGER,
+        check_priority INTEGER,
+        can_get_links INTEGER
+    """)
+
+    # вытеснение давно не использованных файлов ТГ и удаление устаревших состояний идут по времени
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_tg_files_last_used_at ON tg_files (last_used_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)")
+
+
+# добавление колонки в таблицу, если ее еще нет
+async def _add_column_if_not_exists(db: aiosqlite.Connection, table_name: str, column_name: str, column_type: str) -> None:
+    cursor = await db.execute(f"PRAGMA table_info({table_name})")
+    if any(column[1] == column_name for column in await cursor.fetchall()):
+        return
+    await db.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+
+
+# удаление колонки из таблицы, если она в ней есть
+async def _drop_column_if_exists(db: aiosqlite.Connection, table_name: str, column_name: str) -> None:
+    cursor = await db.execute(f"PRAGMA table_info({table_name})")
+    if not any(column[1] == column_name for column in await cursor.fetchall()):
+        return
+    await db.execute(f"ALTER TABLE {table_name} DROP COLUMN {column_name}")
+
+
+# миграция 2: часовой пояс пользователя и начало его текущих суток для ленивого восстановления проверок
+async def _migration_2_lazy_quota_windows(db: aiosqlite.Connection) -> None:
+    # у существующих профилей начала суток нет, поэтому лимит восстановится при первом же списании
+    await _add_column_if_not_exists(db, "sandbox_profiles", "timezone", "TEXT")
+    await _add_column_if_not_exists(db, "sandbox_profiles", "quota_window_start", "TEXT")
+
+
+# миграция 3: ограничения частоты отправки заданий в профиле пользователя
+async def _migration_3_rate_limits(db: aiosqlite.Connection) -> None:
+    # у существующих профилей ограничения не заданы, поэтому для них действуют значения по умолчанию
+    await _add_column_if_not_exists(db, "sandbox_profiles", "burst_limit", "INTEGER")
+    await _add_column_if_not_exists(db, "sandbox_profiles", "hourly_limit", "INTEGER")
+    await _add_column_if_not_exists(db, "sandbox_profiles", "daily_limit", "INTEGER")
+
+
+# миграция 4: пачки файлов, отправленные одним заданием
+async def _migration_4_submission_batches(db: aiosqlite.Connection) -> None:
+    await _add_column_if_not_exists(db, "submission_jobs", "batch_id", "TEXT")
+    await _add_column_if_not_exists(db, "submission_jobs", "result", "TEXT")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_submission_jobs_batch_id ON submission_jobs (batch_id)")
+
+
+# миграция 5: узел песочницы, на котором создано задание, для опроса результатов и ссылок на задание
+async def _migration_5_sandbox_nodes(db: aiosqlite.Connection) -> None:
+    # у существующих заданий и вердиктов узла нет, они относятся к основному узлу
+    await _add_column_if_not_exists(db, "submission_jobs", "ptsb_node", "TEXT")
+    await _add_column_if_not_exists(db, "verdict_cache", "ptsb_node", "TEXT")
+    await _add_column_if_not_exists(db, "url_verdict_cache", "ptsb_node", "TEXT")
+
+
+# миграция 6: последнее задание по файлу ТГ нигде не читалось, поэтому больше не хранится
+async def _migration_6_drop_tg_files_last_scan(db: aiosqlite.Connection) -> None:
+    await _drop_column_if_exists(db, "tg_files", "last_scan_id")
+
+
+# все миграции схемы БД по порядку, номер версии схемы = номер миграции в списке
+MIGRATIONS: list[Callable[[aiosqlite.Connection], Awaitable[None]]] = [
+    _migration_1_primary_keys,
+    _migration_2_lazy_quota_windows,
+    _migration_3_rate_limits,
+    _migration_4_submission_batches,
+    _migration_5_sandbox_nodes,
+    _migration_6_drop_tg_files_last_scan,
+]
+
+
+# функция обновления схемы БД до актуальной версии
+async def apply_migrations() -> None:
+    """
+    Приводит схему БД приложения к актуальной версии. Текущая версия хранится в `PRAGMA user_version`,
+    каждая еще не примененная миграция выполняется в отдельной транзакции вместе с повышением версии.
+    Вызывается при старте бота после создания всех таблиц.
+    """
+
+    async with database.connect() as db:
+        cursor = await db.execute("PRAGMA user_version")
+        current_version = (await cursor.fetchone())[0]
+
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            if version <= current_version:
+                continue
+
+            logger.info(f"Applying db migration {version}: {migration.__name__}")
+            # при ошибке транзакция откатится целиком вместе с версией схемы
+            await db.execute("BEGIN")
+            await migration(db)
+            await db.execute(f"PRAGMA user_version = {version}")
+            await db.commit()
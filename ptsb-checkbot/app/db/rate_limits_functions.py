@@ -0,0 +1,91 @@
+# встроенные классы
+from dataclasses import dataclass
+
+# самописные либы
+from app.db import database
+
+
+# название таблицы для этого модуля
+TABLE_NAME = "rate_limits"
+
+# самописные классы
+@dataclass
+class RateWindowFromDb:
+    """
+    Класс, возвращающий счетчик отправок пользователя за одно окно ограничения частоты из таблицы `rate_limits`
+    """
+    tg_user_id: int
+    window_seconds: int
+    window_start: float
+    current_count: int
+    previous_count: int
+
+
+# функция инициализации таблицы со счетчиками отправок
+async def create_table_if_not_exists() -> None:
+    """
+    Создает таблицу `rate_limits` если ее еще не существует в БД приложения
+    """
+
+    async with database.connect() as db:
+        await db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+                tg_user_id INTEGER,
+                window_seconds INTEGER,
+                window_start REAL,
+                current_count INTEGER,
+                previous_count INTEGER,
+                PRIMARY KEY (tg_user_id, window_seconds)
+            )
+        """)
+
+
+# функция получения всех еще актуальных счетчиков
+async def fetch_active_windows(now: float) -> list[RateWindowFromDb]:
+    """
+    Возвращает счетчики, которые еще влияют на ограничение частоты. Счетчик перестает влиять, когда с начала
+    его окна прошло два окна: и текущее, и предыдущее окна к этому моменту закончились.
+
+    Принимает:
+        - `now` (float): текущее время (unix timestamp)
+
+    Возвращает:
+        - `list[RateWindowFromDb]` (list): актуальные счетчики
+    """
+
+    async with database.connect() as limits_db:
+        cursor = await limits_db.execute(
+            f'SELECT * FROM {TABLE_NAME} WHERE window_start + 2 * window_seconds > ?',
+            (now,)
+        )
+        rows = await cursor.fetchall()
+
+    return [
+        RateWindowFromDb(
+            tg_user_id=row[0],
+            window_seconds=row[1],
+            window_start=row[2],
+            current_count=row[3],
+            previous_count=row[4]
+        )
+        for row in rows
+    ]
+
+
+# функция сохранения счетчиков
+async def save_windows(windows: list[RateWindowFromDb], now: float) -> None:
+    """
+    Сохраняет счетчики отправок одной транзакцией и удаляет те, что уже не влияют на ограничение частоты
+
+    Принимает:
+        - `windows` (list[RateWindowFromDb]): измененные счетчики
+        - `now` (float): текущее время (unix timestamp)
+    """
+
+    async with database.connect() as limits_db:
+        await limits_db.executemany(
+            f'INSERT OR REPLACE INTO {TABLE_NAME} (tg_user_id, window_seconds, window_start, current_count, previous_count) VALUES (?, ?, ?, ?, ?)',
+            [(window.tg_user_id, window.window_seconds, window.window_start, window.current_count, window.previous_count) for window in windows]
+        )
+        await limits_db.execute(f'DELETE FROM {TABLE_NAME} WHERE window_start + 2 * window_seconds <= ?', (now,))
+        await limits_db.commit()
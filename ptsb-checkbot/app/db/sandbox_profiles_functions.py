@@ -2,29 +2,22 @@
 import os
 
 # встроенные классы
+from datetime import datetime
 from dataclasses import dataclass
-from typing import Union
+from typing import Optional, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-# устанавливаемые либы
-import aiosqlite
+# самописные либы
+from app.db import database
+from app.db import users_cache
 
 
-# задаем путь до БД приложения
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-DB_DIR = os.path.join(PROJECT_ROOT, "database")
-DB_NAME = "kernel_base.db"
-FULL_PATH_TO_KERNEL_DB = os.path.join(DB_DIR, DB_NAME)
-
-# инициализируем директорию к БД и саму по себе БД
-if not os.path.exists(DB_DIR):
-    os.mkdir(DB_DIR)
-if not os.path.exists(FULL_PATH_TO_KERNEL_DB):
-    with open(FULL_PATH_TO_KERNEL_DB, "w"):
-        pass
-
 # название таблицы для этого модуля
 TABLE_NAME = "sandbox_profiles"
 
+# часовой пояс, по которому считаются сутки для проверок пользователей без своего часового пояса
+QUOTA_TIMEZONE = os.getenv('QUOTA_TIMEZONE') or "Europe/Moscow"
+
 # самописные классы
 @dataclass
 class UserProfileFromDb:
@@ -37,6 +30,78 @@ class UserProfileFromDb:
     total_checks: int
     check_priority: int
     can_get_links: bool
+    timezone: Optional[str] = None
+    burst_limit: Optional[int] = None
+    hourly_limit: Optional[int] = None
+    daily_limit: Optional[int] = None
+
+
+# функция проверки названия часового пояса
+def is_valid_timezone(timezone_name: str) -> bool:
+    """
+    Проверяет, что часовой пояс с таким названием существует (например, `Europe/Moscow`)
+
+    Принимает:
+        - `timezone_name` (str): название часового пояса из базы IANA
+
+    Возвращает:
+        `bool`: существует ли такой часовой пояс.
+    """
+
+    try:
+        ZoneInfo(timezone_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+# функция получения текущих суток пользователя, за которые считаются его проверки
+def current_quota_window(timezone_name: Optional[str]) -> str:
+    """
+    Возвращает дату текущих суток в часовом поясе пользователя. Проверки пользователя восстанавливаются лениво:
+    при первом обращении в новых сутках, а не общим обновлением всей таблицы в полночь.
+
+    Принимает:
+        - `timezone_name` (str): часовой пояс пользователя, `None` - часовой пояс по умолчанию `QUOTA_TIMEZONE`
+
+    Возвращает:
+        - `str`: дата текущих суток в формате `YYYY-MM-DD`
+    """
+
+    if not timezone_name or not is_valid_timezone(timezone_name):
+        timezone_name = QUOTA_TIMEZONE
+    return datetime.now(ZoneInfo(timezone_name)).date().isoformat()
+
+
+# функция сборки профиля из строки таблицы
+def profile_from_row(data: tuple) -> UserProfileFromDb:
+    """
+    Собирает профиль из строки таблицы `sandbox_profiles`. Если сутки пользователя сменились с последнего списания,
+    в профиле сразу отражается полный лимит проверок, хотя в БД он запишется только при следующем списании.
+
+    Принимает:
+        - `data` (tuple): строка таблицы `sandbox_profiles` в порядке колонок таблицы
+
+    Возвращает:
+        - `UserProfileFromDb` (object of custom class): профиль как объект класса
+    """
+
+    remaining_checks = data[2]
+    if data[7] != current_quota_window(data[6]):
+        remaining_checks = data[1]
+
+    return UserProfileFromDb(
+        tg_user_id=data[0],
+        max_available_checks=data[1],
+        remaining_checks=remaining_checks,
+        total_checks=data[3],
+        check_priority=data[4],
+        can_get_links=bool(data[5]),
+        timezone=data[6],
+        burst_limit=data[8],
+        hourly_limit=data[9],
+        daily_limit=data[10]
+    )
 
 
 # функция инициализации таблицы с профилями подключения к песочнице и бла бла бла
@@ -45,15 +110,20 @@ async def create_table_if_not_exists() -> None:
     Создает таблицу `sandbox_profiles` если ее еще не существует в БД приложения
     """
 
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as db:
+    async with database.connect() as db:
         await db.execute(f"""
             CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
-                tg_user_id INTEGER,
+                tg_user_id INTEGER PRIMARY KEY,
                 max_available_checks INTEGER,
                 remaining_checks INTEGER,
                 total_checks INTEGER,
                 check_priority INTEGER,
-                can_get_links INTEGER
+                can_get_links INTEGER,
+                timezone TEXT,
+                quota_window_start TEXT,
+                burst_limit INTEGER,
+                hourly_limit INTEGER,
+                daily_limit INTEGER
             )
         """)
 
@@ -63,7 +133,11 @@ async def add_new_profile(
     tg_user_id: int,
     max_available_checks: int,
     check_priority: int,
-    can_get_links: int
+    can_get_links: int,
+    timezone: Optional[str] = None,
+    burst_limit: Optional[int] = None,
+    hourly_limit: Optional[int] = None,
+    daily_limit: Optional[int] = None
     ) -> None:
     """
     Добавляет новый профиль пользователя в таблицу `sandbox_profiles` у БД приложения
@@ -73,9 +147,11 @@ async def add_new_profile(
         - `max_available_checks` (int): Количество проверок, доступное в один день 
         - `check_priority` (int): Приоритет проверки пользователя [1, 4]
         - `can_get_links` (int): Может ли получать ссылки на проверенные задания `0` - нет, `1` - да
+        - `timezone` (str): Часовой пояс пользователя, по которому считаются сутки, `None` - часовой пояс по умолчанию
+        - `burst_limit`, `hourly_limit`, `daily_limit` (int): Ограничения частоты отправки заданий, `0` - без ограничения, `None` - значения по умолчанию
     """
 
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as profiles_db:
+    async with database.connect() as profiles_db:
         await profiles_db.execute(f"""
             INSERT INTO {TABLE_NAME} (
                 tg_user_id,
@@ -83,13 +159,20 @@ async def add_new_profile(
                 remaining_checks,
                 total_checks,
                 check_priority,
-                can_get_links
-            ) VALUES (?, ?, ?, ?, ?, ?)
-        """, (tg_user_id,  max_available_checks, max_available_checks, 0, check_priority, can_get_links)
+                can_get_links,
+                timezone,
+                quota_window_start,
+                burst_limit,
+                hourly_limit,
+                daily_limit
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (tg_user_id,  max_available_checks, max_available_checks, 0, check_priority, can_get_links, timezone, current_quota_window(timezone), burst_limit, hourly_limit, daily_limit)
         )
         
         await profiles_db.commit()
 
+    users_cache.invalidate(tg_user_id)
+
 
 # функция получения профиля пользователя взаимодействия с песочницей
 async def get_profile_entity(
@@ -106,19 +189,12 @@ async def get_profile_entity(
         - `None`, если профиля с `tg_user_id` не существует 
     """
 
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as profiles_db:
+    async with database.connect() as profiles_db:
         cursor = await profiles_db.execute(f'SELECT * FROM {TABLE_NAME} WHERE tg_user_id = ?', (tg_user_id,))
         data = await cursor.fetchone()
 
         if data is not None:
-            return UserProfileFromDb(
-                tg_user_id=data[0],
-                max_available_checks=data[1],
-                remaining_checks=data[2],
-                total_checks=data[3],
-                check_priority=data[4],
-                can_get_links=bool(data[5])
-            )
+            return profile_from_row(data)
         else:
             return None
 
@@ -132,95 +208,101 @@ async def delete_profile_by_id(tg_user_id: int) -> None:
         - `tg_user_id` (int): TG ID пользователя, которого нужно удалить
     """
 
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as profiles_db:
+    async with database.connect() as profiles_db:
         await profiles_db.execute(f'DELETE FROM {TABLE_NAME} WHERE tg_user_id = ?', (tg_user_id,))
         await profiles_db.commit()
 
+    users_cache.invalidate(tg_user_id)
 
-# функция для уменьшения remaining_cheks на 1 в результате успешной загрузки чего-либо на проверку
-async def decrease_remaining_checks(tg_user_id: int, decrease_amount: int) -> bool:
+
+# функция резервирования проверок перед отправкой задания в песочницу
+async def reserve_checks(tg_user_id: int, amount: int = 1) -> Union[None, int]:
     """
-    Уменьшает количество оставшихся проверок для конкретноого пользователя из таблицы `sandbox_profiles`
+    Атомарно списывает проверки из оставшихся на сегодня у пользователя из таблицы `sandbox_profiles`.
+    Списание и проверка остатка выполняются одним запросом, поэтому одновременные отправки не могут потратить больше, чем есть.
+    Если у пользователя начались новые сутки, перед списанием ему восстанавливается полный лимит проверок.
+    Если задание создать не удалось, проверки нужно вернуть через `refund_checks`, а если удалось - зафиксировать через `commit_checks`.
 
     Принимает:
-        - `tg_user_id` (int): TG ID пользователя для профиля которого нужно уменьшить 
-        - `decrease_amount` (int): на сколько нужно уменьшить кол-во проверок для юзера
+        - `tg_user_id` (int): TG ID пользователя, у которого списываются проверки
+        - `amount` (int): сколько проверок списать
 
     Возвращает:
-        `bool`: удалось ли выполнить операцию или нет.
+        - `int`: сколько проверок осталось после списания
+        - `None`, если проверок не хватает или профиля не существует
     """
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as profiles_db:
-        # получаем юзера, для которого уменьшаем количество проверок
-        row = await profiles_db.execute(
-            f'SELECT remaining_checks FROM {TABLE_NAME} WHERE tg_user_id = ?',
-            (tg_user_id,)
-        )
-        data = await row.fetchone()
 
+    async with database.connect() as profiles_db:
+        # сутки зависят от часового пояса пользователя, поэтому их считаем здесь, а не в SQLite
+        cursor = await profiles_db.execute(f'SELECT timezone FROM {TABLE_NAME} WHERE tg_user_id = ?', (tg_user_id,))
+        data = await cursor.fetchone()
         if data is None:
-            return False
-
-        # уменьшаем количество проверок, но если уходим ниже 0, на всякий случай делаем 0. защита.
-        new_checks = max(data[0] - decrease_amount, 0)
-
-        # уменьшаем количество проверок
-        await profiles_db.execute(
-            f'UPDATE {TABLE_NAME} SET remaining_checks = ? WHERE tg_user_id = ?',
-            (new_checks, tg_user_id)
+            return None
+        quota_window = current_quota_window(data[0])
+
+        # остаток за прошлые сутки не учитываем, считаем от полного лимита
+        cursor = await profiles_db.execute(f"""
+            UPDATE {TABLE_NAME}
+            SET remaining_checks = (
+                    CASE WHEN quota_window_start IS ? THEN remaining_checks ELSE max_available_checks END
+                ) - ?,
+                quota_window_start = ?
+            WHERE tg_user_id = ?
+                AND (CASE WHEN quota_window_start IS ? THEN remaining_checks ELSE max_available_checks END) >= ?
+            RETURNING remaining_checks
+        """, (quota_window, amount, quota_window, tg_user_id, quota_window, amount)
         )
+        data = await cursor.fetchone()
         await profiles_db.commit()
 
-    return True
-    
+    users_cache.invalidate(tg_user_id)
+    return data[0] if data is not None else None
 
-# функция увеличения общего количества проверок
-async def increase_total_checks(tg_user_id: int, increase_amount: int) -> bool:
+
+# функция фиксации зарезервированных проверок после успешного создания задания
+async def commit_checks(tg_user_id: int, amount: int = 1) -> bool:
     """
-    Увеличивает суммарное количество проверок для конкретноого пользователя из таблицы `sandbox_profiles`
+    Учитывает зарезервированные через `reserve_checks` проверки в общем счетчике проверок пользователя
 
     Принимает:
-        - `tg_user_id` (int): TG ID пользователя для профиля которого нужно уменьшить 
-        - `increase_amount` (int): на сколько нужно увеличить общее кол-во
+        - `tg_user_id` (int): TG ID пользователя
+        - `amount` (int): сколько проверок было потрачено
 
     Возвращает:
         `bool`: удалось ли выполнить операцию или нет.
     """
 
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as profiles_db:
-        row = await profiles_db.execute(
-            f'SELECT total_checks FROM {TABLE_NAME} WHERE tg_user_id = ?',
-            (tg_user_id,)
-        )
-        data = await row.fetchone()
-
-        if data is None:
-            return False
-        
-        new_value = data[0] + 1
-
-        await profiles_db.execute(
-            f'UPDATE {TABLE_NAME} SET total_checks = ? WHERE tg_user_id = ?',
-            (new_value,tg_user_id)
+    async with database.connect() as profiles_db:
+        cursor = await profiles_db.execute(
+            f'UPDATE {TABLE_NAME} SET total_checks = total_checks + ? WHERE tg_user_id = ?',
+            (amount, tg_user_id)
         )
         await profiles_db.commit()
-    
-    return True
+
+    users_cache.invalidate(tg_user_id)
+    return cursor.rowcount > 0
 
 
-# функция восстановления количества попыток каждый день
-async def daily_reset_remaining_checks() -> None:
+# функция возврата зарезервированных проверок, если задание создать не удалось
+async def refund_checks(tg_user_id: int, amount: int = 1) -> bool:
     """
-    Раз в `UPDATE_TIME` секунд восстанавливает всем попытки
+    Возвращает пользователю зарезервированные через `reserve_checks` проверки. Остаток не превышает суточный лимит,
+    даже если проверки успели обновиться между резервированием и возвратом.
+
+    Принимает:
+        - `tg_user_id` (int): TG ID пользователя
+        - `amount` (int): сколько проверок вернуть
+
+    Возвращает:
+        `bool`: удалось ли выполнить операцию или нет.
     """
 
-    try:
-        async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as profiles_db:
-            await profiles_db.execute(f"""
-                UPDATE {TABLE_NAME}
-                set remaining_checks = max_available_checks
-            """)
-            
-            await profiles_db.commit()
-
-    except Exception as e:
-        print(f"Возникла ошибка при обновлении статусов пользователям: {e}")
\ No newline at end of file
+    async with database.connect() as profiles_db:
+        cursor = await profiles_db.execute(
+            f'UPDATE {TABLE_NAME} SET remaining_checks = MIN(remaining_checks + ?, max_available_checks) WHERE tg_user_id = ?',
+            (amount, tg_user_id)
+        )
+        await profiles_db.commit()
+
+    users_cache.invalidate(tg_user_id)
+    return cursor.rowcount > 0
@@ -0,0 +1,318 @@
+# встроенные либы
+import json
+import time
+import uuid
+
+# встроенные классы
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+# самописные либы
+from app.db import database
+
+
+# название таблицы для этого модуля
+TABLE_NAME = "submission_jobs"
+
+# статусы заданий на отправку
+JOB_STATUS_PENDING = "pending"          # проверка зарезервирована, задание ждет загрузки в песочницу
+JOB_STATUS_UPLOADING = "uploading"      # задание загружается в песочницу
+JOB_STATUS_SUBMITTED = "submitted"      # задание создано в песочнице, ждем результатов проверки
+JOB_STATUS_DONE = "done"                # результат задания из пачки файлов готов и ждет остальных заданий пачки
+
+# самописные классы
+@dataclass
+class SubmissionJobFromDb:
+    """
+    Класс, возвращающий задание на отправку в песочницу из таблицы `submission_jobs`
+    """
+    job_id: str
+    tg_user_id: int
+    chat_id: int
+    user_role: str
+    scan_type: str
+    check_priority: int
+    can_get_links: bool
+    passwords: list[str] = field(default_factory=list)
+    url: Optional[str] = None
+    file_path: Optional[str] = None
+    tg_file_path: Optional[str] = None
+    file_name: Optional[str] = None
+    file_size: Optional[int] = None
+    file_unique_id: Optional[str] = None
+    file_sha256: Optional[str] = None
+    status: str = JOB_STATUS_PENDING
+    attempts: int = 0
+    scan_id: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    batch_id: Optional[str] = None
+    result: Optional[str] = None
+    ptsb_node: Optional[str] = None
+
+
+# функция генерации ID задания
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+# функция инициализации таблицы с заданиями на отправку
+async def create_table_if_not_exists() -> None:
+    """
+    Создает таблицу `submission_jobs` если ее еще не существует в БД приложения
+    """
+
+    async with database.connect() as db:
+        await db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+                job_id TEXT PRIMARY KEY,
+                tg_user_id INTEGER,
+                chat_id INTEGER,
+                user_role TEXT,
+                scan_type TEXT,
+                check_priority INTEGER,
+                can_get_links INTEGER,
+                passwords TEXT,
+                url TEXT,
+                file_path TEXT,
+                tg_file_path TEXT,
+                file_name TEXT,
+                file_size INTEGER,
+                file_unique_id TEXT,
+                file_sha256 TEXT,
+                status TEXT,
+                attempts INTEGER,
+                scan_id TEXT,
+                created_at REAL,
+                updated_at REAL,
+                batch_id TEXT,
+                result TEXT,
+                ptsb_node TEXT
+            )
+        """)
+        await db.execute(f'CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_scan_id ON {TABLE_NAME} (scan_id)')
+
+
+# функция преобразования строки таблицы в задание
+def _job_from_row(data: tuple) -> SubmissionJobFromDb:
+    return SubmissionJobFromDb(
+        job_id=data[0],
+        tg_user_id=data[1],
+        chat_id=data[2],
+        user_role=data[3],
+        scan_type=data[4],
+        check_priority=data[5],
+        can_get_links=bool(data[6]),
+        passwords=json.loads(data[7]) if data[7] else [],
+        url=data[8],
+        file_path=data[9],
+        tg_file_path=data[10],
+        file_name=data[11],
+        file_size=data[12],
+        file_unique_id=data[13],
+        file_sha256=data[14],
+        status=data[15],
+        attempts=data[16],
+        scan_id=data[17],
+        created_at=data[18],
+        updated_at=data[19],
+        batch_id=data[20],
+        result=data[21],
+        ptsb_node=data[22]
+    )
+
+
+# функция сохранения нового задания
+async def add_job(job: SubmissionJobFromDb) -> bool:
+    """
+    Сохраняет задание на отправку. Задание с уже существующим `job_id` повторно не сохраняется.
+
+    Принимает:
+        - `job` (SubmissionJobFromDb): задание на отправку
+
+    Возвращает:
+        - `True`, если задание сохранено
+        - `False`, если задание с таким `job_id` уже есть
+    """
+
+    async with database.connect() as jobs_db:
+        cursor = await jobs_db.execute(f"""
+            INSERT OR IGNORE INTO {TABLE_NAME} (
+                job_id, tg_user_id, chat_id, user_role, scan_type, check_priority, can_get_links, passwords,
+                url, file_path, tg_file_path, file_name, file_size, file_unique_id, file_sha256,
+                status, attempts, scan_id, created_at, updated_at, batch_id, result, ptsb_node
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                job.job_id, job.tg_user_id, job.chat_id, job.user_role, job.scan_type, job.check_priority, int(job.can_get_links),
+                json.dumps(job.passwords, ensure_ascii=False), job.url, job.file_path, job.tg_file_path, job.file_name,
+                job.file_size, job.file_unique_id, job.file_sha256, job.status, job.attempts, job.scan_id, job.created_at, job.updated_at,
+                job.batch_id, job.result, job.ptsb_node
+            )
+        )
+        await jobs_db.commit()
+
+    return cursor.rowcount > 0
+
+
+# функция отметки начала загрузки задания
+async def mark_uploading(job_id: str) -> Union[None, int]:
+    """
+    Отмечает, что задание начало загружаться в песочницу, и увеличивает счетчик попыток
+
+    Принимает:
+        - `job_id` (str): ID задания
+
+    Возвращает:
+        - `int`: номер текущей попытки загрузки
+        - `None`, если задания уже нет
+    """
+
+    async with database.connect() as jobs_db:
+        cursor = await jobs_db.execute(
+            f'UPDATE {TABLE_NAME} SET status = ?, attempts = attempts + 1, updated_at = ? WHERE job_id = ? RETURNING attempts',
+            (JOB_STATUS_UPLOADING, time.time(), job_id)
+        )
+        data = await cursor.fetchone()
+        await jobs_db.commit()
+
+    return data[0] if data is not None else None
+
+
+# функция отметки успешного создания задания в песочнице
+async def mark_submitted(job_id: str, scan_id: str, file_sha256: Optional[str] = None, ptsb_node: Optional[str] = None) -> None:
+    """
+    Отмечает, что задание создано в песочнице. Путь к локальному файлу стирается, после этого файл можно удалить:
+    до этого момента при перезапуске бота задание загружается повторно из того же файла.
+
+    Принимает:
+        - `job_id` (str): ID задания
+        - `scan_id` (str): ID задания в песочнице
+        - `file_sha256` (str): SHA-256 файла, если он стал известен при загрузке
+        - `ptsb_node` (str): адрес узла песочницы, на котором создано задание
+    """
+
+    async with database.connect() as jobs_db:
+        await jobs_db.execute(
+            f'UPDATE {TABLE_NAME} SET status = ?, scan_id = ?, ptsb_node = ?, file_sha256 = COALESCE(?, file_sha256), file_path = NULL, updated_at = ? WHERE job_id = ?',
+            (JOB_STATUS_SUBMITTED, scan_id, ptsb_node, file_sha256, time.time(), job_id)
+        )
+        await jobs_db.commit()
+
+
+# функция удаления задания
+async def delete_job(job_id: str) -> None:
+    """
+    Удаляет задание на отправку
+
+    Принимает:
+        - `job_id` (str): ID задания
+    """
+
+    async with database.connect() as jobs_db:
+        await jobs_db.execute(f'DELETE FROM {TABLE_NAME} WHERE job_id = ?', (job_id,))
+        await jobs_db.commit()
+
+
+# функция получения заданий, которые ждут результатов проверки
+async def get_jobs_by_scan_id(scan_id: str) -> list[SubmissionJobFromDb]:
+    """
+    Возвращает задания, которые ждут результатов проверки по ID задания в песочнице.
+    Таких заданий может быть несколько, если к проверке присоединились такие же задания других пользователей.
+
+    Принимает:
+        - `scan_id` (str): ID задания в песочнице
+
+    Возвращает:
+        - `list[SubmissionJobFromDb]` (list): задания в порядке создания
+    """
+
+    async with database.connect() as jobs_db:
+        cursor = await jobs_db.execute(
+            f'SELECT * FROM {TABLE_NAME} WHERE scan_id = ? AND status = ? ORDER BY created_at',
+            (scan_id, JOB_STATUS_SUBMITTED)
+        )
+        rows = await cursor.fetchall()
+
+    return [_job_from_row(row) for row in rows]
+
+
+# функция сохранения результата задания из пачки файлов
+async def complete_job(job_id: str, result: str) -> None:
+    """
+    Сохраняет строку общего отчета по заданию из пачки файлов, пока пачка ждет остальных результатов
+
+    Принимает:
+        - `job_id` (str): ID задания
+        - `result` (str): строка отчета по файлу
+    """
+
+    async with database.connect() as jobs_db:
+        await jobs_db.execute(
+            f'UPDATE {TABLE_NAME} SET status = ?, result = ?, file_path = NULL, updated_at = ? WHERE job_id = ?',
+            (JOB_STATUS_DONE, result, time.time(), job_id)
+        )
+        await jobs_db.commit()
+
+
+# функция завершения пачки файлов
+async def finish_batch(batch_id: str) -> Union[None, list[SubmissionJobFromDb]]:
+    """
+    Удаляет задания пачки файлов, если результаты готовы по всем ее заданиям. Проверка и удаление выполняются
+    одним запросом, поэтому общий отчет по пачке отправляется ровно один раз, даже если последние результаты пришли одновременно.
+
+    Принимает:
+        - `batch_id` (str): ID пачки файлов
+
+    Возвращает:
+        - `list[SubmissionJobFromDb]` (list): задания пачки с их результатами в порядке создания
+        - `None`, если пачка еще не готова или уже завершена
+    """
+
+    async with database.connect() as jobs_db:
+        cursor = await jobs_db.execute(f"""
+            DELETE FROM {TABLE_NAME}
+            WHERE batch_id = ? AND NOT EXISTS (
+                SELECT 1 FROM {TABLE_NAME} WHERE batch_id = ? AND status != ?
+            )
+            RETURNING *
+        """, (batch_id, batch_id, JOB_STATUS_DONE))
+        rows = await cursor.fetchall()
+        await jobs_db.commit()
+
+    if not rows:
+        return None
+
+    return sorted((_job_from_row(row) for row in rows), key=lambda job: job.created_at)
+
+
+# функция получения незавершенных заданий
+async def get_unfinished_jobs() -> list[SubmissionJobFromDb]:
+    """
+    Возвращает все задания, которые остались незавершенными, например после перезапуска бота
+
+    Возвращает:
+        - `list[SubmissionJobFromDb]` (list): задания в порядке создания
+    """
+
+    async with database.connect() as jobs_db:
+        cursor = await jobs_db.execute(f'SELECT * FROM {TABLE_NAME} ORDER BY created_at')
+        rows = await cursor.fetchall()
+
+    return [_job_from_row(row) for row in rows]
+
+
+# функция получения файлов, которые еще нужны заданиям
+async def get_referenced_files() -> set[str]:
+    """
+    Возвращает пути к локальным файлам, которые еще не загружены в песочницу
+
+    Возвращает:
+        - `set[str]` (set): пути к файлам
+    """
+
+    async with database.connect() as jobs_db:
+        cursor = await jobs_db.execute(f'SELECT file_path FROM {TABLE_NAME} WHERE file_path IS NOT NULL')
+        rows = await cursor.fetchall()
+
+    return {row[0] for row in rows}
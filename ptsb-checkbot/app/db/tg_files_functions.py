@@ -0,0 +1,105 @@
+# встроенные либы
+import os
+import time
+
+# встроенные классы
+from dataclasses import dataclass
+from typing import Union
+
+# самописные либы
+from app.db import database
+
+
+# название таблицы для этого модуля
+TABLE_NAME = "tg_files"
+
+# сколько файлов ТГ помнить, самые давно не использованные вытесняются
+TG_FILES_CACHE_MAX_SIZE = int(os.getenv('TG_FILES_CACHE_MAX_SIZE') or 10_000)
+
+# самописные классы
+@dataclass
+class KnownTgFileFromDb:
+    """
+    Класс, возвращающий ранее обработанный файл ТГ из таблицы `tg_files`
+    """
+    file_unique_id: str
+    sha256: str
+    last_used_at: float
+
+
+# функция инициализации таблицы с обработанными файлами ТГ
+async def create_table_if_not_exists() -> None:
+    """
+    Создает таблицу `tg_files` если ее еще не существует в БД приложения
+    """
+
+    async with database.connect() as db:
+        await db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+                file_unique_id TEXT PRIMARY KEY,
+                sha256 TEXT,
+                last_used_at REAL
+            )
+        """)
+
+
+# функция получения ранее обработанного файла ТГ
+async def get_known_file(file_unique_id: str) -> Union[None, KnownTgFileFromDb]:
+    """
+    Возвращает ранее скачанный ботом файл ТГ по его `file_unique_id` и отмечает его как недавно использованный
+
+    Принимает:
+        - `file_unique_id` (str): уникальный ID файла в ТГ, одинаковый для всех пересылок этого файла
+
+    Возвращает:
+        - `KnownTgFileFromDb` (object of custom class): файл с его SHA-256
+        - `None`, если файл еще не встречался или был вытеснен
+    """
+
+    async with database.connect() as files_db:
+        cursor = await files_db.execute(
+            f'UPDATE {TABLE_NAME} SET last_used_at = ? WHERE file_unique_id = ? RETURNING *',
+            (time.time(), file_unique_id)
+        )
+        data = await cursor.fetchone()
+        await files_db.commit()
+
+        if data is not None:
+            return KnownTgFileFromDb(
+                file_unique_id=data[0],
+                sha256=data[1],
+                last_used_at=data[2]
+            )
+        else:
+            return None
+
+
+# функция запоминания скачанного файла ТГ
+async def remember_file(file_unique_id: str, sha256: str) -> None:
+    """
+    Запоминает соответствие `file_unique_id` и SHA-256 скачанного файла. Если файлов больше `TG_FILES_CACHE_MAX_SIZE`,
+    удаляет самые давно не использованные.
+
+    Принимает:
+        - `file_unique_id` (str): уникальный ID файла в ТГ
+        - `sha256` (str): SHA-256 содержимого файла
+    """
+
+    async with database.connect() as files_db:
+        await files_db.execute(f"""
+            INSERT INTO {TABLE_NAME} (file_unique_id, sha256, last_used_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(file_unique_id) DO UPDATE SET sha256 = excluded.sha256, last_used_at = excluded.last_used_at
+        """, (file_unique_id, sha256, time.time())
+        )
+
+        # вытесняем всё, что не влезает в лимит, начиная с самых старых
+        await files_db.execute(f"""
+            DELETE FROM {TABLE_NAME} WHERE file_unique_id IN (
+                SELECT file_unique_id FROM {TABLE_NAME}
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (TG_FILES_CACHE_MAX_SIZE,)
+        )
+        await files_db.commit()
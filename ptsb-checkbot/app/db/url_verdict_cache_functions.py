@@ -0,0 +1,209 @@
+# встроенные либы
+import os
+import time
+
+# встроенные классы
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Union
+
+# самописные либы
+from app.db import database
+
+# самописные классы
+from app.api.ptsb_client import GetScanResust
+
+
+# название таблицы для этого модуля
+TABLE_NAME = "url_verdict_cache"
+
+# сколько секунд хранится вердикт по ссылке в зависимости от его типа, 0 - не кэшировать вердикты такого типа
+# содержимое по ссылке меняется чаще, чем файл, поэтому сроки короче, чем у вердиктов по файлам
+URL_VERDICT_CACHE_TTL = {
+    "CLEAN": int(os.getenv('URL_VERDICT_CACHE_TTL_CLEAN') or 6 * 60 * 60),
+    "UNWANTED": int(os.getenv('URL_VERDICT_CACHE_TTL_UNWANTED') or 24 * 60 * 60),
+    "DANGEROUS": int(os.getenv('URL_VERDICT_CACHE_TTL_DANGEROUS') or 7 * 24 * 60 * 60),
+}
+
+# сколько вердиктов по ссылкам держать в памяти, самые давно не использованные вытесняются
+URL_VERDICT_CACHE_LRU_SIZE = int(os.getenv('URL_VERDICT_CACHE_LRU_SIZE') or 1000)
+
+# самописные классы
+@dataclass
+class CachedUrlVerdictFromDb:
+    """
+    Класс, возвращающий сохраненный вердикт по ссылке из таблицы `url_verdict_cache`
+    """
+    url: str
+    scan_id: str
+    scan_state_code: str
+    verdict_code: str
+    threat: str
+    created_at: float
+    expires_at: float
+    ptsb_node: Optional[str] = None
+
+
+# недавно использованные вердикты, чтобы повторные ссылки из одной рассылки не ходили в БД
+_hot_verdicts: OrderedDict[str, CachedUrlVerdictFromDb] = OrderedDict()
+
+
+# функция запоминания вердикта в памяти
+def _remember_hot(cached_verdict: CachedUrlVerdictFromDb) -> None:
+    _hot_verdicts[cached_verdict.url] = cached_verdict
+    _hot_verdicts.move_to_end(cached_verdict.url)
+    while len(_hot_verdicts) > URL_VERDICT_CACHE_LRU_SIZE:
+        _hot_verdicts.popitem(last=False)
+
+
+# функция инициализации таблицы с кэшем вердиктов по ссылкам
+async def create_table_if_not_exists() -> None:
+    """
+    Создает таблицу `url_verdict_cache` если ее еще не существует в БД приложения
+    """
+
+    async with database.connect() as db:
+        await db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+                url TEXT PRIMARY KEY,
+                scan_id TEXT,
+                scan_state_code TEXT,
+                verdict_code TEXT,
+                threat TEXT,
+                created_at REAL,
+                expires_at REAL,
+                ptsb_node TEXT
+            )
+        """)
+        await db.execute(f'CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_expires_at ON {TABLE_NAME} (expires_at)')
+
+
+# функция сохранения вердикта по ссылке
+async def save_verdict(
+        url: str,
+        scan_id: str,
+        scan_results: GetScanResust,
+        ptsb_node: Optional[str] = None
+    ) -> bool:
+    """
+    Сохраняет вердикт по ссылке в таблицу `url_verdict_cache`. Сохраняются только окончательные вердикты:
+    проверка выполнена полностью и без ошибок, а для такого типа вердикта задан ненулевой срок хранения.
+    Заодно удаляются устаревшие вердикты.
+
+    Принимает:
+        - `url` (str): каноническая ссылка (`urls.canonicalize_url`)
+        - `scan_id` (str): ID задания, по которому получен вердикт
+        - `scan_results` (GetScanResust): результаты проверки
+        - `ptsb_node` (str): адрес узла песочницы, на котором создано задание
+
+    Возвращает:
+        `bool`: был ли сохранен вердикт.
+    """
+
+    # частичные проверки и проверки с ошибками не кэшируем, такую ссылку стоит проверить еще раз
+    if scan_results.scan_state_code != "FULL" or scan_results.scan_error:
+        return False
+
+    ttl = URL_VERDICT_CACHE_TTL.get(scan_results.verdict_code, 0)
+    if ttl <= 0:
+        return False
+
+    created_at = time.time()
+    cached_verdict = CachedUrlVerdictFromDb(
+        url=url,
+        scan_id=scan_id,
+        scan_state_code=scan_results.scan_state_code,
+        verdict_code=scan_results.verdict_code,
+        threat=scan_results.threat,
+        created_at=created_at,
+        expires_at=created_at + ttl,
+        ptsb_node=ptsb_node
+    )
+
+    async with database.connect() as cache_db:
+        await cache_db.execute(f"""
+            INSERT OR REPLACE INTO {TABLE_NAME} (
+                url,
+                scan_id,
+                scan_state_code,
+                verdict_code,
+                threat,
+                created_at,
+                expires_at,
+                ptsb_node
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (url, scan_id, cached_verdict.scan_state_code, cached_verdict.verdict_code, cached_verdict.threat, created_at, cached_verdict.expires_at, ptsb_node)
+        )
+        await cache_db.execute(f'DELETE FROM {TABLE_NAME} WHERE expires_at <= ?', (created_at,))
+        await cache_db.commit()
+
+    _remember_hot(cached_verdict)
+    return True
+
+
+# функция получения актуального вердикта по ссылке
+async def get_fresh_verdict(url: str) -> Union[None, CachedUrlVerdictFromDb]:
+    """
+    Возвращает сохраненный вердикт по ссылке, если срок его хранения еще не истек.
+    Сначала вердикт ищется в памяти, затем в БД.
+
+    Принимает:
+        - `url` (str): каноническая ссылка (`urls.canonicalize_url`)
+
+    Возвращает:
+        - `CachedUrlVerdictFromDb` (object of custom class): сохраненный вердикт
+        - `None`, если вердикта нет или он устарел
+    """
+
+    now = time.time()
+
+    cached_verdict = _hot_verdicts.get(url)
+    if cached_verdict is not None:
+        if cached_verdict.expires_at > now:
+            _hot_verdicts.move_to_end(url)
+            return cached_verdict
+        del _hot_verdicts[url]
+
+    async with database.connect() as cache_db:
+        cursor = await cache_db.execute(
+            f'SELECT * FROM {TABLE_NAME} WHERE url = ? AND expires_at > ?',
+            (url, now)
+        )
+        data = await cursor.fetchone()
+
+    if data is None:
+        return None
+
+    cached_verdict = CachedUrlVerdictFromDb(
+        url=data[0],
+        scan_id=data[1],
+        scan_state_code=data[2],
+        verdict_code=data[3],
+        threat=data[4],
+        created_at=data[5],
+        expires_at=data[6],
+        ptsb_node=data[7]
+    )
+    _remember_hot(cached_verdict)
+    return cached_verdict
+
+
+# функция удаления вердикта, чтобы ссылка была проверена заново
+async def delete_verdict(url: str) -> bool:
+    """
+    Удаляет сохраненный вердикт по ссылке. Следующая отправка этой ссылки создаст новое задание в PTSB.
+
+    Принимает:
+        - `url` (str): каноническая ссылка (`urls.canonicalize_url`)
+
+    Возвращает:
+        `bool`: был ли найден и удален вердикт.
+    """
+
+    _hot_verdicts.pop(url, None)
+
+    async with database.connect() as cache_db:
+        cursor = await cache_db.execute(f'DELETE FROM {TABLE_NAME} WHERE url = ?', (url,))
+        await cache_db.commit()
+
+    return cursor.rowcount > 0
@@ -0,0 +1,105 @@
+# встроенные либы
+import os
+import time
+
+# встроенные классы
+from collections import OrderedDict
+from typing import Any
+
+
+# параметры кэша пользователей
+USERS_CACHE_MAX_SIZE = int(os.getenv('USERS_CACHE_MAX_SIZE') or 10_000)    # сколько пользователей держать в памяти, самые давно не использованные вытесняются
+USERS_CACHE_TTL = float(os.getenv('USERS_CACHE_TTL') or 5 * 60)            # через сколько секунд перечитывать пользователя из БД, даже если его не меняли через бота
+
+# маркер отсутствия пользователя в кэше, т.к. None - валидное закэшированное значение
+MISSING = object()
+
+# закэшированные пользователи: tg_user_id -> (время сохранения, значение)
+_cache: OrderedDict[int, tuple[float, Any]] = OrderedDict()
+
+# номер поколения кэша, увеличивается при каждом изменении пользователей
+_generation: int = 0
+
+
+# функция получения номера поколения кэша
+def current_generation() -> int:
+    """
+    Возвращает номер поколения кэша. Его нужно запомнить перед чтением из БД и передать в `put`,
+    чтобы не сохранить в кэш данные, которые успели измениться, пока шел запрос.
+
+    Возвращает:
+        - `int`: номер поколения кэша
+    """
+    return _generation
+
+
+# функция получения пользователя из кэша
+def get(tg_user_id: int) -> Any:
+    """
+    Возвращает закэшированное значение для пользователя
+
+    Принимает:
+        - `tg_user_id` (int): TG ID пользователя
+
+    Возвращает:
+        - закэшированное значение
+        - `MISSING`, если значения нет или оно устарело
+    """
+
+    cached = _cache.get(tg_user_id)
+    if cached is None:
+        return MISSING
+
+    cached_at, value = cached
+    if time.monotonic() - cached_at > USERS_CACHE_TTL:
+        _cache.pop(tg_user_id, None)
+        return MISSING
+
+    _cache.move_to_end(tg_user_id)
+    return value
+
+
+# функция сохранения пользователя в кэш
+def put(tg_user_id: int, value: Any, generation: int) -> None:
+    """
+    Сохраняет значение для пользователя в кэш, если с момента чтения из БД пользователи не менялись
+
+    Принимает:
+        - `tg_user_id` (int): TG ID пользователя
+        - `value` (Any): значение, прочитанное из БД
+        - `generation` (int): номер поколения кэша, полученный через `current_generation` до чтения из БД
+    """
+
+    if generation != _generation:
+        return
+
+    _cache[tg_user_id] = (time.monotonic(), value)
+    _cache.move_to_end(tg_user_id)
+    while len(_cache) > USERS_CACHE_MAX_SIZE:
+        _cache.popitem(last=False)
+
+
+# функция сброса пользователя из кэша
+def invalidate(tg_user_id: int) -> None:
+    """
+    Удаляет пользователя из кэша. Вызывается при любом изменении пользователя или его профиля в БД,
+    поэтому бан или удаление пользователя действуют сразу.
+
+    Принимает:
+        - `tg_user_id` (int): TG ID пользователя
+    """
+
+    global _generation
+    _generation += 1
+    _cache.pop(tg_user_id, None)
+
+
+# функция сброса всего кэша
+def invalidate_all() -> None:
+    """
+    Очищает кэш пользователей целиком, например после массового обновления профилей
+    """
+
+    global _generation
+    _generation += 1
+    _cache.clear()
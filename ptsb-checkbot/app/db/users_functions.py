@@ -1,27 +1,16 @@
-# встроенные либы
-import os
-
 # встроенные классы
 from datetime import date
 from dataclasses import dataclass
-from typing import Union
-
-# устанавливаемые либы
-import aiosqlite
+from typing import Optional, Union
 
+# самописные либы
+from app.db import database
+from app.db import users_cache
+from app.db import sandbox_profiles_functions
 
-# задаем путь до БД приложения
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-DB_DIR = os.path.join(PROJECT_ROOT, "database")
-DB_NAME = "kernel_base.db"
-FULL_PATH_TO_KERNEL_DB = os.path.join(DB_DIR, DB_NAME)
+# самописные классы
+from app.db.sandbox_profiles_functions import UserProfileFromDb
 
-# инициализируем директорию к БД и саму по себе БД
-if not os.path.exists(DB_DIR):
-    os.mkdir(DB_DIR)
-if not os.path.exists(FULL_PATH_TO_KERNEL_DB):
-    with open(FULL_PATH_TO_KERNEL_DB, "w"):
-        pass
 
 # название таблицы для этого модуля
 TABLE_NAME = "users"
@@ -48,10 +37,10 @@ async def create_table_if_not_exists() -> None:
     """
     
     # подключаемся к БД и создаем таблицу если ее не существует
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as db:
+    async with database.connect() as db:
         await db.execute(f"""
             CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
-                tg_user_id INTEGER,
+                tg_user_id INTEGER PRIMARY KEY,
                 user_role TEXT,
                 comment TEXT,
                 created_by INTEGER,
@@ -82,7 +71,7 @@ async def add_new_user(
     # текущая дата
     current_date = f"{date.today().strftime('%d-%B-%Y')}"
 
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as users_db:
+    async with database.connect() as users_db:
         await users_db.execute(f"""
             INSERT INTO {TABLE_NAME} (
                 tg_user_id,
@@ -97,6 +86,8 @@ async def add_new_user(
         )
         await users_db.commit()
 
+    users_cache.invalidate(tg_user_id)
+
 
 # функция возвращающая пользователя как объект класса AppUserFromDb по результату выполнения SQL запроса
 async def get_user_entity(
@@ -114,7 +105,7 @@ async def get_user_entity(
     """
     
     # подключаемся к БД, пытаемся получить фидбек по tg id
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as users_db:
+    async with database.connect() as users_db:
         cursor = await users_db.execute(f'SELECT * FROM {TABLE_NAME} WHERE tg_user_id = ?', (tg_user_id,))
         data = await cursor.fetchone()
         if data is not None:
@@ -129,7 +120,59 @@ async def get_user_entity(
             )
         else:
             return None
-        
+
+
+# функция, возвращающая пользователя вместе с его профилем взаимодействия с песочницей
+async def get_user_with_profile(
+        tg_user_id: int
+    ) -> tuple[Optional[AppUserFromDb], Optional[UserProfileFromDb]]:
+    """
+    Возвращает пользователя и его профиль взаимодействия с песочницей одним запросом в БД. Результат кэшируется в памяти,
+    кэш сбрасывается при любом изменении пользователя или профиля через функции модулей `app.db`.
+
+    Принимает:
+        - `tg_user_id` (int): TG ID пользователя, данные по которому нужно достать
+
+    Возвращает:
+        - `tuple[AppUserFromDb | None, UserProfileFromDb | None]`: пользователь и его профиль, `None` вместо того, чего нет в БД
+    """
+
+    # в кэше лежит сама строка из БД, а профиль собирается при каждом обращении,
+    # чтобы смена суток пользователя сразу отражалась в его остатке проверок
+    data = users_cache.get(tg_user_id)
+    if data is users_cache.MISSING:
+        cache_generation = users_cache.current_generation()
+
+        async with database.connect() as users_db:
+            cursor = await users_db.execute(f"""
+                SELECT u.*, p.*
+                FROM {TABLE_NAME} AS u
+                LEFT JOIN sandbox_profiles AS p ON p.tg_user_id = u.tg_user_id
+                WHERE u.tg_user_id = ?
+            """, (tg_user_id,)
+            )
+            data = await cursor.fetchone()
+
+        users_cache.put(tg_user_id, data, cache_generation)
+
+    user_entity: Optional[AppUserFromDb] = None
+    user_profile: Optional[UserProfileFromDb] = None
+
+    if data is not None:
+        user_entity = AppUserFromDb(
+            tg_user_id=data[0],
+            user_role=data[1],
+            comment=data[2],
+            created_by=data[3],
+            creation_date=data[4],
+            update_date=data[5],
+            is_blocked=bool(data[6])
+        )
+        if data[7] is not None:
+            user_profile = sandbox_profiles_functions.profile_from_row(data[7:])
+
+    return user_entity, user_profile
+
 
 # функция, возвращающая список пользователей, описание которых подходит под match
 async def fetch_all_users_with_filter(comment_filter: str = "") -> list[AppUserFromDb]:
@@ -146,7 +189,7 @@ async def fetch_all_users_with_filter(comment_filter: str = "") -> list[AppUserF
     list_of_users: list[AppUserFromDb] = []
 
     # подключаемся к БД
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as users_db:
+    async with database.connect() as users_db:
         # меняем выборку в зависимости от того, есть ли фильтр
         if comment_filter:
             cursor = await users_db.execute(
@@ -190,7 +233,7 @@ async def change_user_state_by_id(
     current_date = f"{date.today().strftime('%d-%B-%Y')}"
 
     # подключаемся к БД, пытаемся обновить статус пользователя = забанить/разбанить
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as users_db:
+    async with database.connect() as users_db:
         await users_db.execute(f"""
             UPDATE {TABLE_NAME}
             SET is_blocked = ?, update_date = ?
@@ -199,6 +242,8 @@ async def change_user_state_by_id(
         )
         await users_db.commit()
 
+    users_cache.invalidate(tg_user_id)
+
 
 # функция удаления пользователя по tg id
 async def delete_user_by_id(
@@ -212,6 +257,8 @@ async def delete_user_by_id(
     """
 
     # подключаемся к БД, пытаемся удалить пользователя
-    async with aiosqlite.connect(FULL_PATH_TO_KERNEL_DB) as users_db:
+    async with database.connect() as users_db:
         await users_db.execute(f"DELETE FROM {TABLE_NAME} WHERE tg_user_id = ?", (tg_user_id,))
-        await users_db.commit()
\ No newline at end of file
+        await users_db.commit()
+
+    users_cache.invalidate(tg_user_id)
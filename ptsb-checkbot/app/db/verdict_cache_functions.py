@@ -0,0 +1,164 @@
+# встроенные либы
+import os
+import time
+
+# встроенные классы
+from dataclasses import dataclass
+from typing import Optional, Union
+
+# самописные либы
+from app.db import database
+
+# самописные классы
+from app.api.ptsb_client import GetScanResust
+
+
+# название таблицы для этого модуля
+TABLE_NAME = "verdict_cache"
+
+# сколько секунд хранится вердикт в зависимости от его типа, 0 - не кэшировать вердикты такого типа
+VERDICT_CACHE_TTL = {
+    "CLEAN": int(os.getenv('VERDICT_CACHE_TTL_CLEAN') or 24 * 60 * 60),
+    "UNWANTED": int(os.getenv('VERDICT_CACHE_TTL_UNWANTED') or 7 * 24 * 60 * 60),
+    "DANGEROUS": int(os.getenv('VERDICT_CACHE_TTL_DANGEROUS') or 30 * 24 * 60 * 60),
+}
+
+# самописные классы
+@dataclass
+class CachedVerdictFromDb:
+    """
+    Класс, возвращающий сохраненный вердикт по файлу из таблицы `verdict_cache`
+    """
+    sha256: str
+    scan_id: str
+    scan_state_code: str
+    verdict_code: str
+    threat: str
+    created_at: float
+    expires_at: float
+    ptsb_node: Optional[str] = None
+
+
+# функция инициализации таблицы с кэшем вердиктов
+async def create_table_if_not_exists() -> None:
+    """
+    Создает таблицу `verdict_cache` если ее еще не существует в БД приложения
+    """
+
+    async with database.connect() as db:
+        await db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+                sha256 TEXT PRIMARY KEY,
+                scan_id TEXT,
+                scan_state_code TEXT,
+                verdict_code TEXT,
+                threat TEXT,
+                created_at REAL,
+                expires_at REAL,
+                ptsb_node TEXT
+            )
+        """)
+
+
+# функция сохранения вердикта по файлу
+async def save_verdict(
+        sha256: str,
+        scan_id: str,
+        scan_results: GetScanResust,
+        ptsb_node: Optional[str] = None
+    ) -> bool:
+    """
+    Сохраняет вердикт по файлу в таблицу `verdict_cache`. Сохраняются только окончательные вердикты:
+    проверка выполнена полностью и без ошибок, а для такого типа вердикта задан ненулевой срок хранения.
+
+    Принимает:
+        - `sha256` (str): SHA-256 содержимого файла
+        - `scan_id` (str): ID задания, по которому получен вердикт
+        - `scan_results` (GetScanResust): результаты проверки
+        - `ptsb_node` (str): адрес узла песочницы, на котором создано задание
+
+    Возвращает:
+        `bool`: был ли сохранен вердикт.
+    """
+
+    # частичные проверки и проверки с ошибками не кэшируем, такой файл стоит проверить еще раз
+    if scan_results.scan_state_code != "FULL" or scan_results.scan_error:
+        return False
+
+    ttl = VERDICT_CACHE_TTL.get(scan_results.verdict_code, 0)
+    if ttl <= 0:
+        return False
+
+    created_at = time.time()
+
+    async with database.connect() as cache_db:
+        await cache_db.execute(f"""
+            INSERT OR REPLACE INTO {TABLE_NAME} (
+                sha256,
+                scan_id,
+                scan_state_code,
+                verdict_code,
+                threat,
+                created_at,
+                expires_at,
+                ptsb_node
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (sha256, scan_id, scan_results.scan_state_code, scan_results.verdict_code, scan_results.threat, created_at, created_at + ttl, ptsb_node)
+        )
+        await cache_db.commit()
+
+    return True
+
+
+# функция получения актуального вердикта по файлу
+async def get_fresh_verdict(sha256: str) -> Union[None, CachedVerdictFromDb]:
+    """
+    Возвращает сохраненный вердикт по файлу, если срок его хранения еще не истек
+
+    Принимает:
+        - `sha256` (str): SHA-256 содержимого файла
+
+    Возвращает:
+        - `CachedVerdictFromDb` (object of custom class): сохраненный вердикт
+        - `None`, если вердикта нет или он устарел
+    """
+
+    async with database.connect() as cache_db:
+        cursor = await cache_db.execute(
+            f'SELECT * FROM {TABLE_NAME} WHERE sha256 = ? AND expires_at > ?',
+            (sha256, time.time())
+        )
+        data = await cursor.fetchone()
+
+        if data is not None:
+            return CachedVerdictFromDb(
+                sha256=data[0],
+                scan_id=data[1],
+                scan_state_code=data[2],
+                verdict_code=data[3],
+                threat=data[4],
+                created_at=data[5],
+                expires_at=data[6],
+                ptsb_node=data[7]
+            )
+        else:
+            return None
+
+
+# функция удаления вердикта, чтобы файл был проверен заново
+async def delete_verdict(sha256: str) -> bool:
+    """
+    Удаляет сохраненный вердикт по файлу. Следующая отправка этого файла создаст новое задание в PTSB.
+
+    Принимает:
+        - `sha256` (str): SHA-256 содержимого файла
+
+    Возвращает:
+        `bool`: был ли найден и удален вердикт.
+    """
+
+    async with database.connect() as cache_db:
+        cursor = await cache_db.execute(f'DELETE FROM {TABLE_NAME} WHERE sha256 = ?', (sha256,))
+        await cache_db.commit()
+
+    return cursor.rowcount > 0
@@ -1,16 +1,45 @@
 ### либы
 ## встроенные
 import asyncio
+import functools
+import hashlib
+import html
 import os
 import logging
+import math
 import sys
+import time
+
+## встроенные классы
+from datetime import datetime
+from typing import Optional, Union
 
 ## самописные
+from app.db import database                     # общее соединение с БД приложения
+from app.db import migrations                   # обновление схемы БД между версиями бота
 from app.db import users_functions              # взаимодействие с таблицей юзерочков
 from app.db import sandbox_profiles_functions   # взаимодействие с таблицей профилей ptsb
+from app.db import verdict_cache_functions      # кэш вердиктов по SHA-256 файлов
+from app.db import url_verdict_cache_functions  # кэш вердиктов по каноническим ссылкам
+from app.db import tg_files_functions           # уже скачанные файлы ТГ по их file_unique_id
 from app.bot import custom_keyboars             # клавиатуры для менюшек бота
 from app.bot import connections                 # создание сессий с серверами ТГ
 from app.api import ptsb_client                 # взаимодейсвие с песочницей по API
+from app.api.scan_poller import ScanResultsPoller, PendingScan  # фоновое получение результатов проверки
+from app.api.scan_poller import is_sync_scan, SCAN_POLL_INITIAL_DELAY, SYNC_SCAN_MAX_WAIT, SYNC_SCAN_POLL_INTERVAL  # быстрая проверка небольших файлов и ссылок
+from app.api.submission_queue import SubmissionQueue  # очередь отправки заданий в песочницу с учетом приоритета
+from app.api.health_monitor import PtsbHealthMonitor  # фоновая проверка состояния API песочницы
+from app.api import circuit_breaker             # выключатель запросов к песочнице, пока она недоступна
+from app.api import sandbox_nodes               # узлы песочницы и выбор наименее загруженного из них
+from app.bot.tg_downloads import TgFileStream, ResumableTgDownload, TgDownloadError, TG_DOWNLOAD_PROGRESS_INTERVAL  # потоковое скачивание и докачка файлов из ТГ
+from app.bot.file_batches import FileBatchCollector, BATCH_MAX_FILES, BATCH_DOWNLOAD_CONCURRENCY  # сбор нескольких файлов в одну пачку
+from app.bot import urls                        # разбор и нормализация ссылок от пользователя
+from app.bot import inflight                    # объединение одновременных одинаковых заданий в одну проверку
+from app.bot.fsm_storage import SqliteStorage   # хранение состояний пользователей в БД, чтобы они переживали перезапуск
+from app.bot.middlewares import UserContextMiddleware  # пользователь и его профиль для каждого хэндлера
+from app.bot import rate_limiter               # ограничение частоты отправки заданий
+from app.db import rate_limits_functions        # счетчики ограничения частоты между перезапусками
+from app.db import submission_jobs_functions    # задания на отправку, которые переживают перезапуск бота
 
 
 ### классы
@@ -25,28 +54,26 @@ from aiogram.filters import CommandStart                    # обработка
 from aiogram.filters import StateFilter                     # работа сразу с несколькими состояниями
 from aiogram.types import Message, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.types import Document                          # для обработки загрузки файлов в бота
-from aiogram.fsm.storage.memory import MemoryStorage        # для механизма состояний логин -> меню -> проверка -> etc
 from aiogram.fsm.context import FSMContext                  # для механизма состояний логин -> меню -> проверка -> etc
 from aiogram.filters import BaseFilter                      # для фильтра на личные сообщения/группы
-from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter # ошибки работы с ТГ
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter # ошибки работы с ТГ
 from aiogram.types import FSInputFile                       # отправка файлов из бота
-# для шедулера на регулярное обновление БД
-from apscheduler.schedulers.asyncio import AsyncIOScheduler     # выполнение обновления проверок пользователей по расписанию
-from apscheduler.triggers.cron import CronTrigger               # настройка расписания для такого обновления
 
 ## самописные
 from app.db.users_functions import AppUserFromDb
 from app.db.sandbox_profiles_functions import UserProfileFromDb
-from app.api.ptsb_client import ApiHeathCheck, SendScanRequest, GetScanResust
+from app.api.ptsb_client import SendScanRequest, GetScanResust, ScanVerdictMapper
+from app.db.verdict_cache_functions import CachedVerdictFromDb
+from app.db.url_verdict_cache_functions import CachedUrlVerdictFromDb
+from app.db.tg_files_functions import KnownTgFileFromDb
+from app.db.submission_jobs_functions import SubmissionJobFromDb
+from app.bot.rate_limiter import RateLimits, SubmissionRateLimiter
 from app.bot.custom_states import *
 from app.bot.custom_users_parameters import *
 from app.bot.custom_roles import *
 
 
 ### константы
-# адрес песочницы PTSB
-from app.api.ptsb_client import PTSB_ROOT_ADDR
-
 # токен доступа к ТГ боту
 TG_BOT_TOKEN = str(os.getenv('TG_BOT_TOKEN'))
 
@@ -58,6 +85,14 @@ MAX_DOWNLOAD_RETRIES: int = 3           # максимальное количе
 DOWNLOAD_TIMEOUT: int = 300             # таймаут на попытку загрузки на весь файл (секунд)
 DOWNLOAD_CHUNCK_SIZE: int = 64 * 1024   # максимальный размер чанка, который скачиваем за установленный таймаут (байт)
 DOWNLOADL_RETRY_TIME: int = 5           # время через которое будет осуществлена повторная попытка загрузки файла (секунд)
+STREAM_TG_UPLOADS = bool(int(os.getenv('STREAM_TG_UPLOADS') or 0))     # передавать файлы из ТГ в песочницу потоком, минуя диск
+
+# сообщения бота
+MAX_MESSAGE_LENGTH: int = 4000          # максимальная длина одного сообщения, ТГ не принимает сообщения длиннее 4096 символов
+MAX_REPORT_LINK_BUTTONS: int = 20       # сколько кнопок перехода к заданиям можно прикрепить к общему отчету по пачке
+
+# задания на отправку, прерванные перезапуском бота
+SUBMISSION_JOB_MAX_ATTEMPTS = int(os.getenv('SUBMISSION_JOB_MAX_ATTEMPTS') or 3)   # сколько раз пытаться загрузить задание, прежде чем вернуть проверку и сдаться
 
 
 ### логирование
@@ -81,8 +116,29 @@ logger.addHandler(stdout_handler)
 logger.addHandler(stderr_handler)
 
 
+# хранилище состояний пользователей (логин -> меню -> проверка -> etc)
+fsm_storage = SqliteStorage()
+
 # диспетчер всех хэндлеров для ТГ бота
-dp = Dispatcher(storage=MemoryStorage())
+dp = Dispatcher(storage=fsm_storage)
+
+# фоновый опрос результатов проверки созданных заданий
+scan_poller = ScanResultsPoller()
+
+# фоновая проверка состояния API песочницы, по которой запросы к недоступной песочнице сразу завершаются ошибкой
+ptsb_health_monitor = PtsbHealthMonitor()
+
+# ограничение частоты отправки заданий пользователями
+submission_rate_limiter = SubmissionRateLimiter()
+
+# очередь отправки заданий в песочницу, ограничивающая число одновременных загрузок
+submission_queue = SubmissionQueue()
+
+# одинаковые задания, отправленные одновременно, присоединяются к одной проверке, пока ее результатов ждут
+inflight_scans = inflight.InflightScans(is_scan_active=scan_poller.is_tracked)
+
+# сбор файлов, присланных альбомом или подряд, в одну пачку
+file_batch_collector = FileBatchCollector()
 
 # глобальный фильтр, чтобы бот работал только в личке
 class PrivateChatsOnlyFilter(BaseFilter):
@@ -92,6 +148,9 @@ class PrivateChatsOnlyFilter(BaseFilter):
 # применяем фильтр для локальных чатов глобально
 dp.message.filter(PrivateChatsOnlyFilter())
 
+# пользователь и его профиль достаются из БД один раз на сообщение и передаются в хэндлеры
+dp.message.middleware(UserContextMiddleware())
+
 
 # директория куда скачивать файлы
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -107,6 +166,65 @@ class AdminSingleActionWithId:
     DELETE_ONE_USER = "delete_one_user"     # удаление юзера по ID
 
 
+# подсчет SHA-256 загруженного файла
+def calculate_file_sha256(path_to_file: str) -> str:
+    """
+    Считает SHA-256 содержимого файла, читая его чанками, чтобы не держать файл целиком в памяти.
+    Выполняется в отдельном потоке через `asyncio.to_thread`.
+
+    Принимает:
+        - `path_to_file` (str): полный путь к файлу
+
+    Возвращает:
+        - `str`: SHA-256 в hex виде
+    """
+
+    file_hash = hashlib.sha256()
+    with open(path_to_file, 'rb') as file_to_hash:
+        while chunk := file_to_hash.read(DOWNLOAD_CHUNCK_SIZE):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+# текст сообщения о ходе скачивания файла
+def build_download_status_text(file_name: str, bytes_downloaded: int, file_size: Optional[int]) -> str:
+    """
+    Формирует текст сообщения, которое показывает пользователю ход скачивания его файла
+
+    Принимает:
+        - `file_name` (str): имя файла от пользователя
+        - `bytes_downloaded` (int): сколько байт уже скачано
+        - `file_size` (int): размер файла, если он известен
+
+    Возвращает:
+        - `str`: текст сообщения
+    """
+
+    downloaded_mb = bytes_downloaded / (1024 * 1024)
+    if file_size:
+        progress = f"{downloaded_mb:.1f} из {file_size / (1024 * 1024):.1f} МБ ({min(bytes_downloaded * 100 // file_size, 100)}%)"
+    else:
+        progress = f"{downloaded_mb:.1f} МБ"
+
+    return (
+        "📥 <b>Выполняю загрузку файла</b>\n"
+        f"<code>{file_name}</code>\n\n"
+        f"Загружено: {progress}\n\n"
+        "Загрузка может занять продолжительное время в связи с замедлением работы ТГ в РФ."
+    )
+
+
+# обновление сообщения о ходе скачивания файла
+async def report_download_progress(status_message: Message, file_name: str, bytes_downloaded: int, file_size: Optional[int]) -> None:
+    try:
+        await status_message.edit_text(build_download_status_text(file_name, bytes_downloaded, file_size))
+    except TelegramBadRequest as e:
+        # текст не изменился - ТГ не дает отредактировать сообщение на такое же
+        if "message is not modified" not in str(e):
+            raise
+
+
 # функция вывода информации о пользователе
 async def handle_get_user_info(message: Message, user_entity: AppUserFromDb) -> None:
     """"
@@ -120,6 +238,7 @@ async def handle_get_user_info(message: Message, user_entity: AppUserFromDb) ->
     # в дополнение получаем профиль пользователя взаимодействия с песком
     logger.info(f"Trying to get info about user: {user_entity.tg_user_id}")
     user_sandbox_profile: UserProfileFromDb = await sandbox_profiles_functions.get_profile_entity(user_entity.tg_user_id)
+    user_rate_limits: RateLimits = rate_limiter.limits_from_profile(user_sandbox_profile)
 
     await message.answer(
         f"🧾 <b>Информация о пользователе</b> <code>{user_entity.tg_user_id}</code>:\n\n"
@@ -135,7 +254,11 @@ async def handle_get_user_info(message: Message, user_entity: AppUserFromDb) ->
         f"Осталось проверок сегодня: {user_sandbox_profile.remaining_checks}\n"
         f"Всего создал заданий: {user_sandbox_profile.total_checks}\n"
         f"Приоритет проверки пользователя: {user_sandbox_profile.check_priority}\n"
-        f"Получает ссылки на задания: {'да' if user_sandbox_profile.can_get_links else  'нет'}"
+        f"Получает ссылки на задания: {'да' if user_sandbox_profile.can_get_links else  'нет'}\n"
+        f"Часовой пояс: {user_sandbox_profile.timezone or f'по умолчанию ({sandbox_profiles_functions.QUOTA_TIMEZONE})'}\n"
+        f"Заданий за {rate_limiter.RATE_LIMIT_BURST_WINDOW} сек.: {rate_limiter.format_limit(user_rate_limits.burst)}\n"
+        f"Заданий в час: {rate_limiter.format_limit(user_rate_limits.hourly)}\n"
+        f"Заданий за сутки: {rate_limiter.format_limit(user_rate_limits.daily)}"
     )
     logger.info(f"Info about user: {user_entity.tg_user_id} was printed")
 
@@ -220,20 +343,19 @@ ADMIN_SINGLE_ACTIONS_HANDLER = {
 ############################## все хэндлеры бота ##############################
 # работа с командой старт
 @dp.message(CommandStart())
-async def command_start_handler(message: Message, state: FSMContext) -> None:
+async def command_start_handler(message: Message, state: FSMContext, user_entity: Optional[AppUserFromDb]) -> None:
     """
     Обработчик события для команды /start с проверкой прав, статуса блокировки,
     проверкой наличия пользователя в БД и выбором интерфейса на основе роли
     """
 
-    # получаем ID текущего пользователя, который отправил запрос в БД и получаем данные по нему по ID
+    # получаем ID текущего пользователя, данные по нему уже достала из БД мидлварь
     current_user_id = message.from_user.id
-    current_user_data: AppUserFromDb = await users_functions.get_user_entity(current_user_id)
     
     logger.info(f"User {current_user_id} started interaction with bot")
     
     # Проверяем, что пользователь существует в БД
-    if current_user_data is None:
+    if user_entity is None:
         logger.info(f"User {current_user_id} was not found in app database")
         
         await message.answer(
@@ -246,7 +368,7 @@ async def command_start_handler(message: Message, state: FSMContext) -> None:
         return
     
     # проверяем что юзер в блек листе
-    if current_user_data.is_blocked:
+    if user_entity.is_blocked:
         logger.info(f"User {current_user_id} is banned in app and has no access")
         
         await message.answer(
@@ -259,8 +381,8 @@ async def command_start_handler(message: Message, state: FSMContext) -> None:
         return
 
     # Во всех прочих случаях определяем меню в зависимости от роли
-    if current_user_data.user_role == UsersRolesInBot.main_admin:
-        logger.info(f"User {current_user_id} was authorized and got role of {current_user_data.user_role}")
+    if user_entity.user_role == UsersRolesInBot.main_admin:
+        logger.info(f"User {current_user_id} was authorized and got role of {user_entity.user_role}")
         
         await message.answer(
             f"👑 Добро пожаловать, Администратор!\n\n"
@@ -270,8 +392,8 @@ async def command_start_handler(message: Message, state: FSMContext) -> None:
         await state.set_state(AdminStates.root_admin_menu)
         return
     
-    elif current_user_data.user_role == UsersRolesInBot.user:
-        logger.info(f"User {current_user_id} was authorized and got role of {current_user_data.user_role}")
+    elif user_entity.user_role == UsersRolesInBot.user:
+        logger.info(f"User {current_user_id} was authorized and got role of {user_entity.user_role}")
         
         await message.answer(
             f"👋 Добро пожаловать!\n\n"
@@ -633,7 +755,75 @@ async def process_user_comment_to_create(message: Message, state: FSMContext) ->
         await state.set_state(AdminStates.manage_users_menu)
         return
 
-    
+    # если всё ок, то записываем полученное значение и запрашиваем часовой пояс пользователя
+    await state.update_data({InputSandboxProfileParameters.can_get_links: can_user_get_links})
+    await message.answer(
+        "Укажите часовой пояс пользователя, по которому для него будут начинаться новые сутки и восстанавливаться проверки.\n"
+        "Например, <code>Europe/Moscow</code> или <code>Asia/Yekaterinburg</code>.\n"
+        f"<code>0</code> - использовать часовой пояс по умолчанию (<code>{sandbox_profiles_functions.QUOTA_TIMEZONE}</code>)."
+    )
+    await state.set_state(SandboxProfileCreation.CREATE_timezone)
+    return
+
+
+# хэндлер для ввода часового пояса пользователя и final создание пользователя
+@dp.message(SandboxProfileCreation.CREATE_timezone, F.text)
+async def process_user_timezone_to_create(message: Message, state: FSMContext) -> None:
+
+    # проверяем, что такой часовой пояс существует
+    user_timezone = message.text.strip()
+    if user_timezone == "0":
+        user_timezone = None
+    elif not sandbox_profiles_functions.is_valid_timezone(user_timezone):
+        logger.info(f"Creation of user by admin user {message.from_user.id} was interrupted becouse of unknown timezone input")
+
+        await message.answer(
+            "⚠️ <b>Не удалось выполнить действие!</b>\n\n"
+            "Часовой пояс с таким названием не найден."
+        )
+        await message.answer(
+            "Выберите дальнейшее действие:",
+            reply_markup=custom_keyboars.manage_users_menu_keyboard
+        )
+        await state.set_state(AdminStates.manage_users_menu)
+        return
+
+    # если всё ок, то записываем полученное значение и запрашиваем ограничения частоты отправки заданий
+    await state.update_data({InputSandboxProfileParameters.timezone: user_timezone})
+    await message.answer(
+        "Укажите, как часто пользователь может отправлять задания, в формате <code>всплеск/час/сутки</code>, например <code>5/30/100</code>:\n"
+        f"всплеск - сколько заданий можно отправить за {rate_limiter.RATE_LIMIT_BURST_WINDOW} сек.;\n"
+        "час и сутки - сколько заданий можно отправить за последний час и за последние 24 часа.\n"
+        "<code>0</code> на месте любого значения - без ограничения.\n\n"
+        "<code>0</code> вместо всего ввода - значения по умолчанию "
+        f"(<code>{rate_limiter.RATE_LIMIT_DEFAULT_BURST}/{rate_limiter.RATE_LIMIT_DEFAULT_HOURLY}/{rate_limiter.RATE_LIMIT_DEFAULT_DAILY}</code>)."
+    )
+    await state.set_state(SandboxProfileCreation.CREATE_rate_limits)
+    return
+
+
+# хэндлер для ввода ограничений частоты отправки заданий и final создание пользователя
+@dp.message(SandboxProfileCreation.CREATE_rate_limits, F.text)
+async def process_user_rate_limits_to_create(message: Message, state: FSMContext) -> None:
+
+    # пытаемся разобрать ввод вида всплеск/час/сутки
+    user_rate_limits: Optional[RateLimits] = None
+    if message.text.strip() != "0":
+        user_rate_limits = rate_limiter.parse_limits(message.text)
+        if user_rate_limits is None:
+            logger.info(f"Creation of user by admin user {message.from_user.id} was interrupted becouse of incorrect burst/hour/day input")
+
+            await message.answer(
+                "⚠️ <b>Не удалось выполнить действие!</b>\n\n"
+                "Не удалось разобрать ввод как три целых неотрицательных числа через <code>/</code>."
+            )
+            await message.answer(
+                "Выберите дальнейшее действие:",
+                reply_markup=custom_keyboars.manage_users_menu_keyboard
+            )
+            await state.set_state(AdminStates.manage_users_menu)
+            return
+
     # если всё ок, то переходим к созданию пользователя в БД
     data = await state.get_data()
 
@@ -645,6 +835,8 @@ async def process_user_comment_to_create(message: Message, state: FSMContext) ->
     # профиль взаимодействия с песочницей
     max_available_checks = data.get(InputSandboxProfileParameters.max_available_checks)
     user_check_priority = data.get(InputSandboxProfileParameters.check_priority)
+    can_user_get_links = data.get(InputSandboxProfileParameters.can_get_links)
+    user_timezone = data.get(InputSandboxProfileParameters.timezone)
 
     # создаем базовый профиль пользователя
     await users_functions.add_new_user(
@@ -660,7 +852,11 @@ async def process_user_comment_to_create(message: Message, state: FSMContext) ->
         tg_user_id=tg_user_id,
         max_available_checks=max_available_checks,
         check_priority=user_check_priority,
-        can_get_links=can_user_get_links
+        can_get_links=can_user_get_links,
+        timezone=user_timezone,
+        burst_limit=user_rate_limits.burst if user_rate_limits else None,
+        hourly_limit=user_rate_limits.hourly if user_rate_limits else None,
+        daily_limit=user_rate_limits.daily if user_rate_limits else None
     )
     logger.info(f"Sandbox interaction profile for user {tg_user_id} was created")
     
@@ -756,8 +952,15 @@ async def process_manage_app_action(message: Message, state: FSMContext) -> None
         # открываем и отправляем
         logger.info(f"Admin user {message.from_user.id} is getting db backup of application")
 
-        db_file = FSInputFile(users_functions.FULL_PATH_TO_KERNEL_DB, filename=users_functions.DB_NAME)
-        await message.answer_document(db_file, caption="Файл с БД пользователей:")
+        # снимаем копию БД, т.к. часть последних изменений может лежать в журнале WAL, а не в самом файле БД
+        path_to_backup = os.path.join(DOWNLODAD_DIR, f"{message.from_user.id}_{database.DB_NAME}")
+        try:
+            await database.backup_kernel_db(path_to_backup)
+            db_file = FSInputFile(path_to_backup, filename=database.DB_NAME)
+            await message.answer_document(db_file, caption="Файл с БД пользователей:")
+        finally:
+            if os.path.exists(path_to_backup):
+                os.remove(path_to_backup)
         await message.answer(
             "Выберите дальнейшее дейсвтие:",
             reply_markup=custom_keyboars.admin_manage_app_keyboard
@@ -779,11 +982,10 @@ async def process_manage_app_action(message: Message, state: FSMContext) -> None
 ############################## пользовательские хэндлеры ##############################
 # хэндлер для проверки состояния пользователя
 @dp.message(UserStates.check_user_status, F.text == custom_keyboars.BTN_CHECK_STATUS)
-async def process_user_comment_to_create(message: Message, state: FSMContext) -> None:
+async def process_user_comment_to_create(message: Message, state: FSMContext, user_entity: Optional[AppUserFromDb]) -> None:
     
-    # получаем информацию по юзеру
+    # информацию по юзеру уже достала из БД мидлварь
     logger.info(f"User {message.from_user.id} is trying to get his status")
-    user_entity: AppUserFromDb = await users_functions.get_user_entity(message.from_user.id)
 
     # если всё еще не создали
     if user_entity is None:
@@ -829,22 +1031,141 @@ async def process_user_comment_to_create(message: Message, state: FSMContext) ->
 @dp.message(SandboxInteractionStates.sandbox_admin_menu, F.text == custom_keyboars.BTN_SANDBOX_MENU_CHECK_API)
 async def process_user_comment_to_create(message: Message, state: FSMContext) -> None:
     
-    logger.info(f"Admin user {message.from_user.id} sent API healtcheck request to PTSB")
+    logger.info(f"Admin user {message.from_user.id} requested PTSB API health state")
+
+    # состояние API проверяется в фоне, поэтому показываем сохраненное, а не ждем нового запроса до таймаута
+    await message.answer(format_api_health_message(ptsb_client.ptsb_nodes))
+    
+    # в любом случае в мейн меню
+    await message.answer(
+        "Выберите дальнейшее действие:",
+        reply_markup=custom_keyboars.admin_main_sandbox_keyboard
+    )
+    await state.set_state(SandboxInteractionStates.sandbox_admin_menu)
+    return
+
+
+# текст сообщения с состоянием API песочницы
+def format_api_health_message(ptsb_nodes: sandbox_nodes.SandboxNodePool) -> str:
+    """
+    Формирует сообщение с текущим состоянием API PTSB и историей последних фоновых проверок.
+    Если узлов песочницы несколько, состояние показывается по каждому узлу вместе с его загрузкой.
+
+    Принимает:
+        - `ptsb_nodes` (SandboxNodePool): узлы песочницы
+
+    Возвращает:
+        - `str`: текст сообщения в html вёрстке
+    """
+
+    if len(ptsb_nodes) == 1:
+        return format_node_health_message(ptsb_nodes.default.circuit)
+
+    node_messages: list[str] = []
+    for node in ptsb_nodes:
+        latency_text = f"{node.latency:.2f} сек." if node.latency is not None else "нет данных"
+        node_messages.append(
+            f"🖥 <b>Узел</b> <code>{html.escape(node.address)}</code>\n"
+            f"<b>Вес:</b> {node.weight:g}, <b>запросов выполняется:</b> {node.in_flight}, <b>средняя задержка:</b> {latency_text}\n\n"
+            f"{format_node_health_message(node.circuit)}"
+        )
+    return "\n\n".join(node_messages)
+
+
+# текст сообщения с состоянием API одного узла песочницы
+def format_node_health_message(ptsb_circuit: circuit_breaker.CircuitBreaker) -> str:
+    """
+    Формирует сообщение с текущим состоянием API узла PTSB и историей последних фоновых проверок
+
+    Принимает:
+        - `ptsb_circuit` (CircuitBreaker): выключатель запросов к узлу песочницы
 
-    # получаем состояние API 
-    await message.answer("Отпрвлен API запрос на проверку. Проверка может занять до 10 секунд.")
-    api_health_check: ApiHeathCheck = await ptsb_client.make_api_healthcheck()
+    Возвращает:
+        - `str`: текст сообщения в html вёрстке
+    """
 
-    # обрабатываем статус
-    if api_health_check.is_ok:
-        logger.info("API healtcheck request is OK")
-        await message.answer("✅ API PTSB доступен.")
+    circuit_state = ptsb_circuit.state
+    if circuit_state == circuit_breaker.CIRCUIT_CLOSED:
+        state_text = "✅ <b>API PTSB доступен.</b>"
+    elif circuit_state == circuit_breaker.CIRCUIT_OPEN:
+        state_text = (
+            "⚠️ <b>API PTSB недоступен.</b>\n"
+            f"Запросы в песочницу не отправляются еще {ptsb_circuit.retry_after():.0f} сек., пользователи сразу получают ошибку.\n\n"
+            f"<b>Последняя ошибка:</b> {html.escape(ptsb_circuit.last_error or '-')}"
+        )
     else:
-        logger.warning(f"Error acquired while sending API healthck request. Error text: {api_health_check.error_message}")
-        await message.answer(
-            f"⚠️ При проврке API возникла ошибка.\n\n{api_health_check.error_message}"
+        state_text = (
+            "🔄 <b>API PTSB восстанавливается.</b>\n"
+            "Следующий запрос в песочницу будет пробным.\n\n"
+            f"<b>Последняя ошибка:</b> {html.escape(ptsb_circuit.last_error or '-')}"
         )
-    
+
+    if not ptsb_circuit.history:
+        return f"{state_text}\n\nФоновая проверка API еще не выполнялась."
+
+    # история фоновых проверок, последние сверху
+    history_lines: list[str] = []
+    for health_probe in reversed(ptsb_circuit.history):
+        checked_at = datetime.fromtimestamp(health_probe.checked_at).strftime('%H:%M:%S')
+        if health_probe.is_ok:
+            history_lines.append(f"✅ {checked_at} — {health_probe.latency:.2f} сек.")
+        else:
+            history_lines.append(f"⚠️ {checked_at} — {health_probe.latency:.2f} сек.: {html.escape(health_probe.error_message or '-')}")
+
+    return f"{state_text}\n\n<b>Последние проверки API:</b>\n" + "\n".join(history_lines)
+
+
+# хэндлер для нажатия кнопки "сбросить сохраненный вердикт"
+@dp.message(SandboxInteractionStates.sandbox_admin_menu, F.text == custom_keyboars.BTN_SANDBOX_MENU_RESET_VERDICT)
+async def handle_reset_cached_verdict(message: Message, state: FSMContext) -> None:
+    await message.answer(
+        "Введите <code>SHA-256</code> файла или ссылку, которую нужно проверить заново.\n\n"
+        "Они указываются в сообщении с вердиктом из кэша.",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    await state.set_state(SandboxInteractionStates.input_verdict_to_reset)
+    return
+
+
+# хэндлер ввода SHA-256 или ссылки для сброса сохраненного вердикта
+@dp.message(SandboxInteractionStates.input_verdict_to_reset, F.text)
+async def process_reset_cached_verdict(message: Message, state: FSMContext) -> None:
+
+    verdict_key = message.text.strip()
+
+    # SHA-256 - это 64 hex символа, все остальное считаем ссылкой
+    if len(verdict_key) == 64 and all(char in "0123456789abcdef" for char in verdict_key.lower()):
+        file_sha256 = verdict_key.lower()
+        logger.info(f"Admin user {message.from_user.id} is resetting cached verdict for sha256={file_sha256}")
+
+        # сбрасываем вердикт, при следующей отправке файл будет проверен в песочнице заново
+        if await verdict_cache_functions.delete_verdict(file_sha256):
+            await message.answer(
+                f"✅ Вердикт по файлу <code>{file_sha256}</code> сброшен.\n\n"
+                "При следующей отправке файл будет проверен заново."
+            )
+        else:
+            await message.answer(
+                "⚠️ <b>Не удалось выполнить действие!</b>\n\n"
+                "Сохраненный вердикт по этому SHA-256 не найден."
+            )
+
+    else:
+        canonical_url = urls.canonicalize_url(verdict_key)
+        logger.info(f"Admin user {message.from_user.id} is resetting cached verdict for url {canonical_url}")
+
+        # вердикт хранится по канонической ссылке, поэтому сбрасывается для всех ее копий
+        if await url_verdict_cache_functions.delete_verdict(canonical_url):
+            await message.answer(
+                f"✅ Вердикт по ссылке <code>{html.escape(canonical_url)}</code> сброшен.\n\n"
+                "При следующей отправке ссылка будет проверена заново."
+            )
+        else:
+            await message.answer(
+                "⚠️ <b>Не удалось выполнить действие!</b>\n\n"
+                "Сохраненный вердикт по этому SHA-256 или ссылке не найден."
+            )
+
     # в любом случае в мейн меню
     await message.answer(
         "Выберите дальнейшее действие:",
@@ -859,13 +1180,14 @@ async def process_user_comment_to_create(message: Message, state: FSMContext) ->
     StateFilter(SandboxInteractionStates.sandbox_admin_menu, SandboxInteractionStates.sandbox_user_menu),
     F.text == custom_keyboars.BTN_SANDBOX_MENU_GET_STATS
 )
-async def get_sandbox_checks_stats(message: Message, state: FSMContext) -> None:
-    
-    # получаем профиль пользователя для взаимодействия с песком
-    user_sandbox_profile: UserProfileFromDb = await sandbox_profiles_functions.get_profile_entity(message.from_user.id)
-    # получаем профиль пользователя, чтобы понять какая у него роль
-    user_entity: AppUserFromDb = await users_functions.get_user_entity(message.from_user.id)
-
+async def get_sandbox_checks_stats(
+        message: Message,
+        state: FSMContext,
+        user_entity: Optional[AppUserFromDb],
+        user_sandbox_profile: Optional[UserProfileFromDb]
+    ) -> None:
+
+    # профиль пользователя для взаимодействия с песком и его роль уже достала из БД мидлварь
     if (user_sandbox_profile is None) or (user_entity is None) or user_entity.is_blocked:
         logger.info(f"User {message.from_user.id} tried to get sandbox profile status, but had lost his access earlier")
         
@@ -896,13 +1218,16 @@ async def get_sandbox_checks_stats(message: Message, state: FSMContext) -> None:
     StateFilter(SandboxInteractionStates.sandbox_admin_menu, SandboxInteractionStates.sandbox_user_menu),
     F.text == custom_keyboars.BTN_SANDBOX_MENU_SEND_URL
 )
-async def handle_send_url_to_scan(message: Message, state: FSMContext) -> None:
+async def handle_send_url_to_scan(
+        message: Message,
+        state: FSMContext,
+        user_entity: Optional[AppUserFromDb],
+        user_sandbox_profile: Optional[UserProfileFromDb]
+    ) -> None:
     
-    # получаем профиль пользователя, чтобы понять можно ли ему взаимодействовать с ботом
-    user_entity: AppUserFromDb = await users_functions.get_user_entity(message.from_user.id)
-
+    # профиль пользователя уже достала из БД мидлварь, по нему понимаем можно ли ему взаимодействовать с ботом
     # если юзер больше не существует или заблокирован
-    if (user_entity is None) or user_entity.is_blocked:
+    if (user_entity is None) or (user_sandbox_profile is None) or user_entity.is_blocked:
         logger.info(f"User {message.from_user.id} tried to send link to check, but had lost his access earlier")
         
         await message.answer(
@@ -912,7 +1237,6 @@ async def handle_send_url_to_scan(message: Message, state: FSMContext) -> None:
         return
 
     # если юзер закончил на сегодня все свои проверки
-    user_sandbox_profile: UserProfileFromDb = await sandbox_profiles_functions.get_profile_entity(message.from_user.id)
     if user_sandbox_profile.remaining_checks == 0:
         logger.info(f"User {message.from_user.id} tried to send link to check, but has no available checks today")
 
@@ -921,6 +1245,17 @@ async def handle_send_url_to_scan(message: Message, state: FSMContext) -> None:
             "Обновление проверок происходит каждый день. Повторите попытку завтра."
         )
         return
+
+    # если юзер слишком часто отправляет задания - не даем начать ни скачивание, ни загрузку
+    wait_time = submission_rate_limiter.seconds_until_allowed(message.from_user.id, rate_limiter.limits_from_profile(user_sandbox_profile))
+    if wait_time > 0:
+        logger.info(f"User {message.from_user.id} tried to send link to check, but hit rate limit for {wait_time:.0f} seconds")
+
+        await message.answer(
+            "⚠️ Вы слишком часто отправляете задания на проверку.\n\n"
+            f"Повторите попытку через {rate_limiter.format_wait_time(wait_time)}"
+        )
+        return
     
     # если с юзером все окей то запоминаем параметры, которые помогут в будущем
     await state.update_data({SandboxInteractionsParameters.user_role: user_entity.user_role})
@@ -930,19 +1265,67 @@ async def handle_send_url_to_scan(message: Message, state: FSMContext) -> None:
 
     # и просим ввести ссылку на проверку
     await message.answer(
-        "Введите текст ссылки, которую нужно проверить (не больше одной ссылки):",
+        "Введите ссылку, которую нужно проверить.\n\n"
+        f"Можно отправить сразу несколько ссылок (не более {urls.URL_BATCH_MAX_URLS}) одним сообщением "
+        "или прислать их списком в файле .txt или .csv, каждую с новой строки.",
         reply_markup=ReplyKeyboardRemove()
     )
     await state.set_state(SandboxInteractionStates.input_url_to_scan)
     return
 
 
+# хэндлер загрузки файла со списком ссылок для отправки на проверку
+@dp.message(SandboxInteractionStates.input_url_to_scan, F.document)
+async def upload_url_list_to_bot(message: Message, state: FSMContext) -> None:
+
+    file_from_user: Document = message.document
+    file_name = file_from_user.file_name or ""
+
+    # список ссылок принимаем только текстовым файлом
+    is_text_file = file_name.lower().endswith(urls.URL_LIST_EXTENSIONS) or (file_from_user.mime_type or "").startswith("text/")
+    if not is_text_file:
+        await message.answer(
+            "⚠️ <b>Ожидался файл со списком ссылок.</b>\n\n"
+            "Пришлите ссылки текстом или файлом .txt или .csv, каждую с новой строки."
+        )
+        return
+
+    if file_from_user.file_size and file_from_user.file_size > urls.URL_LIST_MAX_FILE_SIZE:
+        await message.answer(
+            "⚠️ <b>Файл со списком ссылок слишком большой.</b>\n\n"
+            f"Максимальный размер: {urls.URL_LIST_MAX_FILE_SIZE // 1024} КБ."
+        )
+        return
+
+    # читаем ссылки по мере скачивания файла, не сохраняя его на диск
+    try:
+        telegram_file_id = await message.bot.get_file(file_from_user.file_id)
+        file_stream = TgFileStream(
+            bot=message.bot,
+            file_path=telegram_file_id.file_path,
+            timeout=DOWNLOAD_TIMEOUT,
+            chunk_size=DOWNLOAD_CHUNCK_SIZE
+        )
+        parsed_urls = await urls.read_url_list(file_stream, file_name)
+
+    except Exception as e:
+        logger.error(f"Failed to read url list {file_name} from user {message.from_user.id}: {str(e)}", exc_info=True)
+        await message.answer(
+            "⚠️ <b>Не удалось прочитать файл со списком ссылок.</b>\n\n"
+            "Попробуйте отправить его еще раз или пришлите ссылки текстом."
+        )
+        return
+
+    logger.info(f"User {message.from_user.id} sent url list {file_name} with {len(parsed_urls.urls)} urls")
+    await accept_urls_to_scan(message, state, parsed_urls)
+
+
 # хэндлер ввода ссылки для отправки на проверку
 @dp.message(SandboxInteractionStates.input_url_to_scan)
 async def process_url_input_to_scan(message: Message, state: FSMContext) -> None:
     
     # проверяем, что пользователь отправил именно текст
-    if message.text is None:
+    if message.text is None and message.caption is None:
         await message.answer(
             "⚠️ <b>Ожидался ввод ссылки.</b>\n\n"
             "Сообщение не содержит текста."
@@ -950,20 +1333,65 @@ async def process_url_input_to_scan(message: Message, state: FSMContext) -> None
         await message.answer("Введите ссылку для проверки:")
         await state.set_state(SandboxInteractionStates.input_url_to_scan)
         return
-    
-    # получаем URL + заносим ее в контекст состояния пользователя
-    url_to_scan: str = message.text
-    url_to_scan.strip().split()[0]
-    await state.update_data({SandboxInteractionsParameters.url_to_scan: url_to_scan})
 
-    # запрашиваем ввод паролей для отправки ссылку на проверку, в любом случае в это состояние
+    # получаем все ссылки из сообщения, одинаковые ссылки отправятся на проверку один раз
+    parsed_urls = urls.collect_urls(urls.extract_message_urls(message))
+    await accept_urls_to_scan(message, state, parsed_urls)
+
+
+# прием ссылок от пользователя и переход к вводу паролей
+async def accept_urls_to_scan(message: Message, state: FSMContext, parsed_urls: urls.ParsedUrls) -> None:
+    """
+    Запоминает ссылки для отправки на проверку: одну ссылку - как одиночное задание, несколько - как пачку ссылок.
+    После этого просит ввести пароли.
+
+    Принимает:
+        - `message` (Message): сообщение пользователя со ссылками
+        - `state` (FSMContext): контекст состояния пользователя
+        - `parsed_urls` (ParsedUrls): найденные ссылки
+    """
+
+    if not parsed_urls.urls:
+        await message.answer(
+            "⚠️ <b>Не удалось найти ни одной ссылки.</b>\n\n"
+            "Введите ссылку для проверки:"
+        )
+        await state.set_state(SandboxInteractionStates.input_url_to_scan)
+        return
+
+    # сообщаем, какие ссылки не будут отправлены
+    skipped_info: list[str] = []
+    if parsed_urls.duplicates:
+        skipped_info.append(f"повторяющихся ссылок: {parsed_urls.duplicates}")
+    if parsed_urls.invalid:
+        skipped_info.append(f"строк, не похожих на ссылку: {parsed_urls.invalid}")
+    if parsed_urls.is_truncated:
+        skipped_info.append(f"ссылок сверх ограничения в {urls.URL_BATCH_MAX_URLS}")
+    if skipped_info:
+        await message.answer("⚠️ Не будут отправлены на проверку " + ", ".join(skipped_info) + ".")
+
+    if len(parsed_urls.urls) == 1:
+        await state.update_data({
+            SandboxInteractionsParameters.scan_type: "url",
+            SandboxInteractionsParameters.url_to_scan: parsed_urls.urls[0]
+        })
+    else:
+        await state.update_data({
+            SandboxInteractionsParameters.scan_type: "url_batch",
+            SandboxInteractionsParameters.urls_to_scan: parsed_urls.urls
+        })
+        await message.answer(f"✅ Ссылок принято: {len(parsed_urls.urls)}.")
+
+    # запрашиваем ввод паролей для отправки ссылок на проверку, в любом случае в это состояние
+    # админ может отправить ссылки заново, даже если по ним есть сохраненный вердикт
+    user_data = await state.get_data()
+    is_admin = user_data.get(SandboxInteractionsParameters.user_role) == UsersRolesInBot.main_admin
     await message.answer(
         "Если Вы знаете, что файлы зашифрованы паролем, укажите их сейчас, каждый с новой строки. Всего не более 5 паролей.\n"
         "Если паролей нет, нажмите кнопку ниже.",
-        reply_markup=custom_keyboars.send_to_scan_keyboard
+        reply_markup=custom_keyboars.admin_send_to_scan_keyboard if is_admin else custom_keyboars.send_to_scan_keyboard
     )
     await state.set_state(SandboxInteractionStates.send_req_for_scan)
-    return
 
 
 # хэндлер для нажатия кнопки "отправить файл на проверку"
@@ -971,13 +1399,16 @@ async def process_url_input_to_scan(message: Message, state: FSMContext) -> None
     StateFilter(SandboxInteractionStates.sandbox_admin_menu, SandboxInteractionStates.sandbox_user_menu),
     F.text == custom_keyboars.BTN_SANDBOX_MENU_SEND_FILE
 )
-async def hadle_send_file_to_scan(message: Message, state: FSMContext) -> None:
-
-    # получаем профиль пользователя, чтобы понять можно ли ему взаимодействовать с ботом
-    user_entity: AppUserFromDb = await users_functions.get_user_entity(message.from_user.id)
-
+async def hadle_send_file_to_scan(
+        message: Message,
+        state: FSMContext,
+        user_entity: Optional[AppUserFromDb],
+        user_sandbox_profile: Optional[UserProfileFromDb]
+    ) -> None:
+
+    # профиль пользователя уже достала из БД мидлварь, по нему понимаем можно ли ему взаимодействовать с ботом
     # если юзер больше не существует или заблокирован
-    if (user_entity is None) or user_entity.is_blocked:
+    if (user_entity is None) or (user_sandbox_profile is None) or user_entity.is_blocked:
         logger.info(f"User {message.from_user.id} tried to send file to check, but had lost his access earlier")
 
         await message.answer(
@@ -987,7 +1418,6 @@ async def hadle_send_file_to_scan(message: Message, state: FSMContext) -> None:
         return
 
     # если юзер закончил на сегодня все свои проверки
-    user_sandbox_profile: UserProfileFromDb = await sandbox_profiles_functions.get_profile_entity(message.from_user.id)
     if user_sandbox_profile.remaining_checks == 0:
         logger.info(f"User {message.from_user.id} tried to send file to check, but has no available checks today")
         
@@ -996,6 +1426,17 @@ async def hadle_send_file_to_scan(message: Message, state: FSMContext) -> None:
             "Обновление проверок происходит каждый день."
         )
         return
+
+    # если юзер слишком часто отправляет задания - не даем начать ни скачивание, ни загрузку
+    wait_time = submission_rate_limiter.seconds_until_allowed(message.from_user.id, rate_limiter.limits_from_profile(user_sandbox_profile))
+    if wait_time > 0:
+        logger.info(f"User {message.from_user.id} tried to send file to check, but hit rate limit for {wait_time:.0f} seconds")
+
+        await message.answer(
+            "⚠️ Вы слишком часто отправляете задания на проверку.\n\n"
+            f"Повторите попытку через {rate_limiter.format_wait_time(wait_time)}"
+        )
+        return
     
     # если с юзером все окей то задаем параметры, которые помогут в будущем
     await state.update_data({SandboxInteractionsParameters.user_role: user_entity.user_role})
@@ -1007,7 +1448,8 @@ async def hadle_send_file_to_scan(message: Message, state: FSMContext) -> None:
     # и отправить файл на проверку
     await message.answer(
         "Отправьте файл, который нужно проверить.\n\n"
-        "Не более одного файла, не более 20 мбайт (ограничение телеграма). Если Вы отправите несколько файлов, бот возьмет только один из них.",
+        f"Можно отправить сразу несколько файлов (альбомом или сообщениями подряд), не более {BATCH_MAX_FILES}. "
+        "Каждый файл не более 20 мбайт (ограничение телеграма).",
         reply_markup=ReplyKeyboardRemove()
     )
     await state.set_state(SandboxInteractionStates.upload_file_to_scan)
@@ -1018,12 +1460,35 @@ async def hadle_send_file_to_scan(message: Message, state: FSMContext) -> None:
 @dp.message(SandboxInteractionStates.upload_file_to_scan, F.document)
 async def upload_file_to_bot(message: Message, state: FSMContext) -> None:
 
-    # проверка на то, чтобы было не больше одного файла
+    # файлы, присланные после того, как пачка уже собрана, не берем
     user_data = await state.get_data()
     if user_data.get(SandboxInteractionsParameters.file_uploaded):
         return
+
+    # ждем, пока пользователь пришлет все файлы альбома, дальше пачку обрабатывает вызов для последнего файла
+    batch_messages = await file_batch_collector.collect(message.from_user.id, message)
+    if batch_messages is None:
+        return
     await state.update_data({SandboxInteractionsParameters.file_uploaded: True})
-    
+
+    if len(batch_messages) > BATCH_MAX_FILES:
+        logger.info(f"User {message.from_user.id} sent {len(batch_messages)} files at once, only first {BATCH_MAX_FILES} will be taken")
+        await message.answer(
+            f"⚠️ За один раз можно отправить не более {BATCH_MAX_FILES} файлов. Будут проверены первые {BATCH_MAX_FILES} из них."
+        )
+        batch_messages = batch_messages[:BATCH_MAX_FILES]
+
+    # несколько файлов скачиваются и отправляются на проверку одной пачкой
+    if len(batch_messages) > 1:
+        await upload_batch_to_bot(batch_messages, state, user_data)
+        return
+
+    await upload_single_file_to_bot(batch_messages[0], state, user_data)
+
+
+# загрузка одного файла для последующей его проверки
+async def upload_single_file_to_bot(message: Message, state: FSMContext, user_data: dict) -> None:
+
     # получаем файл и проверяем, что файл существует
     file_from_user: Document = message.document
     if not file_from_user:
@@ -1035,71 +1500,101 @@ async def upload_file_to_bot(message: Message, state: FSMContext) -> None:
         await state.set_state(upload_file_to_bot)
         return
 
+    # если этот файл уже присылали и по нему есть актуальный вердикт - отдаем его, не скачивая файл из ТГ
+    known_file: KnownTgFileFromDb = await tg_files_functions.get_known_file(file_from_user.file_unique_id)
+    if known_file is not None:
+        cached_verdict: CachedVerdictFromDb = await verdict_cache_functions.get_fresh_verdict(known_file.sha256)
+        if cached_verdict is not None:
+            logger.info(f"File {file_from_user.file_name} from user {message.from_user.id} is already known, download from TG was skipped")
+            await answer_cached_verdict(
+                message,
+                state,
+                cached_verdict,
+                user_data.get(SandboxInteractionsParameters.user_role),
+                user_data.get(SandboxInteractionsParameters.can_get_links)
+            )
+            return
+
     # получаем объект бота через апи
     bot = message.bot
     
-    telegram_file_id = await bot.get_file(file_from_user.file_id)       # получаем id файла
-    file_path_on_server = telegram_file_id.file_path                    # берем полный путь к файлу на серверах ТГ
     file_name = f"TG-{message.from_user.id}-{file_from_user.file_name}" # имя файла который мы создадим локально = TG+<user_id>+<имя файла от юзера>
     downloaded_file_path = os.path.join(DOWNLODAD_DIR, file_name)       # устанавливаем полный путь к файлу, который сохраняем в папку DOWNLOAD_DIR
     
     # танцы с бубном, чтобы чё то скачать и так чтобы не сломать и не было утечки памяти
     try:
+        telegram_file_id = await bot.get_file(file_from_user.file_id)   # получаем id файла
+        file_path_on_server = telegram_file_id.file_path                # берем полный путь к файлу на серверах ТГ
+
+        # в потоковом режиме файл заранее не скачивается: при отправке на проверку он пойдет из ТГ прямо в песочницу
+        if STREAM_TG_UPLOADS:
+            await state.update_data({SandboxInteractionsParameters.file_to_scan: None})
+            await state.update_data({SandboxInteractionsParameters.tg_file_path: file_path_on_server})
+            await state.update_data({SandboxInteractionsParameters.file_name: file_name})
+            await state.update_data({SandboxInteractionsParameters.file_size: telegram_file_id.file_size})
+            await state.update_data({SandboxInteractionsParameters.file_unique_id: file_from_user.file_unique_id})
+            await state.update_data({SandboxInteractionsParameters.file_sha256: known_file.sha256 if known_file else None})
+
+            logger.info(f"File {file_from_user.file_name} from user {message.from_user.id} will be streamed to PTSB without saving to disk")
+            await message.answer(
+                f"✅ Файл <code>{file_from_user.file_name}</code> принят!\n\n"
+                "Он будет передан в песочницу напрямую из ТГ при отправке на проверку."
+            )
+            await message.answer(
+                "Если Вы знаете, что файлы зашифрованы паролем, укажите их сейчас, каждый с новой строки. Всего не более 5 паролей.\n"
+                "Если паролей нет, нажмите кнопку ниже.",
+                reply_markup=custom_keyboars.send_to_scan_keyboard
+            )
+            await state.set_state(SandboxInteractionStates.send_req_for_scan)
+            return
 
         # информируем пользователя о том, что собираемся начать процесс загрузки файла
         # информирование нужно, т.к. процесс загрузки может занять значительное время из-за блокировок ТГ
-        await message.answer(
-            "📥 <b>Выполняю загрузку файла</b>\n"
-            f"<code>{file_from_user.file_name}</code>\n\n"
-            "Загрузка может занять продолжительное время в связи с замедлением работы ТГ в РФ."
+        status_message = await message.answer(
+            build_download_status_text(file_from_user.file_name, 0, telegram_file_id.file_size)
         )
 
-        # начинаем процесс скачивания файла с попытками перезапуска в случае ошибок
-        for download_attempt in range(MAX_DOWNLOAD_RETRIES):
-            try:
-                logger.info(f"Starting attempt №{download_attempt + 1} downloading file {file_from_user.file_name} from user {message.from_user.id}")
-                
-                # скачиваем файл напрямую внутрь контейнера, используя путь к файлу на сервере ТГ
-                await bot.download_file(
-                    file_path=file_path_on_server,
-                    destination=downloaded_file_path,
-                    timeout=DOWNLOAD_TIMEOUT,
-                    chunk_size=DOWNLOAD_CHUNCK_SIZE
-                )
-
-                # заносим путь к загруженному файлу в контекст текущего пользователя
-                await state.update_data({SandboxInteractionsParameters.file_to_scan: downloaded_file_path})
-
-                # отвечаем юзеру и идем дальше
-                logger.info(f"File {file_from_user.file_name} was succesfully downloaded to bot from user {message.from_user.id}")
-                await message.answer(
-                    f"✅ Файл <code>{file_from_user.file_name}</code> успешно загружен в бота!"
-                )
+        # скачиваем файл напрямую внутрь контейнера, после обрывов продолжая с последнего скачанного байта
+        logger.info(f"Starting download of file {file_from_user.file_name} from user {message.from_user.id}")
+        tg_download = ResumableTgDownload(
+            bot=bot,
+            file_path=file_path_on_server,
+            destination=downloaded_file_path,
+            file_size=telegram_file_id.file_size,
+            timeout=DOWNLOAD_TIMEOUT,
+            chunk_size=DOWNLOAD_CHUNCK_SIZE,
+            max_retries=MAX_DOWNLOAD_RETRIES,
+            retry_delay=DOWNLOADL_RETRY_TIME,
+            on_progress=functools.partial(report_download_progress, status_message, file_from_user.file_name)
+        )
+        try:
+            await tg_download.download()
+        except TgDownloadError as download_error:
+            logger.error(f"Final attempt to download file {file_from_user.file_name} from user {message.from_user.id} failed: {download_error}")
+            raise
+
+        # заносим путь к загруженному файлу и его хэш в контекст текущего пользователя
+        file_sha256 = await asyncio.to_thread(calculate_file_sha256, downloaded_file_path)
+        await state.update_data({SandboxInteractionsParameters.file_to_scan: downloaded_file_path})
+        await state.update_data({SandboxInteractionsParameters.file_size: os.path.getsize(downloaded_file_path)})
+        await state.update_data({SandboxInteractionsParameters.file_sha256: file_sha256})
+        await state.update_data({SandboxInteractionsParameters.file_unique_id: file_from_user.file_unique_id})
+        await tg_files_functions.remember_file(file_from_user.file_unique_id, file_sha256)
+
+        # отвечаем юзеру и идем дальше
+        logger.info(f"File {file_from_user.file_name} was succesfully downloaded to bot from user {message.from_user.id} in {tg_download.attempts} attempts")
+        await message.answer(
+            f"✅ Файл <code>{file_from_user.file_name}</code> успешно загружен в бота!"
+        )
 
-                # запрашиваем ввод паролей для отправки задания на проверку, в любом случае в это состояние
-                await message.answer(
-                    "Если Вы знаете, что файлы зашифрованы паролем, укажите их сейчас, каждый с новой строки. Всего не более 5 паролей.\n"
-                    "Если паролей нет, нажмите кнопку ниже.",
-                    reply_markup=custom_keyboars.send_to_scan_keyboard
-                )
-                await state.set_state(SandboxInteractionStates.send_req_for_scan)
-                return
-            
-            # ошибки, связанные с таймаутом ожидания загрузки файла пользователем
-            except (TimeoutError, TelegramNetworkError) as download_error:
-                # удаляем частично скачанный файл если он существует
-                if os.path.exists(downloaded_file_path):
-                    os.remove(downloaded_file_path)
-                    logger.info(f"File {file_from_user.file_name} was deleted from local storage after unseccessful download try №{download_attempt + 1} from user {message.from_user.id}") 
-                # пытаемся сначала через указанное время секунд, если попытка не крайняя
-                if download_attempt < MAX_DOWNLOAD_RETRIES - 1:
-                    logger.warning(f"Attempt №{download_attempt + 1} to download file {file_from_user.file_name} from user {message.from_user.id} failed. Retrying in {DOWNLOADL_RETRY_TIME}")
-                    await asyncio.sleep(DOWNLOADL_RETRY_TIME)
-                
-                # если попытка всё таки крайняя - кидаем excpetrion выше
-                else:
-                    logger.error(f"Final attempt to download file {file_from_user.file_name} from user {message.from_user.id} failed")
-                    raise download_error
+        # запрашиваем ввод паролей для отправки задания на проверку, в любом случае в это состояние
+        await message.answer(
+            "Если Вы знаете, что файлы зашифрованы паролем, укажите их сейчас, каждый с новой строки. Всего не более 5 паролей.\n"
+            "Если паролей нет, нажмите кнопку ниже.",
+            reply_markup=custom_keyboars.send_to_scan_keyboard
+        )
+        await state.set_state(SandboxInteractionStates.send_req_for_scan)
+        return
     
     # обработка если пользователь будет пытаться слишком часто загрузить файл
     except TelegramRetryAfter as e:
@@ -1121,7 +1616,7 @@ async def upload_file_to_bot(message: Message, state: FSMContext) -> None:
         return
 
     # обработка ошибок загрузки файла по таймауту
-    except (TimeoutError, TelegramNetworkError) as e:
+    except (TimeoutError, TelegramNetworkError, TgDownloadError) as e:
         user_data = await state.get_data()
         user_role = user_data.get(SandboxInteractionsParameters.user_role)
         reply_keyboard = custom_keyboars.admin_main_sandbox_keyboard if user_role == UsersRolesInBot.main_admin else custom_keyboars.user_main_sandbox_keyboard
@@ -1177,223 +1672,1294 @@ async def upload_file_to_bot(message: Message, state: FSMContext) -> None:
         return
 
 
-# хэндлер обработки ввода паролей для распаковки
-@dp.message(SandboxInteractionStates.send_req_for_scan)
-async def send_data_to_scan(message: Message, state: FSMContext) -> None:
-    
-    # получаем пользовательский ввод паролей
-    user_passwords_input: str = message.text
+# сообщение о ходе скачивания пачки файлов
+class BatchDownloadStatus:
+    """
+    Ведет одно общее сообщение о скачивании пачки файлов: сколько файлов уже готово и сколько байт скачано по всем файлам.
+    Сообщение обновляется не чаще, чем `TG_DOWNLOAD_PROGRESS_INTERVAL`, т.к. ТГ ограничивает частоту редактирования.
+    """
 
-    if user_passwords_input is None:
-        await message.answer(
-            "⚠️ <b>Ожидался ввод паролей.</b>\n\n"
-            "Сообщение не содержит текста."
-        )
-        await message.answer(
-            "Напишите пароли повторно или отправьте задание на проверку без указания паролей.",
-            reply_markup=custom_keyboars.send_to_scan_keyboard
+    def __init__(self, status_message: Message, file_sizes: list[Optional[int]]) -> None:
+        self._status_message = status_message
+        self._file_sizes = file_sizes
+        self._downloaded = [0] * len(file_sizes)
+        self._finished = [False] * len(file_sizes)
+        self._last_reported_at = 0.0
+
+    # текст сообщения
+    def build_text(self) -> str:
+        total_size = sum(file_size or 0 for file_size in self._file_sizes)
+        downloaded = sum(self._downloaded)
+        progress = f"{downloaded / (1024 * 1024):.1f} из {total_size / (1024 * 1024):.1f} МБ"
+        if total_size:
+            progress += f" ({min(downloaded * 100 // total_size, 100)}%)"
+
+        return (
+            "📥 <b>Выполняю загрузку файлов</b>\n\n"
+            f"Готово файлов: {sum(self._finished)} из {len(self._file_sizes)}\n"
+            f"Загружено: {progress}\n\n"
+            "Загрузка может занять продолжительное время в связи с замедлением работы ТГ в РФ."
         )
-        await state.set_state(SandboxInteractionStates.send_req_for_scan)
-        return
 
-    # если ввод не равен "отправить сейчас на проверку" причем берем только первые 5 паролей
-    list_of_pwds: list = []
-    if user_passwords_input != custom_keyboars.BTN_SANDBOX_MENU_SEND_TO_SCAN:
-        list_of_pwds = user_passwords_input.split('\n')[:5]
-        await state.update_data({SandboxInteractionsParameters.list_of_pwds: list_of_pwds})
-    
-    # предварительно получаем параметры юзерочка из его же данных
-    user_data = await state.get_data()
-    user_role = user_data.get(SandboxInteractionsParameters.user_role)
-    scan_priority = user_data.get(SandboxInteractionsParameters.scan_priority)
-    can_get_links = user_data.get(SandboxInteractionsParameters.can_get_links)
+    async def _report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_reported_at < TG_DOWNLOAD_PROGRESS_INTERVAL:
+            return
 
-    # определяем, что именно пользователь хочет отправить на проверку ссылку или файл
-    scan_type = user_data.get(SandboxInteractionsParameters.scan_type)
+        self._last_reported_at = now
+        try:
+            await self._status_message.edit_text(self.build_text())
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.warning("Failed to update batch download status message", exc_info=True)
+
+    # вызывается скачиванием одного из файлов
+    async def update(self, index: int, bytes_downloaded: int, file_size: Optional[int]) -> None:
+        self._downloaded[index] = bytes_downloaded
+        await self._report()
+
+    # файл готов: скачан, взят из кэша или не скачался
+    async def finish(self, index: int) -> None:
+        self._finished[index] = True
+        if self._file_sizes[index]:
+            self._downloaded[index] = self._file_sizes[index]
+        await self._report(force=all(self._finished))
+
+
+# скачивание одного файла из пачки
+async def download_batch_file(
+        file_message: Message,
+        index: int,
+        download_semaphore: asyncio.Semaphore,
+        download_status: BatchDownloadStatus
+    ) -> dict:
+    """
+    Готовит к отправке на проверку один файл из пачки: если по файлу уже есть актуальный вердикт, файл не скачивается,
+    в потоковом режиме запоминается только путь к файлу на серверах ТГ, иначе файл скачивается в `DOWNLODAD_DIR`.
+    Одновременно скачивается не больше `BATCH_DOWNLOAD_CONCURRENCY` файлов.
 
-    # если сканит ссылку
-    if scan_type == "url":
-        logger.info(f"User {message.from_user.id} sent link to scan")
+    Принимает:
+        - `file_message` (Message): сообщение пользователя с файлом
+        - `index` (int): номер файла в пачке
+        - `download_semaphore` (asyncio.Semaphore): ограничение числа одновременных скачиваний
+        - `download_status` (BatchDownloadStatus): общее сообщение о ходе скачивания
 
-        url_to_scan = user_data.get(SandboxInteractionsParameters.url_to_scan)
-        # грузим это наконец то в песочницу
-        scan_req: SendScanRequest = await ptsb_client.send_link_to_scan(
-            checking_link=url_to_scan,
-            check_priority=scan_priority,
-            passwords=list_of_pwds
-        )
-    
-    # если сканит файл
-    elif scan_type == "file":
-        logger.info(f"User {message.from_user.id} sent file to scan")
+    Возвращает:
+        - `dict`: параметры файла для отправки на проверку, при ошибке в нем заполнено поле `error`
+    """
 
-        file_to_scan = user_data.get(SandboxInteractionsParameters.file_to_scan)
-        # опять грузим это в песочницу
-        scan_req: SendScanRequest = await ptsb_client.send_file_to_scan(
-            path_to_file_to_upload=file_to_scan,
-            check_priority=scan_priority,
-            passwords=list_of_pwds
-        )
-        
-        # и в любом случае удалям файл от пользака
-        if os.path.exists(file_to_scan):
-            os.remove(file_to_scan)
-            logger.info(f"File {file_to_scan} from user {message.from_user.id} was deleted from local storage after sending it to scan")
-        
+    file_from_user: Document = file_message.document
+    file_name = file_from_user.file_name or file_from_user.file_unique_id
+    batch_file = {
+        "file_name": file_name,
+        "file_to_scan": None,
+        "tg_file_path": None,
+        "file_size": file_from_user.file_size,
+        "file_unique_id": file_from_user.file_unique_id,
+        "file_sha256": None,
+        "error": None
+    }
 
-    # если загрузилось не совсем удачно
-    if not scan_req.is_ok:
-        logger.warning(f"Scan request from user {message.from_user.id} was unsuccessful. Error: {scan_req.error_message}")
+    # имя файла, который мы создадим локально = TG+<user_id>+<id сообщения>+<имя файла от юзера>, чтобы одинаковые имена в пачке не совпали
+    downloaded_file_path = os.path.join(DOWNLODAD_DIR, f"TG-{file_message.from_user.id}-{file_message.message_id}-{file_name}")
 
-        reply_keyboard = custom_keyboars.admin_main_sandbox_keyboard if user_role == UsersRolesInBot.main_admin else custom_keyboars.user_main_sandbox_keyboard
-        new_state = SandboxInteractionStates.sandbox_admin_menu if user_role == UsersRolesInBot.main_admin else SandboxInteractionStates.sandbox_user_menu
+    try:
+        # если этот файл уже присылали и по нему есть актуальный вердикт - скачивать его не нужно
+        known_file: KnownTgFileFromDb = await tg_files_functions.get_known_file(file_from_user.file_unique_id)
+        if known_file is not None:
+            batch_file["file_sha256"] = known_file.sha256
+            if await verdict_cache_functions.get_fresh_verdict(known_file.sha256) is not None:
+                logger.info(f"File {file_name} from user {file_message.from_user.id} is already known, download from TG was skipped")
+                return batch_file
+
+        async with download_semaphore:
+            telegram_file_id = await file_message.bot.get_file(file_from_user.file_id)
+            batch_file["tg_file_path"] = telegram_file_id.file_path
+            batch_file["file_size"] = telegram_file_id.file_size
+
+            # в потоковом режиме файл пойдет из ТГ прямо в песочницу при отправке на проверку
+            if STREAM_TG_UPLOADS:
+                return batch_file
+
+            logger.info(f"Starting download of file {file_name} from user {file_message.from_user.id} as part of batch")
+            tg_download = ResumableTgDownload(
+                bot=file_message.bot,
+                file_path=telegram_file_id.file_path,
+                destination=downloaded_file_path,
+                file_size=telegram_file_id.file_size,
+                timeout=DOWNLOAD_TIMEOUT,
+                chunk_size=DOWNLOAD_CHUNCK_SIZE,
+                max_retries=MAX_DOWNLOAD_RETRIES,
+                retry_delay=DOWNLOADL_RETRY_TIME,
+                on_progress=functools.partial(download_status.update, index)
+            )
+            await tg_download.download()
+
+        file_sha256 = await asyncio.to_thread(calculate_file_sha256, downloaded_file_path)
+        await tg_files_functions.remember_file(file_from_user.file_unique_id, file_sha256)
+        batch_file["file_to_scan"] = downloaded_file_path
+        batch_file["file_sha256"] = file_sha256
+
+        logger.info(f"File {file_name} was succesfully downloaded to bot from user {file_message.from_user.id} in {tg_download.attempts} attempts")
+        return batch_file
 
+    except TelegramRetryAfter as e:
+        logger.warning(f"Flood detected from user ID {file_message.from_user.id} while downloading batch. Retry in {e.retry_after} seconds")
+        batch_file["error"] = "слишком много запросов к ТГ"
+
+    except (TimeoutError, TelegramNetworkError, TgDownloadError) as e:
+        logger.error(f"Network error while downloading file {file_name} from user {file_message.from_user.id}: {str(e)}")
+        batch_file["error"] = "ошибка сети при загрузке"
+
+    except TelegramBadRequest as e:
+        if "file is too big" in str(e):
+            logger.info(f"File {file_name} wasn't succesfully downloaded to bot from user {file_message.from_user.id} becouse of its large size")
+            batch_file["error"] = "файл слишком большой"
+        else:
+            logger.error(f"File {file_name} wasn't succesfully downloaded to bot from user {file_message.from_user.id}", exc_info=True)
+            batch_file["error"] = f"неожиданная ошибка: {str(e)}"
+
+    finally:
+        await download_status.finish(index)
+
+    # удаляем частично скачанный файл если он существует
+    if os.path.exists(downloaded_file_path):
+        os.remove(downloaded_file_path)
+        logger.info(f"File {file_name} was deleted from local storage after failed download from user {file_message.from_user.id}")
+    return batch_file
+
+
+# загрузка нескольких файлов одной пачкой
+async def upload_batch_to_bot(batch_messages: list[Message], state: FSMContext, user_data: dict) -> None:
+    """
+    Скачивает пачку файлов параллельно и переводит пользователя к вводу паролей. Пароли применяются ко всем файлам пачки.
+
+    Принимает:
+        - `batch_messages` (list[Message]): сообщения пользователя с файлами в порядке отправки
+        - `state` (FSMContext): контекст состояния пользователя
+        - `user_data` (dict): данные пользователя из контекста
+    """
+
+    message = batch_messages[-1]
+    user_role = user_data.get(SandboxInteractionsParameters.user_role)
+    reply_keyboard = custom_keyboars.admin_main_sandbox_keyboard if user_role == UsersRolesInBot.main_admin else custom_keyboars.user_main_sandbox_keyboard
+    new_state = SandboxInteractionStates.sandbox_admin_menu if user_role == UsersRolesInBot.main_admin else SandboxInteractionStates.sandbox_user_menu
+
+    logger.info(f"User {message.from_user.id} sent batch of {len(batch_messages)} files to scan")
+
+    file_sizes = [file_message.document.file_size for file_message in batch_messages]
+    status_message = await message.answer(f"📥 <b>Выполняю загрузку файлов: {len(batch_messages)}</b>")
+    download_status = BatchDownloadStatus(status_message, file_sizes)
+    download_semaphore = asyncio.Semaphore(BATCH_DOWNLOAD_CONCURRENCY)
+
+    batch_files: list[dict] = await asyncio.gather(*(
+        download_batch_file(file_message, index, download_semaphore, download_status)
+        for index, file_message in enumerate(batch_messages)
+    ))
+
+    failed_files = [batch_file for batch_file in batch_files if batch_file["error"]]
+    batch_files = [batch_file for batch_file in batch_files if not batch_file["error"]]
+
+    if failed_files:
+        await message.answer(
+            "⚠️ <b>Не удалось загрузить файлы:</b>\n\n" +
+            "\n".join(f"📄 <code>{html.escape(batch_file['file_name'])}</code>: {batch_file['error']}" for batch_file in failed_files)
+        )
+
+    # ни один файл не загрузился - возвращаем пользователя в меню
+    if not batch_files:
         await message.answer(
-            "⚠️ Не удалось отправить запрос на проверку.\n\n"
-            "Свяжитесь с администратором и передайте ему эту информацию:\n"
-            f"{scan_req.error_message}",
+            "Пожалуйста, попробуйте позже, отправьте файлы меньшего размера или отправьте их через ссылку на скачивание из внешнего ресурса.",
             reply_markup=reply_keyboard
         )
         await state.set_state(new_state)
+        await state.update_data({SandboxInteractionsParameters.file_uploaded: False})
         return
-    
-    # если все таки удачно
-    else:
-        logger.info(f"Scan request from user {message.from_user.id} was successful")
 
-        # уменьшаем количество проверок + увеличиваем общий счетчик
-        decrease = await sandbox_profiles_functions.decrease_remaining_checks(
-            tg_user_id=message.from_user.id,
-            decrease_amount=1
+    await state.update_data({
+        SandboxInteractionsParameters.scan_type: "batch",
+        SandboxInteractionsParameters.batch_files: batch_files
+    })
+
+    await message.answer(
+        f"✅ Файлов принято: {len(batch_files)} из {len(batch_messages)}.\n\n" +
+        "\n".join(f"📄 <code>{html.escape(batch_file['file_name'])}</code>" for batch_file in batch_files)
+    )
+
+    # запрашиваем ввод паролей, они будут применены ко всем файлам пачки
+    await message.answer(
+        "Если Вы знаете, что файлы зашифрованы паролем, укажите их сейчас, каждый с новой строки. Всего не более 5 паролей.\n"
+        "Пароли будут применены ко всем файлам. Если паролей нет, нажмите кнопку ниже.",
+        reply_markup=custom_keyboars.send_to_scan_keyboard
+    )
+    await state.set_state(SandboxInteractionStates.send_req_for_scan)
+
+
+# потоковая передача файла из ТГ в песочницу без сохранения на диск
+async def stream_tg_file_to_scan(bot: Bot, job: SubmissionJobFromDb) -> tuple[SendScanRequest, Optional[str]]:
+    """
+    Передает файл из ТГ в PTSB потоком: чанки скачивания сразу становятся телом запроса `checkFile`.
+    Если скачивание из ТГ обрывается, загрузка в песочницу прерывается и вся передача повторяется заново.
+
+    Принимает:
+        - `bot` (Bot): бот, через сессию которого скачивается файл
+        - `job` (SubmissionJobFromDb): задание на отправку с параметрами файла, приоритетом и паролями
+
+    Возвращает:
+        - `tuple[SendScanRequest, Optional[str]]`: результат создания задания и SHA-256 файла, если он был передан целиком
+    """
+
+    for stream_attempt in range(MAX_DOWNLOAD_RETRIES):
+        logger.info(f"Starting attempt №{stream_attempt + 1} streaming file {job.file_name} from TG to PTSB")
+
+        file_stream = TgFileStream(
+            bot=bot,
+            file_path=job.tg_file_path,
+            timeout=DOWNLOAD_TIMEOUT,
+            chunk_size=DOWNLOAD_CHUNCK_SIZE
         )
-        increase = await sandbox_profiles_functions.increase_total_checks(
-            tg_user_id=message.from_user.id,
-            increase_amount=1
+        scan_req: SendScanRequest = await ptsb_client.send_stream_to_scan(
+            file_name=job.file_name,
+            file_size=job.file_size,
+            file_chunks=file_stream,
+            check_priority=job.check_priority,
+            passwords=job.passwords
         )
-        
-        # проверка на то, что юзер существует
-        if not decrease or not increase:
-            logger.info(f"Tried to lower remaining checks for user {message.from_user.id}, but his profile was not found. Set state check_user_status for user")
 
-            await state.clear()
-            await state.set_state(UserStates.check_user_status)
-            await message.answer(
-                "⚠️ Кажется, доступ для Вас прекращен.",
-                reply_markup=custom_keyboars.check_status_keyboard
-            )
+        # ошибок со стороны ТГ не было - результат определяется ответом песочницы
+        if file_stream.error is None:
+            if file_stream.is_complete:
+                await tg_files_functions.remember_file(job.file_unique_id, file_stream.sha256)
+            return scan_req, file_stream.sha256
+
+        logger.warning(f"Attempt №{stream_attempt + 1} to stream file {job.file_name} failed on TG side: {file_stream.error}")
+        if stream_attempt < MAX_DOWNLOAD_RETRIES - 1:
+            await asyncio.sleep(DOWNLOADL_RETRY_TIME)
+
+    logger.error(f"Final attempt to stream file {job.file_name} from TG to PTSB failed")
+    return SendScanRequest(is_ok=False, error_message=f"Не удалось скачать файл из ТГ: {file_stream.error}"), None
+
+
+# сообщение пользователю о месте его задания в очереди на отправку
+class QueuePositionMessage:
+    """
+    Отправляет пользователю сообщение с местом задания в очереди, обновляет его при сдвиге очереди
+    и удаляет, когда задание отправляется в песочницу.
+    """
+
+    def __init__(self, bot: Bot, chat_id: int) -> None:
+        self._bot = bot
+        self._chat_id = chat_id
+        self._sent_message: Optional[Message] = None
+
+    # вызывается очередью с новым местом задания
+    async def update(self, position: int) -> None:
+        text = (
+            "🕒 <b>Песочница сейчас загружена, задание ожидает очереди на отправку.</b>\n\n"
+            f"Место в очереди: {position}"
+        )
+        if self._sent_message is None:
+            self._sent_message = await self._bot.send_message(chat_id=self._chat_id, text=text)
+        else:
+            await self._sent_message.edit_text(text)
+
+    # удаление сообщения, когда очередь подошла
+    async def remove(self) -> None:
+        if self._sent_message is None:
             return
 
-        # отправляем сообщение что всё удалось с учетом того, можно ли юзеру получать результаты проверки или нет
-        if can_get_links:
-            # кнопка
-            scan_button = InlineKeyboardButton(
-                text = "Перейти к заданию",
-                url = f"https://{PTSB_ROOT_ADDR}/tasks/{scan_req.scan_id}"
+        sent_message, self._sent_message = self._sent_message, None
+        try:
+            await sent_message.delete()
+        except TelegramAPIError:
+            logger.warning(f"Failed to delete queue position message in chat {self._chat_id}", exc_info=True)
+
+
+# подпись задания в сообщениях
+def format_job_label(job: SubmissionJobFromDb) -> str:
+    if job.scan_type == "url":
+        return f"🔗 <code>{html.escape(job.url)}</code>"
+    return f"📄 <code>{html.escape(job.file_name)}</code>"
+
+
+# отправка длинного списка строк несколькими сообщениями
+async def send_lines_message(
+        bot: Bot,
+        chat_id: int,
+        header: str,
+        lines: list[str],
+        footer: str = "",
+        reply_markup=None
+    ) -> None:
+    """
+    Отправляет заголовок и список строк, разбивая их на несколько сообщений, если они не помещаются в ограничение ТГ
+    на длину одного сообщения. Клавиатура прикрепляется к последнему сообщению.
+
+    Принимает:
+        - `bot` (Bot): бот, от имени которого отправляются сообщения
+        - `chat_id` (int): ID чата
+        - `header` (str): текст в начале первого сообщения
+        - `lines` (list[str]): строки списка
+        - `footer` (str): текст в конце последнего сообщения
+        - `reply_markup`: клавиатура для последнего сообщения
+    """
+
+    messages_text: list[str] = []
+    current_text = header
+    for line in lines:
+        if len(current_text) + len(line) + 1 > MAX_MESSAGE_LENGTH:
+            messages_text.append(current_text)
+            current_text = line
+        else:
+            current_text = f"{current_text}\n{line}" if current_text else line
+
+    if footer and len(current_text) + len(footer) > MAX_MESSAGE_LENGTH:
+        messages_text.append(current_text)
+        current_text = footer.lstrip()
+    else:
+        current_text += footer
+    messages_text.append(current_text)
+
+    for number, text in enumerate(messages_text, start=1):
+        await bot.send_message(
+            chat_id=chat_id,
+            text=text,
+            reply_markup=reply_markup if number == len(messages_text) else None
+        )
+
+
+# ID заданий на отправку, которые сейчас выполняются, чтобы одно задание не выполнялось дважды
+running_submission_jobs: set[str] = set()
+
+
+# выполнение задания на отправку в песочницу
+async def run_submission_job(bot: Bot, job: SubmissionJobFromDb) -> Optional[SendScanRequest]:
+    """
+    Загружает задание в песочницу и сообщает пользователю результат. Задание хранится в БД до получения
+    результатов проверки, поэтому при перезапуске бота его можно продолжить с того места, где оно прервалось.
+    По заданиям из пачки файлов отдельных сообщений не отправляется, о них сообщает `run_submission_batch`.
+    Если такой же файл или ссылка уже отправлены на проверку и ее результатов еще ждут, задание не загружается,
+    а присоединяется к этой проверке.
+
+    Принимает:
+        - `bot` (Bot): бот, от имени которого отправляются сообщения
+        - `job` (SubmissionJobFromDb): задание на отправку с уже зарезервированной проверкой
+
+    Возвращает:
+        - `SendScanRequest` (object of custom class): результат создания задания в песочнице
+        - `None`, если задание уже выполняется или было завершено раньше
+    """
+
+    if job.job_id in running_submission_jobs:
+        logger.info(f"Submission job {job.job_id} is already running, skipping duplicate")
+        return None
+
+    running_submission_jobs.add(job.job_id)
+    try:
+        # пока такое же задание загружается, ждем его, а потом присоединяемся к созданной проверке
+        flight_key = inflight.job_key(job)
+        if flight_key is None:
+            return await _run_submission_job(bot, job)
+
+        joined = await inflight_scans.join(flight_key)
+        if isinstance(joined, str):
+            # результаты присоединенного задания запрашиваются у того же узла песочницы, где создана проверка
+            attached_scan = scan_poller.get(joined)
+            return await attach_submission_job(bot, job, joined, attached_scan.ptsb_node if attached_scan is not None else None)
+
+        # загружаем сами, ожидающие такие же задания узнают результат загрузки в любом случае
+        # если загрузка уже завершена раньше (при ожидании быстрого вердикта), повторное завершение ничего не сделает
+        scan_req: Optional[SendScanRequest] = None
+        try:
+            scan_req = await _run_submission_job(bot, job, flight_key, joined)
+        finally:
+            inflight_scans.finish_upload(flight_key, scan_req.scan_id if scan_req is not None and scan_req.is_ok else None, joined)
+        return scan_req
+    finally:
+        running_submission_jobs.discard(job.job_id)
+
+
+# присоединение задания к уже созданной проверке такого же файла или ссылки
+async def attach_submission_job(bot: Bot, job: SubmissionJobFromDb, scan_id: str, ptsb_node: Optional[str] = None) -> SendScanRequest:
+    """
+    Присоединяет задание к проверке, которую уже создало такое же задание: в песочницу ничего не загружается,
+    а результаты проверки придут пользователю вместе с результатами этой проверки. Зарезервированная проверка
+    списывается или возвращается в зависимости от `INFLIGHT_CHARGE_POLICY`.
+
+    Принимает:
+        - `bot` (Bot): бот, от имени которого отправляются сообщения
+        - `job` (SubmissionJobFromDb): задание на отправку с уже зарезервированной проверкой
+        - `scan_id` (str): ID задания в песочнице, к которому присоединяется задание
+        - `ptsb_node` (str): адрес узла песочницы, на котором создано это задание
+
+    Возвращает:
+        - `SendScanRequest` (object of custom class): результат с ID задания, к которому присоединено задание
+    """
+
+    logger.info(f"Submission job {job.job_id} of user {job.tg_user_id} was attached to in-flight scan_id={scan_id}")
+
+    # дальше задание ждет результатов так же, как если бы создало проверку само
+    await submission_jobs_functions.mark_submitted(job.job_id, scan_id, ptsb_node=ptsb_node)
+
+    # файл уже загружен в песочницу другим заданием, своя копия не нужна
+    remove_job_file(job, "after attaching to in-flight scan")
+
+    is_charged = inflight.INFLIGHT_CHARGE_POLICY == inflight.INFLIGHT_CHARGE_FULL
+    if is_charged:
+        await sandbox_profiles_functions.commit_checks(tg_user_id=job.tg_user_id)
+    else:
+        await sandbox_profiles_functions.refund_checks(tg_user_id=job.tg_user_id)
+
+    # результаты могли прийти, пока задание присоединялось, - тогда опрос запустится заново и отдаст их этому заданию
+    scan_poller.track(
+        PendingScan(
+            scan_id=scan_id,
+            tg_user_id=job.tg_user_id,
+            chat_id=job.chat_id,
+            user_role=job.user_role,
+            can_get_links=job.can_get_links,
+            sha256=job.file_sha256 if job.scan_type == "file" and not job.passwords else None,
+            url=urls.canonicalize_url(job.url) if job.scan_type == "url" and not job.passwords else None,
+            ptsb_node=ptsb_node
+        )
+    )
+
+    # по заданиям из пачки сообщает общая сводка
+    if job.batch_id is None:
+        reply_keyboard = custom_keyboars.admin_main_sandbox_keyboard if job.user_role == UsersRolesInBot.main_admin else custom_keyboars.user_main_sandbox_keyboard
+        charge_text = "" if is_charged else "\nПроверка не была списана."
+
+        await bot.send_message(
+            chat_id=job.chat_id,
+            text=(
+                "✅ <b>Это уже проверяется!</b>\n\n"
+                f"{'Такой же файл' if job.scan_type == 'file' else 'Такую же ссылку'} только что отправили на проверку, "
+                f"Ваше задание присоединено к ней. Ее ID: <code>{scan_id}</code>.{charge_text}"
+            ),
+            reply_markup=build_scan_link_keyboard(scan_id, ptsb_node) if job.can_get_links else None
+        )
+        await bot.send_message(
+            chat_id=job.chat_id,
+            text=(
+                "⏳ Результаты проверки придут в этот чат автоматически, как только будут готовы.\n\n"
+                "Пока можете выбрать дальнейшее действие:"
+            ),
+            reply_markup=reply_keyboard
+        )
+
+    return SendScanRequest(is_ok=True, scan_id=scan_id, ptsb_node=ptsb_node)
+
+
+# удаление локальной копии файла задания
+def remove_job_file(job: SubmissionJobFromDb, reason: str) -> None:
+    # файл удаляется только после того, как состояние задания сохранено в БД: если бот упадет раньше,
+    # задание продолжится после перезапуска с тем же файлом, а забытый файл удалит очистка папки загрузок
+    if job.file_path and os.path.exists(job.file_path):
+        os.remove(job.file_path)
+        logger.info(f"File {job.file_path} from user {job.tg_user_id} was deleted from local storage {reason}")
+
+
+# сама загрузка задания и ответ пользователю
+async def _run_submission_job(bot: Bot, job: SubmissionJobFromDb, flight_key: Optional[str] = None, upload: Optional[asyncio.Event] = None) -> Optional[SendScanRequest]:
+    reply_keyboard = custom_keyboars.admin_main_sandbox_keyboard if job.user_role == UsersRolesInBot.main_admin else custom_keyboars.user_main_sandbox_keyboard
+    file_sha256 = job.file_sha256
+
+    # размер определяется до загрузки, пока скачанный файл еще не удален
+    # небольшие файлы и ссылки песочница проверяет за несколько секунд, поэтому их результаты начинаем запрашивать раньше
+    wait_for_verdict = is_sync_scan(job.scan_type, job.file_size, job.file_path)
+
+    # ждем своей очереди на загрузку, пока песочница занята заданиями других пользователей
+    # место в очереди показываем только для одиночных заданий, чтобы пачка не засыпала чат сообщениями
+    queue_position_message = QueuePositionMessage(bot, job.chat_id)
+    on_position = queue_position_message.update if job.batch_id is None else None
+    try:
+        async with submission_queue.slot(job.tg_user_id, job.check_priority, on_position=on_position):
+            await queue_position_message.remove()
+
+            # отмечаем начало загрузки: если бот перезапустится во время нее, задание будет загружено повторно
+            upload_attempt = await submission_jobs_functions.mark_uploading(job.job_id)
+            if upload_attempt is None:
+                logger.info(f"Submission job {job.job_id} was already finished, skipping it")
+                return None
+
+            # если сканит ссылку
+            if job.scan_type == "url":
+                logger.info(f"User {job.tg_user_id} sent link to scan (attempt №{upload_attempt})")
+
+                # грузим это наконец то в песочницу
+                scan_req: SendScanRequest = await ptsb_client.send_link_to_scan(
+                    checking_link=job.url,
+                    check_priority=job.check_priority,
+                    passwords=job.passwords
+                )
+    
+            # если сканит файл
+            else:
+                logger.info(f"User {job.tg_user_id} sent file to scan (attempt №{upload_attempt})")
+
+                # в потоковом режиме файл идет из ТГ в песочницу напрямую, хэш считается по ходу передачи
+                if not job.file_path:
+                    scan_req, file_sha256 = await stream_tg_file_to_scan(bot=bot, job=job)
+
+                else:
+                    # опять грузим это в песочницу
+                    scan_req: SendScanRequest = await ptsb_client.send_file_to_scan(
+                        path_to_file_to_upload=job.file_path,
+                        check_priority=job.check_priority,
+                        passwords=job.passwords
+                    )
+    finally:
+        await queue_position_message.remove()
+
+    # если загрузилось не совсем удачно - возвращаем зарезервированную проверку
+    if not scan_req.is_ok:
+        logger.warning(f"Scan request from user {job.tg_user_id} was unsuccessful. Error: {scan_req.error_message}")
+
+        # задание до песочницы не дошло - возвращаем и проверку, и отправку в ограничении частоты, учтенную при создании задания
+        await sandbox_profiles_functions.refund_checks(tg_user_id=job.tg_user_id)
+        submission_rate_limiter.release(job.tg_user_id, job.created_at)
+
+        # задание из пачки остается в БД со строкой для общего отчета, об ошибке сообщит сводка по пачке
+        if job.batch_id is not None:
+            await submission_jobs_functions.complete_job(
+                job.job_id,
+                f"{format_job_label(job)}: ⚠️ не удалось отправить на проверку, проверка не списана"
             )
-            # клавиатура
-            scan_keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[[scan_button]]
+            remove_job_file(job, "after failed attempt to send it to scan")
+            return scan_req
+
+        await submission_jobs_functions.delete_job(job.job_id)
+        remove_job_file(job, "after failed attempt to send it to scan")
+
+        await bot.send_message(
+            chat_id=job.chat_id,
+            text=(
+                "⚠️ Не удалось отправить запрос на проверку. Проверка не была списана.\n\n"
+                "Свяжитесь с администратором и передайте ему эту информацию:\n"
+                f"{scan_req.error_message}"
+            ),
+            reply_markup=reply_keyboard
+        )
+        return scan_req
+    
+    # если все таки удачно
+    logger.info(f"Scan request from user {job.tg_user_id} was successful, scan_id={scan_req.scan_id}, ptsb_node={scan_req.ptsb_node}")
+
+    # задание дальше хранится только ради ожидания результатов, а зарезервированная проверка учитывается в общем счетчике
+    await submission_jobs_functions.mark_submitted(job.job_id, scan_req.scan_id, file_sha256, scan_req.ptsb_node)
+    remove_job_file(job, "after sending it to scan")
+    await sandbox_profiles_functions.commit_checks(tg_user_id=job.tg_user_id)
+
+    # ставим задание на отслеживание, результаты придут пользователю автоматически
+    scan_poller.track(
+        PendingScan(
+            scan_id=scan_req.scan_id,
+            tg_user_id=job.tg_user_id,
+            chat_id=job.chat_id,
+            user_role=job.user_role,
+            can_get_links=job.can_get_links,
+            poll_interval=SYNC_SCAN_POLL_INTERVAL if wait_for_verdict else SCAN_POLL_INITIAL_DELAY,
+            sha256=file_sha256 if job.scan_type == "file" and not job.passwords else None,
+            url=urls.canonicalize_url(job.url) if job.scan_type == "url" and not job.passwords else None,
+            ptsb_node=scan_req.ptsb_node
+        )
+    )
+
+    # по заданиям из пачки сообщает общая сводка
+    if job.batch_id is not None:
+        return scan_req
+
+    # по небольшому объекту сначала ждем вердикт: если он готов быстро, пользователь получает сразу его, без сообщений о созданном задании
+    if wait_for_verdict:
+        # пока ждем, такие же задания уже могут присоединяться к этой проверке
+        if flight_key is not None and upload is not None:
+            inflight_scans.finish_upload(flight_key, scan_req.scan_id, upload)
+
+        if await scan_poller.wait(scan_req.scan_id, SYNC_SCAN_MAX_WAIT):
+            logger.info(f"Results for scan_id={scan_req.scan_id} of user {job.tg_user_id} were received without waiting in background")
+            await bot.send_message(
+                chat_id=job.chat_id,
+                text="Выберите дальнейшее действие:",
+                reply_markup=reply_keyboard
             )
-            await message.answer(
+            return scan_req
+
+    # отправляем сообщение что всё удалось с учетом того, можно ли юзеру получать результаты проверки или нет
+    if job.can_get_links:
+        await bot.send_message(
+            chat_id=job.chat_id,
+            text=(
                 "✅ <b>Задание успешно создано!</b>\n\n"
-                f"Его ID: <code>{scan_req.scan_id}</code>.",
-                reply_markup=scan_keyboard
-            )
+                f"Его ID: <code>{scan_req.scan_id}</code>."
+            ),
+            reply_markup=build_scan_link_keyboard(scan_req.scan_id, scan_req.ptsb_node)
+        )
 
-        else:
-            await message.answer(
+    else:
+        await bot.send_message(
+            chat_id=job.chat_id,
+            text=(
                 "✅ <b>Задание успешно создано!</b>\n\n"
                 f"Его ID: <code>{scan_req.scan_id}</code>.\n\n"
                 "С ID задания Вы можете впоследствии обратиться к администратору, если потребуется уточнение по результатам проверки."
             )
-        
-        # заносим scan_id в параметры пользователя
-        await state.update_data({SandboxInteractionsParameters.scan_id: scan_req.scan_id})
-        
-        # и говорим, чтоб пользователь проверял результаты сканирования
+        )
+
+    await bot.send_message(
+        chat_id=job.chat_id,
+        text=(
+            "⏳ Результаты проверки придут в этот чат автоматически, как только будут готовы.\n\n"
+            "Пока можете выбрать дальнейшее действие:"
+        ),
+        reply_markup=reply_keyboard
+    )
+    return scan_req
+
+
+# хэндлер обработки ввода паролей для распаковки
+@dp.message(SandboxInteractionStates.send_req_for_scan)
+async def send_data_to_scan(message: Message, state: FSMContext, user_sandbox_profile: Optional[UserProfileFromDb]) -> None:
+    
+    # получаем пользовательский ввод паролей
+    user_passwords_input: str = message.text
+
+    if user_passwords_input is None:
         await message.answer(
-            "Для получения результатов проверки периодически обновляйте статус задания через кнопку ниже:",
-            reply_markup=custom_keyboars.get_scan_results_keyboard
+            "⚠️ <b>Ожидался ввод паролей.</b>\n\n"
+            "Сообщение не содержит текста."
         )
-        await state.set_state(SandboxInteractionStates.get_scan_results)
+        await message.answer(
+            "Напишите пароли повторно или отправьте задание на проверку без указания паролей.",
+            reply_markup=custom_keyboars.send_to_scan_keyboard
+        )
+        await state.set_state(SandboxInteractionStates.send_req_for_scan)
         return
-    
 
-# хэндлер для обновления статуса проверки задания
-@dp.message(SandboxInteractionStates.get_scan_results, F.text == custom_keyboars.BTN_SANDBOX_MENU_SCAN_RESULT)
-async def process_get_scan_result(message: Message, state: FSMContext) -> None:
+    # если ввод не равен "отправить сейчас на проверку" причем берем только первые 5 паролей
+    list_of_pwds: list = []
+    if user_passwords_input not in (custom_keyboars.BTN_SANDBOX_MENU_SEND_TO_SCAN, custom_keyboars.BTN_SANDBOX_MENU_SEND_TO_SCAN_NO_CACHE):
+        list_of_pwds = user_passwords_input.split('\n')[:5]
+        await state.update_data({SandboxInteractionsParameters.list_of_pwds: list_of_pwds})
     
-    # получаем данные по scan_id, который нужно проверить
+    # предварительно получаем параметры юзерочка из его же данных
     user_data = await state.get_data()
-    scan_id_to_get = user_data.get(SandboxInteractionsParameters.scan_id)
-    scan_results: GetScanResust = await ptsb_client.get_scan_results(
-        scan_id=scan_id_to_get
-    )
-
-    # а также клавиатуру, и состояние, которую нужно будет отрисовать на основании роли
     user_role = user_data.get(SandboxInteractionsParameters.user_role)
+    scan_priority = user_data.get(SandboxInteractionsParameters.scan_priority)
+    can_get_links = user_data.get(SandboxInteractionsParameters.can_get_links)
+
+    # сохраненный вердикт по ссылке может не использовать только админ
+    bypass_cache = user_passwords_input == custom_keyboars.BTN_SANDBOX_MENU_SEND_TO_SCAN_NO_CACHE and user_role == UsersRolesInBot.main_admin
+    if bypass_cache:
+        logger.info(f"Admin user {message.from_user.id} is sending data to scan bypassing cached verdicts")
+
+    # определяем, что именно пользователь хочет отправить на проверку ссылку или файл
+    scan_type = user_data.get(SandboxInteractionsParameters.scan_type)
+
     reply_keyboard = custom_keyboars.admin_main_sandbox_keyboard if user_role == UsersRolesInBot.main_admin else custom_keyboars.user_main_sandbox_keyboard
     new_state = SandboxInteractionStates.sandbox_admin_menu if user_role == UsersRolesInBot.main_admin else SandboxInteractionStates.sandbox_user_menu
 
-    # если API запрос неуспешный
-    if scan_results.is_ok == False:
-        logger.warning(f"User {message.from_user.id} tried to get status for scan_id={scan_id_to_get}, but was unsuccessful. Error: {scan_results.error_message}")
+    # пачка файлов или ссылок отправляется отдельно: каждый файл или ссылка своим заданием, с общим отчетом в конце
+    if scan_type in ("batch", "url_batch"):
+        await send_batch_to_scan(message, state, user_sandbox_profile, user_data, list_of_pwds, bypass_cache)
+        return
+
+    file_to_scan = user_data.get(SandboxInteractionsParameters.file_to_scan)
+    file_sha256 = user_data.get(SandboxInteractionsParameters.file_sha256)
+
+    # если этот файл уже проверялся и вердикт еще актуален - отдаем его сразу, не тратя проверку и запуск песочницы
+    # в кэше только вердикты проверок без паролей, а с паролями для распаковки результат может отличаться, поэтому такой объект проверяется заново
+    if scan_type == "file" and not list_of_pwds:
+        cached_verdict: CachedVerdictFromDb = await verdict_cache_functions.get_fresh_verdict(file_sha256) if file_sha256 else None
+        if cached_verdict is not None:
+            logger.info(f"User {message.from_user.id} got cached verdict for file with sha256={file_sha256}")
+
+            if file_to_scan and os.path.exists(file_to_scan):
+                os.remove(file_to_scan)
+                logger.info(f"File {file_to_scan} from user {message.from_user.id} was deleted from local storage after cache hit")
+
+            await answer_cached_verdict(message, state, cached_verdict, user_role, can_get_links)
+            return
+
+    # то же для ссылки: копии одной ссылки, отличающиеся регистром, `/` в конце или параметрами отслеживания, получают один вердикт
+    if scan_type == "url" and not bypass_cache and not list_of_pwds:
+        canonical_url = urls.canonicalize_url(user_data.get(SandboxInteractionsParameters.url_to_scan))
+        cached_url_verdict: CachedUrlVerdictFromDb = await url_verdict_cache_functions.get_fresh_verdict(canonical_url)
+        if cached_url_verdict is not None:
+            logger.info(f"User {message.from_user.id} got cached verdict for url {canonical_url}")
+            await answer_cached_verdict(message, state, cached_url_verdict, user_role, can_get_links)
+            return
+
+    # учитываем отправку в ограничении частоты, т.к. между нажатием кнопки и отправкой могли уйти другие задания
+    if user_sandbox_profile is not None:
+        wait_time = submission_rate_limiter.try_acquire(message.from_user.id, rate_limiter.limits_from_profile(user_sandbox_profile))
+        if wait_time > 0:
+            logger.info(f"User {message.from_user.id} hit rate limit for {wait_time:.0f} seconds while sending data to scan")
+
+            if file_to_scan and os.path.exists(file_to_scan):
+                os.remove(file_to_scan)
+                logger.info(f"File {file_to_scan} from user {message.from_user.id} was deleted from local storage, because of rate limit")
+
+            await message.answer(
+                "⚠️ Вы слишком часто отправляете задания на проверку. Проверка не была списана.\n\n"
+                f"Повторите попытку через {rate_limiter.format_wait_time(wait_time)}",
+                reply_markup=reply_keyboard
+            )
+            await state.set_state(new_state)
+            return
+
+    # момент учета отправки, по нему она возвращается в ограничение частоты, если до песочницы так и не дойдет
+    rate_acquired_at = time.time()
+
+    # резервируем проверку до загрузки, чтобы одновременные отправки не потратили больше проверок, чем есть
+    remaining_checks = await sandbox_profiles_functions.reserve_checks(tg_user_id=message.from_user.id)
+    if remaining_checks is None:
+        # задание не отправлено, поэтому и в ограничении частоты его не учитываем
+        if user_sandbox_profile is not None:
+            submission_rate_limiter.release(message.from_user.id, rate_acquired_at)
+
+        if file_to_scan and os.path.exists(file_to_scan):
+            os.remove(file_to_scan)
+            logger.info(f"File {file_to_scan} from user {message.from_user.id} was deleted from local storage, because check was not reserved")
+
+        # проверка на то, что юзер существует
+        user_sandbox_profile: UserProfileFromDb = await sandbox_profiles_functions.get_profile_entity(message.from_user.id)
+        if user_sandbox_profile is None:
+            logger.info(f"Tried to reserve check for user {message.from_user.id}, but his profile was not found. Set state check_user_status for user")
+
+            await state.clear()
+            await state.set_state(UserStates.check_user_status)
+            await message.answer(
+                "⚠️ Кажется, доступ для Вас прекращен.",
+                reply_markup=custom_keyboars.check_status_keyboard
+            )
+            return
 
+        logger.info(f"User {message.from_user.id} tried to send data to scan, but has no available checks today")
         await message.answer(
-            "⚠️ Не удалось получить результаты.\n\n"
-            "Свяжитесь с администратором и передайте ему эту информацию:\n"
-            f"{scan_results.error_message}",
+            "⚠️ У Вас закончились проверки на сегодня.\n\n"
+            "Обновление проверок происходит каждый день. Повторите попытку завтра.",
             reply_markup=reply_keyboard
         )
         await state.set_state(new_state)
         return
-    
+
+    # сохраняем задание до загрузки: если бот перезапустится, задание и зарезервированная проверка не потеряются
+    submission_job = SubmissionJobFromDb(
+        job_id=submission_jobs_functions.new_job_id(),
+        tg_user_id=message.from_user.id,
+        chat_id=message.chat.id,
+        user_role=user_role,
+        scan_type=scan_type,
+        check_priority=scan_priority,
+        can_get_links=bool(can_get_links),
+        passwords=list_of_pwds,
+        url=user_data.get(SandboxInteractionsParameters.url_to_scan) if scan_type == "url" else None,
+        file_path=file_to_scan if scan_type == "file" else None,
+        tg_file_path=user_data.get(SandboxInteractionsParameters.tg_file_path) if scan_type == "file" else None,
+        file_name=user_data.get(SandboxInteractionsParameters.file_name) if scan_type == "file" else None,
+        file_size=user_data.get(SandboxInteractionsParameters.file_size) if scan_type == "file" else None,
+        file_unique_id=user_data.get(SandboxInteractionsParameters.file_unique_id) if scan_type == "file" else None,
+        file_sha256=file_sha256 if scan_type == "file" else None
+    )
+    await submission_jobs_functions.add_job(submission_job)
+
+    # дальше пользователь в меню, чем бы ни закончилась отправка
+    await state.set_state(new_state)
+
+    await run_submission_job(message.bot, submission_job)
+
+
+# отправка пачки файлов или ссылок на проверку
+async def send_batch_to_scan(
+        message: Message,
+        state: FSMContext,
+        user_sandbox_profile: Optional[UserProfileFromDb],
+        user_data: dict,
+        list_of_pwds: list[str],
+        bypass_cache: bool = False
+    ) -> None:
+    """
+    Отправляет на проверку пачку файлов или ссылок: по уже проверенным файлам и ссылкам сразу отдает вердикт из кэша, для остальных
+    одним запросом резервирует проверки и создает по заданию на каждый файл или ссылку. В ограничении частоты пачка считается одной отправкой.
+
+    Принимает:
+        - `message` (Message): сообщение пользователя
+        - `state` (FSMContext): контекст состояния пользователя
+        - `user_sandbox_profile` (UserProfileFromDb): профиль взаимодействия с песочницей
+        - `user_data` (dict): данные пользователя из контекста
+        - `list_of_pwds` (list[str]): пароли для распаковки, общие для всех заданий пачки
+        - `bypass_cache` (bool): не использовать сохраненные вердикты по ссылкам
+    """
+
+    user_role = user_data.get(SandboxInteractionsParameters.user_role)
+    reply_keyboard = custom_keyboars.admin_main_sandbox_keyboard if user_role == UsersRolesInBot.main_admin else custom_keyboars.user_main_sandbox_keyboard
+    new_state = SandboxInteractionStates.sandbox_admin_menu if user_role == UsersRolesInBot.main_admin else SandboxInteractionStates.sandbox_user_menu
+
+    # элементы пачки: скачанные файлы или ссылки
+    if user_data.get(SandboxInteractionsParameters.scan_type) == "url_batch":
+        batch_items: list[dict] = [{"url": url} for url in user_data.get(SandboxInteractionsParameters.urls_to_scan) or []]
     else:
-        if scan_results.is_scan_ready == False:
+        batch_items: list[dict] = user_data.get(SandboxInteractionsParameters.batch_files) or []
+
+    # удаление скачанных файлов пачки, которые не будут отправлены
+    def remove_batch_files(items_to_remove: list[dict], reason: str) -> None:
+        for batch_item in items_to_remove:
+            if batch_item.get("file_to_scan") and os.path.exists(batch_item["file_to_scan"]):
+                os.remove(batch_item["file_to_scan"])
+                logger.info(f"File {batch_item['file_to_scan']} from user {message.from_user.id} was deleted from local storage, because {reason}")
+
+    # по уже проверенным файлам и ссылкам отдаем вердикт из кэша, не тратя проверки
+    # в кэше только вердикты проверок без паролей, поэтому с паролями объекты проверяются заново,
+    # кроме файлов, которые не скачивались из-за вердикта в кэше: отправить их не из чего
+    cached_lines: list[str] = []
+    items_to_upload: list[dict] = []
+    for batch_item in batch_items:
+        if batch_item.get("url"):
+            cached_verdict = None if bypass_cache or list_of_pwds else await url_verdict_cache_functions.get_fresh_verdict(urls.canonicalize_url(batch_item["url"]))
+            item_label = f"🔗 <code>{html.escape(batch_item['url'])}</code>"
+        else:
+            is_uploadable = bool(batch_item.get("file_to_scan") or batch_item.get("tg_file_path"))
+            use_cache = batch_item.get("file_sha256") and not (list_of_pwds and is_uploadable)
+            cached_verdict = await verdict_cache_functions.get_fresh_verdict(batch_item["file_sha256"]) if use_cache else None
+            item_label = f"📄 <code>{html.escape(batch_item['file_name'])}</code>"
+
+        if cached_verdict is None:
+            items_to_upload.append(batch_item)
+            continue
+
+        logger.info(f"User {message.from_user.id} got cached verdict for scan_id={cached_verdict.scan_id} from batch")
+        remove_batch_files([batch_item], "of cache hit")
+        cached_lines.append(
+            f"{item_label}: "
+            f"{ScanVerdictMapper.get_verdict_desc(cached_verdict.verdict_code)} ({cached_verdict.threat}) — <code>{cached_verdict.scan_id}</code>"
+        )
+
+    if cached_lines:
+        await send_lines_message(
+            message.bot,
+            message.chat.id,
+            "✅ <b>Уже проверялись, проверки за них не списаны:</b>\n",
+            cached_lines
+        )
+
+    if not items_to_upload:
+        await message.answer("Выберите дальнейшее действие:", reply_markup=reply_keyboard)
+        await state.set_state(new_state)
+        return
+
+    # учитываем каждое задание пачки в ограничении частоты, иначе пачкой можно было бы обойти ограничение
+    if user_sandbox_profile is not None:
+        user_rate_limits = rate_limiter.limits_from_profile(user_sandbox_profile)
+        wait_time = submission_rate_limiter.try_acquire(message.from_user.id, user_rate_limits, amount=len(items_to_upload))
+        if math.isinf(wait_time):
+            logger.info(f"User {message.from_user.id} tried to send batch of {len(items_to_upload)} tasks, which exceeds his rate limit")
+            remove_batch_files(items_to_upload, "of rate limit")
+
             await message.answer(
-                "⏳ Результаты еще не получены.\n\nПовторная попытка доступна через 10 секунд.",
-                reply_markup=ReplyKeyboardRemove()
+                "⚠️ Пачка больше, чем Вам разрешено отправить за раз. Проверки не были списаны.\n\n"
+                f"Заданий для проверки: {len(items_to_upload)}, можно отправить за раз: {user_rate_limits.max_amount()}.\n"
+                "Отправьте меньше файлов или ссылок.",
+                reply_markup=reply_keyboard
             )
-            await asyncio.sleep(10)
+            await state.set_state(new_state)
+            return
+        if wait_time > 0:
+            logger.info(f"User {message.from_user.id} hit rate limit for {wait_time:.0f} seconds while sending batch of {len(items_to_upload)} tasks to scan")
+            remove_batch_files(items_to_upload, "of rate limit")
+
             await message.answer(
-                "Вы можете снова получить результаты проверки:",
-                reply_markup=custom_keyboars.get_scan_results_keyboard
+                "⚠️ Вы слишком часто отправляете задания на проверку. Проверки не были списаны.\n\n"
+                f"Повторите попытку через {rate_limiter.format_wait_time(wait_time)}",
+                reply_markup=reply_keyboard
             )
-            await state.set_state(SandboxInteractionStates.get_scan_results)
+            await state.set_state(new_state)
             return
-        
-        else:
-            # клавиатура на будущее, будем ли использовать зависит от роли пользователя
-            scan_keyboard = None
-            can_get_links = user_data.get(SandboxInteractionsParameters.can_get_links) 
-
-            # создаем кнопку под сообщением, мол перейди к заданию
-            if can_get_links:
-                # кнопка
-                scan_button = InlineKeyboardButton(
-                    text = "Перейти к заданию",
-                    url = f"https://{PTSB_ROOT_ADDR}/tasks/{scan_id_to_get}"
-                )
-                # клавиатура
-                scan_keyboard = InlineKeyboardMarkup(
-                    inline_keyboard=[[scan_button]]
-                )
 
-            # в любом случае возвращаем результаты проверки
+    # момент учета отправки, по нему она возвращается в ограничение частоты, если до песочницы так и не дойдет
+    rate_acquired_at = time.time()
+
+    # резервируем проверки на всю пачку сразу: либо хватает на все задания, либо пачка не отправляется
+    remaining_checks = await sandbox_profiles_functions.reserve_checks(tg_user_id=message.from_user.id, amount=len(items_to_upload))
+    if remaining_checks is None:
+        if user_sandbox_profile is not None:
+            submission_rate_limiter.release(message.from_user.id, rate_acquired_at, amount=len(items_to_upload))
+        remove_batch_files(items_to_upload, "checks were not reserved")
+
+        # проверка на то, что юзер существует
+        user_sandbox_profile: UserProfileFromDb = await sandbox_profiles_functions.get_profile_entity(message.from_user.id)
+        if user_sandbox_profile is None:
+            logger.info(f"Tried to reserve checks for user {message.from_user.id}, but his profile was not found. Set state check_user_status for user")
+
+            await state.clear()
+            await state.set_state(UserStates.check_user_status)
             await message.answer(
-                "✅ <b>Проверка завершена!</b>\n\n"
-                f"<b>Статус:</b> {scan_results.scan_state}\n"
-                f"<b>Вердикт</b>: {scan_results.verdict}\n"
-                f"<b>Тип ВПО</b>: {scan_results.threat}\n",
+                "⚠️ Кажется, доступ для Вас прекращен.",
+                reply_markup=custom_keyboars.check_status_keyboard
+            )
+            return
+
+        logger.info(f"User {message.from_user.id} tried to send batch of {len(items_to_upload)} tasks to scan, but has not enough available checks")
+        await message.answer(
+            "⚠️ Не хватает проверок, чтобы отправить всю пачку.\n\n"
+            f"Заданий для проверки: {len(items_to_upload)}, осталось проверок: {user_sandbox_profile.remaining_checks}.\n"
+            "Отправьте меньше файлов или ссылок или повторите попытку завтра.",
+            reply_markup=reply_keyboard
+        )
+        await state.set_state(new_state)
+        return
+
+    # сохраняем задания пачки до загрузки: если бот перезапустится, они и зарезервированные проверки не потеряются
+    batch_id = submission_jobs_functions.new_job_id()
+    submission_jobs: list[SubmissionJobFromDb] = []
+    for batch_item in items_to_upload:
+        submission_job = SubmissionJobFromDb(
+            job_id=submission_jobs_functions.new_job_id(),
+            tg_user_id=message.from_user.id,
+            chat_id=message.chat.id,
+            user_role=user_role,
+            scan_type="url" if batch_item.get("url") else "file",
+            check_priority=user_data.get(SandboxInteractionsParameters.scan_priority),
+            can_get_links=bool(user_data.get(SandboxInteractionsParameters.can_get_links)),
+            passwords=list_of_pwds,
+            url=batch_item.get("url"),
+            file_path=batch_item.get("file_to_scan"),
+            tg_file_path=batch_item.get("tg_file_path"),
+            file_name=batch_item.get("file_name"),
+            file_size=batch_item.get("file_size"),
+            file_unique_id=batch_item.get("file_unique_id"),
+            file_sha256=batch_item.get("file_sha256"),
+            batch_id=batch_id
+        )
+        await submission_jobs_functions.add_job(submission_job)
+        submission_jobs.append(submission_job)
+
+    # дальше пользователь в меню, чем бы ни закончилась отправка
+    await state.set_state(new_state)
+
+    await run_submission_batch(message.bot, submission_jobs)
+
+
+# выполнение заданий пачки
+async def run_submission_batch(bot: Bot, jobs: list[SubmissionJobFromDb], resumed: bool = False) -> None:
+    """
+    Загружает задания пачки в песочницу параллельно, насколько позволяет очередь отправки, показывает ход отправки
+    и сообщает пользователю одной сводкой, какие задания созданы. Общий отчет с вердиктами придет,
+    когда будут готовы результаты всех заданий пачки.
+
+    Принимает:
+        - `bot` (Bot): бот, от имени которого отправляются сообщения
+        - `jobs` (list[SubmissionJobFromDb]): задания пачки с уже зарезервированными проверками
+        - `resumed` (bool): задания продолжаются после перезапуска бота
+    """
+
+    first_job = jobs[0]
+    reply_keyboard = custom_keyboars.admin_main_sandbox_keyboard if first_job.user_role == UsersRolesInBot.main_admin else custom_keyboars.user_main_sandbox_keyboard
+
+    status_text = (
+        "🔄 Бот был перезапущен во время отправки Ваших заданий на проверку. Продолжаю отправку."
+        if resumed else
+        "⏫ Отправляю задания на проверку."
+    )
+    status_message = await bot.send_message(chat_id=first_job.chat_id, text=f"{status_text}\n\nОтправлено: 0 из {len(jobs)}")
+
+    # ход отправки обновляем не чаще раза в интервал, т.к. ТГ ограничивает частоту редактирования
+    sent_jobs = 0
+    last_reported_at = time.monotonic()
+
+    async def run_and_report(job: SubmissionJobFromDb) -> Optional[SendScanRequest]:
+        nonlocal sent_jobs, last_reported_at
+        scan_req = await run_submission_job(bot, job)
+
+        sent_jobs += 1
+        if sent_jobs < len(jobs) and time.monotonic() - last_reported_at >= TG_DOWNLOAD_PROGRESS_INTERVAL:
+            last_reported_at = time.monotonic()
+            try:
+                await status_message.edit_text(f"{status_text}\n\nОтправлено: {sent_jobs} из {len(jobs)}")
+            except TelegramBadRequest:
+                logger.warning(f"Failed to update batch submission status message for user {job.tg_user_id}", exc_info=True)
+        return scan_req
+
+    scan_requests: list[Optional[SendScanRequest]] = await asyncio.gather(*(run_and_report(job) for job in jobs))
+
+    try:
+        await status_message.delete()
+    except TelegramAPIError:
+        logger.warning(f"Failed to delete batch submission status message for user {first_job.tg_user_id}", exc_info=True)
+
+    summary_lines: list[str] = []
+    failed_lines: list[str] = []
+    for job, scan_req in zip(jobs, scan_requests):
+        # задание уже выполнялось или было завершено раньше
+        if scan_req is None:
+            continue
+        if scan_req.is_ok:
+            summary_lines.append(f"{format_job_label(job)} — <code>{scan_req.scan_id}</code>")
+        else:
+            failed_lines.append(f"{format_job_label(job)}: {scan_req.error_message}")
+
+    created_jobs = len(summary_lines)
+    if failed_lines:
+        summary_lines.append("\n⚠️ <b>Не удалось отправить, проверки за них не списаны:</b>")
+        summary_lines.extend(failed_lines)
+
+    footer = ""
+    if failed_lines:
+        footer += "\n\nЕсли ошибка повторяется, свяжитесь с администратором и передайте ему эту информацию."
+    if created_jobs:
+        footer += "\n\n⏳ Общий отчет по всем заданиям придет в этот чат автоматически, как только будут готовы все результаты."
+
+    await send_lines_message(
+        bot,
+        first_job.chat_id,
+        f"✅ <b>Заданий создано: {created_jobs} из {len(jobs)}</b>\n",
+        summary_lines,
+        footer,
+        reply_markup=reply_keyboard
+    )
+
+    # если ни одно задание не дошло до песочницы, пачка уже завершена
+    await finish_submission_batch(bot, first_job.batch_id)
+
+
+# отправка общего отчета по пачке
+async def finish_submission_batch(bot: Bot, batch_id: str) -> None:
+    """
+    Отправляет пользователю общий отчет по пачке, если готовы результаты всех ее заданий.
+    Если пачка еще не готова или отчет уже отправлен, ничего не делает.
+
+    Принимает:
+        - `bot` (Bot): бот, от имени которого отправляется сообщение
+        - `batch_id` (str): ID пачки
+    """
+
+    batch_jobs = await submission_jobs_functions.finish_batch(batch_id)
+    if not batch_jobs:
+        return
+
+    first_job = batch_jobs[0]
+    logger.info(f"All results for batch {batch_id} of user {first_job.tg_user_id} are ready, sending report")
+
+    # кнопки перехода к заданиям, если пользователю можно их получать и кнопок не слишком много
+    scan_keyboard = None
+    scanned_jobs = [job for job in batch_jobs if job.scan_id]
+    if first_job.can_get_links and 0 < len(scanned_jobs) <= MAX_REPORT_LINK_BUTTONS:
+        scan_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(
+                text=f"Перейти к заданию: {(job.file_name if job.scan_type == 'file' else job.url)[:30]}",
+                url=ptsb_client.ptsb_nodes.get(job.ptsb_node).task_url(job.scan_id)
+            )]
+            for job in scanned_jobs
+        ])
+
+    try:
+        await send_lines_message(
+            bot,
+            first_job.chat_id,
+            f"📋 <b>Проверка завершена!</b> Заданий в пачке: {len(batch_jobs)}\n",
+            [job.result for job in batch_jobs],
+            reply_markup=scan_keyboard
+        )
+    except TelegramAPIError:
+        logger.warning(f"Failed to push report for batch {batch_id} to user {first_job.tg_user_id}", exc_info=True)
+
+
+############################## отправка результатов проверки ##############################
+# кнопка "перейти к заданию" под сообщением с заданием
+def build_scan_link_keyboard(scan_id: str, ptsb_node: Optional[str] = None) -> InlineKeyboardMarkup:
+    """
+    Формирует клавиатуру со ссылкой на задание в веб-интерфейсе того узла PTSB, на котором оно создано
+
+    Принимает:
+        - `scan_id` (str): ID задания
+        - `ptsb_node` (str): адрес узла песочницы, `None` - основной узел
+
+    Возвращает:
+        - `InlineKeyboardMarkup`: клавиатура с одной кнопкой
+    """
+
+    scan_button = InlineKeyboardButton(
+        text = "Перейти к заданию",
+        url = ptsb_client.ptsb_nodes.get(ptsb_node).task_url(scan_id)
+    )
+    return InlineKeyboardMarkup(inline_keyboard=[[scan_button]])
+
+
+# текст сообщения с вердиктом из кэша
+def format_cached_verdict_message(cached_verdict: Union[CachedVerdictFromDb, CachedUrlVerdictFromDb]) -> str:
+    """
+    Формирует сообщение с сохраненным ранее вердиктом по файлу или ссылке
+
+    Принимает:
+        - `cached_verdict` (CachedVerdictFromDb | CachedUrlVerdictFromDb): вердикт из кэша
+
+    Возвращает:
+        - `str`: текст сообщения в html вёрстке
+    """
+
+    checked_at = datetime.fromtimestamp(cached_verdict.created_at).strftime('%d-%m-%Y %H:%M')
+
+    # по ссылке показываем каноническую ссылку, по ней админ может сбросить вердикт
+    if isinstance(cached_verdict, CachedUrlVerdictFromDb):
+        title = "✅ <b>Эта ссылка уже проверялась!</b>"
+        verdict_key = f"Ссылка: <code>{html.escape(cached_verdict.url)}</code>"
+    else:
+        title = "✅ <b>Этот файл уже проверялся!</b>"
+        verdict_key = f"SHA-256: <code>{cached_verdict.sha256}</code>"
+
+    return (
+        f"{title}\n\n"
+        f"<b>ID задания:</b> <code>{cached_verdict.scan_id}</code>\n"
+        f"<b>Дата проверки:</b> {checked_at}\n"
+        f"<b>Статус:</b> {ScanVerdictMapper.get_state_desc(cached_verdict.scan_state_code)}\n"
+        f"<b>Вердикт</b>: {ScanVerdictMapper.get_verdict_desc(cached_verdict.verdict_code)}\n"
+        f"<b>Тип ВПО</b>: {cached_verdict.threat}\n\n"
+        f"{verdict_key}"
+    )
+
+
+# ответ пользователю вердиктом из кэша с возвратом в главное меню
+async def answer_cached_verdict(
+        message: Message,
+        state: FSMContext,
+        cached_verdict: Union[CachedVerdictFromDb, CachedUrlVerdictFromDb],
+        user_role: str,
+        can_get_links: bool
+    ) -> None:
+    """
+    Отправляет пользователю сохраненный вердикт вместо создания нового задания и возвращает его в главное меню
+
+    Принимает:
+        - `message` (Message): сообщение пользователя
+        - `state` (FSMContext): контекст состояния пользователя
+        - `cached_verdict` (CachedVerdictFromDb | CachedUrlVerdictFromDb): вердикт из кэша
+        - `user_role` (str): роль пользователя, от нее зависит меню
+        - `can_get_links` (bool): может ли пользователь получать ссылки на задания
+    """
+
+    reply_keyboard = custom_keyboars.admin_main_sandbox_keyboard if user_role == UsersRolesInBot.main_admin else custom_keyboars.user_main_sandbox_keyboard
+    new_state = SandboxInteractionStates.sandbox_admin_menu if user_role == UsersRolesInBot.main_admin else SandboxInteractionStates.sandbox_user_menu
+
+    await message.answer(
+        format_cached_verdict_message(cached_verdict),
+        reply_markup=build_scan_link_keyboard(cached_verdict.scan_id, cached_verdict.ptsb_node) if can_get_links else None
+    )
+    await message.answer(
+        "Проверка не была списана. Выберите дальнейшее действие:",
+        reply_markup=reply_keyboard
+    )
+    await state.set_state(new_state)
+
+
+# отправка пользователю готового вердикта от фонового опроса
+async def push_scan_result(bot: Bot, pending_scan: PendingScan, scan_results: GetScanResust) -> None:
+    """
+    Отправляет результаты проверки всем заданиям, которые их ждут, как только фоновый опрос получил вердикт
+
+    Принимает:
+        - `bot` (Bot): бот, от имени которого отправляется сообщение
+        - `pending_scan` (PendingScan): задание, по которому получен вердикт
+        - `scan_results` (GetScanResust): результаты проверки
+    """
+
+    logger.info(f"Pushing results for scan_id={pending_scan.scan_id} to user {pending_scan.tg_user_id}")
+
+    # запоминаем окончательный вердикт по файлу, чтобы не проверять его повторно
+    # у проверок с паролями для распаковки хэш и ссылка не заполняются, их вердикт не кэшируется
+    if pending_scan.sha256:
+        if await verdict_cache_functions.save_verdict(pending_scan.sha256, pending_scan.scan_id, scan_results, pending_scan.ptsb_node):
+            logger.info(f"Verdict for file with sha256={pending_scan.sha256} was cached")
+    if pending_scan.url:
+        if await url_verdict_cache_functions.save_verdict(pending_scan.url, pending_scan.scan_id, scan_results, pending_scan.ptsb_node):
+            logger.info(f"Verdict for url {pending_scan.url} was cached")
+
+    # к завершенной проверке больше нельзя присоединиться
+    inflight_scans.forget(pending_scan.scan_id)
+
+    # результатов одной проверки могут ждать несколько заданий, если к ней присоединились такие же задания
+    submission_jobs = await submission_jobs_functions.get_jobs_by_scan_id(pending_scan.scan_id)
+    if not submission_jobs:
+        logger.info(f"No submission jobs are waiting for results of scan_id={pending_scan.scan_id}, they were already pushed")
+        return
+
+    batch_ids: set[str] = set()
+    for submission_job in submission_jobs:
+        # результат задания из пачки файлов попадает в общий отчет, который отправляется, когда готова вся пачка
+        if submission_job.batch_id is not None:
+            await submission_jobs_functions.complete_job(
+                submission_job.job_id,
+                f"{format_job_label(submission_job)}: {scan_results.verdict} ({scan_results.threat}) — <code>{pending_scan.scan_id}</code>"
+            )
+            batch_ids.add(submission_job.batch_id)
+            continue
+
+        # клавиатура на будущее, будем ли использовать зависит от роли пользователя
+        scan_keyboard = build_scan_link_keyboard(pending_scan.scan_id, pending_scan.ptsb_node) if submission_job.can_get_links else None
+
+        try:
+            await bot.send_message(
+                chat_id=submission_job.chat_id,
+                text=(
+                    "✅ <b>Проверка завершена!</b>\n\n"
+                    f"<b>ID задания:</b> <code>{pending_scan.scan_id}</code>\n"
+                    f"<b>Статус:</b> {scan_results.scan_state}\n"
+                    f"<b>Вердикт</b>: {scan_results.verdict}\n"
+                    f"<b>Тип ВПО</b>: {scan_results.threat}\n"
+                ),
                 reply_markup=scan_keyboard
             )
+        except TelegramAPIError:
+            logger.warning(f"Failed to push results for scan_id={pending_scan.scan_id} to user {submission_job.tg_user_id}", exc_info=True)
 
-            await message.answer(
-                "Выберите дайльнейшее действие:",
-                reply_markup=reply_keyboard
+        # задание завершено, при перезапуске бота возобновлять его не нужно
+        await submission_jobs_functions.delete_job(submission_job.job_id)
+
+    for batch_id in batch_ids:
+        await finish_submission_batch(bot, batch_id)
+
+
+# отправка пользователю сообщения о том, что результаты получить не удалось
+async def push_scan_failure(bot: Bot, pending_scan: PendingScan, error_message: str) -> None:
+    """
+    Сообщает пользователю, что фоновый опрос не смог получить результаты проверки задания
+
+    Принимает:
+        - `bot` (Bot): бот, от имени которого отправляется сообщение
+        - `pending_scan` (PendingScan): задание, по которому не удалось получить вердикт
+        - `error_message` (str): описание ошибки
+    """
+
+    logger.warning(f"Results for scan_id={pending_scan.scan_id} of user {pending_scan.tg_user_id} were not received. Error: {error_message}")
+
+    # к проверке, результаты которой не получены, больше нельзя присоединиться
+    inflight_scans.forget(pending_scan.scan_id)
+
+    batch_ids: set[str] = set()
+    for submission_job in await submission_jobs_functions.get_jobs_by_scan_id(pending_scan.scan_id):
+        if submission_job.batch_id is not None:
+            await submission_jobs_functions.complete_job(
+                submission_job.job_id,
+                f"{format_job_label(submission_job)}: ⚠️ не удалось получить результаты ({error_message}) — <code>{pending_scan.scan_id}</code>"
             )
-            await state.set_state(new_state)
-            return
+            batch_ids.add(submission_job.batch_id)
+            continue
+
+        try:
+            await bot.send_message(
+                chat_id=submission_job.chat_id,
+                text=(
+                    "⚠️ Не удалось получить результаты проверки задания "
+                    f"<code>{pending_scan.scan_id}</code>.\n\n"
+                    "Свяжитесь с администратором и передайте ему эту информацию:\n"
+                    f"{error_message}"
+                )
+            )
+        except TelegramAPIError:
+            logger.warning(f"Failed to notify user {submission_job.tg_user_id} about scan_id={pending_scan.scan_id}", exc_info=True)
+
+        await submission_jobs_functions.delete_job(submission_job.job_id)
+
+    for batch_id in batch_ids:
+        await finish_submission_batch(bot, batch_id)
 
 
 # заглушка 
@@ -1407,7 +2973,7 @@ async def echo_handler(message: Message, state: FSMContext) -> None:
     if user_state is None:
         await message.answer(
             "⚠️ <b>Что-то пошло не так!</b>\n\n"
-            "Либо ты новенький, либо бот перезапускался администратором.\n\nДля перехода к начальному меню отправь мне /start.",
+            "Либо ты новенький, либо давно не заходил ко мне.\n\nДля перехода к начальному меню отправь мне /start.",
             reply_markup=ReplyKeyboardRemove()
         )
     else:
@@ -1420,12 +2986,166 @@ async def echo_handler(message: Message, state: FSMContext) -> None:
         return
 
 
+# возобновление заданий на отправку, прерванных перезапуском бота
+async def resume_submission_jobs(bot: Bot) -> None:
+    """
+    Продолжает задания, которые остались в БД после остановки бота: созданные в песочнице снова ставятся
+    на ожидание результатов, а не загруженные загружаются заново. Задание, которое так и не удалось загрузить
+    за `SUBMISSION_JOB_MAX_ATTEMPTS` попыток, снимается, а проверка возвращается пользователю.
+
+    Принимает:
+        - `bot` (Bot): бот, от имени которого отправляются сообщения
+    """
+
+    unfinished_jobs: list[SubmissionJobFromDb] = await submission_jobs_functions.get_unfinished_jobs()
+    if not unfinished_jobs:
+        return
+
+    logger.info(f"Resuming {len(unfinished_jobs)} unfinished submission jobs")
+    batch_ids: set[str] = set()
+    batch_jobs_to_upload: dict[str, list[SubmissionJobFromDb]] = {}
+    for job in unfinished_jobs:
+        if job.batch_id is not None:
+            batch_ids.add(job.batch_id)
+
+        # результат задания из пачки уже готов и ждет остальных заданий пачки
+        if job.status == submission_jobs_functions.JOB_STATUS_DONE:
+            continue
+
+        # задание уже создано в песочнице - осталось дождаться результатов, а такие же новые задания могут к нему присоединиться
+        if job.status == submission_jobs_functions.JOB_STATUS_SUBMITTED:
+            flight_key = inflight.job_key(job)
+            if flight_key is not None:
+                inflight_scans.register(flight_key, job.scan_id)
+            scan_poller.track(
+                PendingScan(
+                    scan_id=job.scan_id,
+                    tg_user_id=job.tg_user_id,
+                    chat_id=job.chat_id,
+                    user_role=job.user_role,
+                    can_get_links=job.can_get_links,
+                    created_at=job.updated_at,
+                    sha256=job.file_sha256 if job.scan_type == "file" and not job.passwords else None,
+                    url=urls.canonicalize_url(job.url) if job.scan_type == "url" and not job.passwords else None,
+                    ptsb_node=job.ptsb_node
+                )
+            )
+            continue
+
+        # загрузка не удалась слишком много раз - возможно, задание и роняет бота
+        if job.attempts >= SUBMISSION_JOB_MAX_ATTEMPTS:
+            logger.warning(f"Submission job {job.job_id} of user {job.tg_user_id} was abandoned after {job.attempts} attempts")
+
+            await sandbox_profiles_functions.refund_checks(tg_user_id=job.tg_user_id)
+            submission_rate_limiter.release(job.tg_user_id, job.created_at)
+
+            # о задании из пачки сообщит общий отчет по пачке
+            if job.batch_id is not None:
+                await submission_jobs_functions.complete_job(
+                    job.job_id,
+                    f"{format_job_label(job)}: ⚠️ не удалось отправить на проверку после перезапуска бота, проверка не списана"
+                )
+                remove_job_file(job, "after abandoning submission job")
+                continue
+
+            await submission_jobs_functions.delete_job(job.job_id)
+            remove_job_file(job, "after abandoning submission job")
+            try:
+                await bot.send_message(
+                    chat_id=job.chat_id,
+                    text=(
+                        "⚠️ Не удалось отправить задание на проверку после перезапуска бота. Проверка не была списана.\n\n"
+                        "Повторите отправку позже."
+                    )
+                )
+            except TelegramAPIError:
+                logger.warning(f"Failed to notify user {job.tg_user_id} about abandoned submission job {job.job_id}", exc_info=True)
+            continue
+
+        # задание не успело загрузиться - загружаем заново в фоне, не задерживая запуск бота
+        logger.info(f"Restarting upload of submission job {job.job_id} of user {job.tg_user_id} (status={job.status}, attempts={job.attempts})")
+        if job.batch_id is not None:
+            batch_jobs_to_upload.setdefault(job.batch_id, []).append(job)
+            continue
+        asyncio.create_task(_resume_submission_job(bot, job), name=f"submission_job_{job.job_id}")
+
+    # задания одной пачки загружаются вместе, чтобы пользователь получил по ним одну сводку
+    for batch_id, batch_jobs in batch_jobs_to_upload.items():
+        asyncio.create_task(_resume_submission_batch(bot, batch_jobs), name=f"submission_batch_{batch_id}")
+
+    # пачки, в которых не осталось заданий для загрузки, могли завершиться уже сейчас
+    for batch_id in batch_ids - batch_jobs_to_upload.keys():
+        await finish_submission_batch(bot, batch_id)
+
+
+# повторная загрузка одного прерванного задания
+async def _resume_submission_job(bot: Bot, job: SubmissionJobFromDb) -> None:
+    try:
+        await bot.send_message(
+            chat_id=job.chat_id,
+            text="🔄 Бот был перезапущен во время отправки Вашего задания на проверку. Продолжаю отправку."
+        )
+        await run_submission_job(bot, job)
+    except Exception:
+        logger.error(f"Failed to resume submission job {job.job_id} of user {job.tg_user_id}", exc_info=True)
+
+
+# повторная загрузка прерванной пачки файлов
+async def _resume_submission_batch(bot: Bot, jobs: list[SubmissionJobFromDb]) -> None:
+    try:
+        await run_submission_batch(bot, jobs, resumed=True)
+    except Exception:
+        logger.error(f"Failed to resume submission batch {jobs[0].batch_id} of user {jobs[0].tg_user_id}", exc_info=True)
+
+
+# удаление файлов, которые остались в папке загрузок от прерванных операций
+async def cleanup_orphaned_downloads() -> None:
+    """
+    Удаляет из `DOWNLODAD_DIR` файлы, которые не нужны ни одному заданию на отправку и ни одному пользователю,
+    который загрузил файл, но еще не отправил его на проверку. Такие файлы остаются, например, если бот
+    остановился посреди скачивания файла из ТГ.
+    """
+
+    referenced_files = await submission_jobs_functions.get_referenced_files()
+    for user_data in await fsm_storage.get_all_data():
+        file_to_scan = user_data.get(SandboxInteractionsParameters.file_to_scan)
+        if file_to_scan:
+            referenced_files.add(file_to_scan)
+        for batch_file in user_data.get(SandboxInteractionsParameters.batch_files) or []:
+            if batch_file.get("file_to_scan"):
+                referenced_files.add(batch_file["file_to_scan"])
+
+    referenced_files = {os.path.abspath(path) for path in referenced_files}
+    for file_name in os.listdir(DOWNLODAD_DIR):
+        path_to_file = os.path.abspath(os.path.join(DOWNLODAD_DIR, file_name))
+        if path_to_file in referenced_files or not os.path.isfile(path_to_file):
+            continue
+
+        try:
+            os.remove(path_to_file)
+            logger.info(f"Orphaned file {path_to_file} was deleted from local storage")
+        except OSError:
+            logger.warning(f"Failed to delete orphaned file {path_to_file}", exc_info=True)
+
+
 # главный мейн цикл, где запускается бот, с которым дальше будет идти работа
 async def main() -> None:
 
+    # открываем общее соединение с БД, через которое будут работать все запросы приложения
+    await database.open_kernel_db()
+
     # создаем таблицу пользователей, если таблцы пользователей не существует
     await users_functions.create_table_if_not_exists()
     await sandbox_profiles_functions.create_table_if_not_exists()
+    await verdict_cache_functions.create_table_if_not_exists()
+    await url_verdict_cache_functions.create_table_if_not_exists()
+    await tg_files_functions.create_table_if_not_exists()
+    await fsm_storage.create_table_if_not_exists()
+    await rate_limits_functions.create_table_if_not_exists()
+    await submission_jobs_functions.create_table_if_not_exists()
+
+    # обновляем схему БД, созданной предыдущими версиями бота
+    await migrations.apply_migrations()
 
     logger.info("Default app db was created and all needed tables in it")
 
@@ -1447,20 +3167,20 @@ async def main() -> None:
             tg_user_id=FIRST_BOT_ADMIN_ID,
             max_available_checks=1_000_000,
             check_priority=4,
-            can_get_links=1
+            can_get_links=1,
+            burst_limit=0,
+            hourly_limit=0,
+            daily_limit=0
         )
-    
-    # шэдулер на обновление количества попыток
-    logger.info("Setting up scheduler to renew amount of remaining_checks for all users")
-    scheduler = AsyncIOScheduler(timezone="Europe/Moscow")  # TODO можно указать нужный TZ
-    scheduler.add_job(
-        sandbox_profiles_functions.daily_reset_remaining_checks,
-        CronTrigger(hour=0, minute=0),
-        misfire_grace_time=60 * 60,
-        coalesce=True,
-        max_instances=1
-    )
-    scheduler.start()
+
+    # восстанавливаем счетчики ограничения частоты, чтобы перезапуск бота их не обнулял
+    logger.info("Loading rate limit counters")
+    await submission_rate_limiter.load()
+    submission_rate_limiter.start()
+
+    # создаем общий пул подключений к песочнице, чтобы не открывать TCP+TLS соединение на каждый запрос
+    logger.info("Opening shared connection pool to PTSB")
+    await ptsb_client.open_ptsb_client()
 
     # создаем сессию с серверами ТГ
     session_with_tg: AiohttpSession = connections.create_session_to_tg()
@@ -1474,9 +3194,38 @@ async def main() -> None:
             session=session_with_tg 
         )
 
+    # запускаем фоновый опрос результатов проверки, готовые вердикты бот отправит пользователям сам
+    logger.info("Starting background polling of scan results")
+    scan_poller.start(
+        on_ready=functools.partial(push_scan_result, bot),
+        on_failed=functools.partial(push_scan_failure, bot)
+    )
+
+    # проверяем состояние API в фоне, чтобы не отправлять запросы в недоступную песочницу
+    logger.info("Starting background PTSB health monitoring")
+    ptsb_health_monitor.start()
+
+    # удаляем файлы, оставшиеся от прерванных операций, и продолжаем задания, которые не успели завершиться до остановки бота
+    logger.info("Cleaning up orphaned downloads and resuming unfinished submission jobs")
+    await cleanup_orphaned_downloads()
+    await resume_submission_jobs(bot)
+
     # And the run events dispatching
     logger.info("Starting tg bot entity")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await scan_poller.stop()
+        await ptsb_health_monitor.stop()
+        await submission_rate_limiter.stop()
+
+        # закрываем пул подключений к песочнице при остановке бота
+        logger.info("Closing shared connection pool to PTSB")
+        await ptsb_client.close_ptsb_client()
+
+        # закрываем соединение с БД последним, т.к. при остановке диспетчера в нее дописываются состояния пользователей
+        logger.info("Closing connection to app db")
+        await database.close_kernel_db()
 
 
 # INT MAIN() дань классике
@@ -0,0 +1,10 @@
+# встроенные библиотеки
+import os
+import sys
+
+
+# код бота лежит в ptsb-checkbot и импортируется так же, как внутри контейнера
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ptsb-checkbot"))
+
+# параметры, без которых модули бота не импортируются
+os.environ.setdefault("VERIFY_SSL_CONNECTIONS", "0")
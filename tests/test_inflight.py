@@ -0,0 +1,67 @@
+# встроенные библиотеки
+import asyncio
+
+# самописные
+from app.bot.inflight import InflightScans
+
+
+KEY = "sha256:abc"
+
+
+def test_waiting_job_attaches_to_uploaded_scan():
+    async def scenario() -> None:
+        scans = InflightScans()
+        upload = await scans.join(KEY)
+        assert isinstance(upload, asyncio.Event)
+
+        waiting = asyncio.create_task(scans.join(KEY))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+
+        scans.finish_upload(KEY, "scan-1", upload)
+        assert await waiting == "scan-1"
+
+    asyncio.run(scenario())
+
+
+def test_failed_upload_hands_over_to_next_job():
+    async def scenario() -> None:
+        scans = InflightScans()
+        upload = await scans.join(KEY)
+        waiting = asyncio.create_task(scans.join(KEY))
+        await asyncio.sleep(0)
+
+        scans.finish_upload(KEY, None, upload)
+        next_upload = await waiting
+        assert isinstance(next_upload, asyncio.Event) and next_upload is not upload
+
+    asyncio.run(scenario())
+
+
+def test_repeated_finish_does_not_end_next_upload():
+    async def scenario() -> None:
+        active_scans = {"scan-1"}
+        scans = InflightScans(is_scan_active=active_scans.__contains__)
+
+        # первое задание рано завершает загрузку, чтобы к проверке присоединялись, пока ждется быстрый вердикт
+        upload_a = await scans.join(KEY)
+        scans.finish_upload(KEY, "scan-1", upload_a)
+
+        # вердикт получен, следующее такое же задание загружается заново, еще одно ждет его загрузки
+        active_scans.discard("scan-1")
+        scans.forget("scan-1")
+        upload_b = await scans.join(KEY)
+        assert isinstance(upload_b, asyncio.Event)
+        waiting = asyncio.create_task(scans.join(KEY))
+        await asyncio.sleep(0)
+
+        # повторное завершение первой загрузки не должно отпустить ожидающего раньше, чем закончится вторая
+        scans.finish_upload(KEY, "scan-1", upload_a)
+        await asyncio.sleep(0)
+        assert not waiting.done()
+
+        active_scans.add("scan-2")
+        scans.finish_upload(KEY, "scan-2", upload_b)
+        assert await waiting == "scan-2"
+
+    asyncio.run(scenario())
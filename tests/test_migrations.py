@@ -0,0 +1,121 @@
+# встроенные библиотеки
+import asyncio
+import sqlite3
+
+# устанавливаемые библиотеки
+import pytest
+
+# самописные
+from app.bot.fsm_storage import SqliteStorage
+from app.db import database
+from app.db import migrations
+from app.db import rate_limits_functions
+from app.db import sandbox_profiles_functions
+from app.db import submission_jobs_functions
+from app.db import tg_files_functions
+from app.db import url_verdict_cache_functions
+from app.db import users_functions
+from app.db import verdict_cache_functions
+
+
+# таблицы пользователей в том виде, в котором их создавала первая версия бота, - без первичного ключа
+BASELINE_SCHEMA = """
+    CREATE TABLE users (
+        tg_user_id INTEGER,
+        user_role TEXT,
+        comment TEXT,
+        created_by INTEGER,
+        creation_date TEXT,
+        update_date TEXT,
+        is_blocked INTEGER
+    );
+    CREATE TABLE sandbox_profiles (
+        tg_user_id INTEGER,
+        max_available_checks INTEGER,
+        remaining_checks INTEGER,
+        total_checks INTEGER,
+        check_priority INTEGER,
+        can_get_links INTEGER
+    );
+"""
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "kernel_base.db")
+    monkeypatch.setattr(database, "FULL_PATH_TO_KERNEL_DB", path)
+    return path
+
+
+# запуск бота: создание таблиц и миграции, как в `main()` ядра
+async def start_bot_db() -> None:
+    await database.open_kernel_db()
+    try:
+        await users_functions.create_table_if_not_exists()
+        await sandbox_profiles_functions.create_table_if_not_exists()
+        await verdict_cache_functions.create_table_if_not_exists()
+        await url_verdict_cache_functions.create_table_if_not_exists()
+        await tg_files_functions.create_table_if_not_exists()
+        await SqliteStorage().create_table_if_not_exists()
+        await rate_limits_functions.create_table_if_not_exists()
+        await submission_jobs_functions.create_table_if_not_exists()
+        await migrations.apply_migrations()
+    finally:
+        await database.close_kernel_db()
+
+
+def primary_key_columns(db: sqlite3.Connection, table_name: str) -> list[str]:
+    return [column[1] for column in db.execute(f"PRAGMA table_info({table_name})") if column[5]]
+
+
+def test_baseline_db_keeps_first_row_of_each_user(db_path):
+    with sqlite3.connect(db_path) as db:
+        db.executescript(BASELINE_SCHEMA)
+        db.executemany("INSERT INTO users VALUES (?, 'user', ?, 0, '', '', 0)", [
+            (1, "первая строка"),
+            (2, "единственная строка"),
+            (1, "дубль"),
+            (None, "без пользователя"),
+        ])
+        db.executemany("INSERT INTO sandbox_profiles VALUES (?, ?, ?, 0, 1, 0)", [
+            (1, 10, 7),
+            (1, 99, 99),
+            (2, 5, 5),
+        ])
+    db.close()
+
+    asyncio.run(start_bot_db())
+
+    with sqlite3.connect(db_path) as db:
+        assert db.execute("PRAGMA user_version").fetchone()[0] == len(migrations.MIGRATIONS)
+        assert primary_key_columns(db, "users") == ["tg_user_id"]
+        assert primary_key_columns(db, "sandbox_profiles") == ["tg_user_id"]
+        assert db.execute("SELECT tg_user_id, comment FROM users ORDER BY tg_user_id").fetchall() == [
+            (1, "первая строка"),
+            (2, "единственная строка"),
+        ]
+        assert db.execute("SELECT tg_user_id, max_available_checks, remaining_checks FROM sandbox_profiles ORDER BY tg_user_id").fetchall() == [
+            (1, 10, 7),
+            (2, 5, 5),
+        ]
+        # колонки более поздних миграций добавлены в пересозданную таблицу
+        profile_columns = [column[1] for column in db.execute("PRAGMA table_info(sandbox_profiles)")]
+        assert {"timezone", "quota_window_start", "burst_limit", "hourly_limit", "daily_limit"} <= set(profile_columns)
+    db.close()
+
+
+def test_fresh_db_gets_latest_version_and_restart_changes_nothing(db_path):
+    asyncio.run(start_bot_db())
+
+    with sqlite3.connect(db_path) as db:
+        db.execute("INSERT INTO users (tg_user_id, user_role) VALUES (1, 'admin')")
+        schema = db.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall()
+    db.close()
+
+    asyncio.run(start_bot_db())
+
+    with sqlite3.connect(db_path) as db:
+        assert db.execute("PRAGMA user_version").fetchone()[0] == len(migrations.MIGRATIONS)
+        assert db.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall() == schema
+        assert db.execute("SELECT tg_user_id, user_role FROM users").fetchall() == [(1, "admin")]
+    db.close()
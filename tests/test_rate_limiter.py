@@ -0,0 +1,94 @@
+# встроенные библиотеки
+import math
+import time
+
+# устанавливаемые библиотеки
+import pytest
+
+# самописные
+from app.bot.rate_limiter import RateLimits, SubmissionRateLimiter, _SlidingWindow
+
+
+WINDOW = 60
+LIMIT = 5
+
+
+# окно, в котором в момент `hit_at` сделано `hits` отправок
+def make_window(hits: int, hit_at: float = 10.0) -> _SlidingWindow:
+    window = _SlidingWindow(window_seconds=WINDOW, window_start=0.0)
+    window.hit(hit_at, amount=hits)
+    return window
+
+
+def test_empty_window_allows_right_away():
+    assert _SlidingWindow(window_seconds=WINDOW, window_start=0.0).seconds_until_allowed(LIMIT, 30.0) == 0.0
+
+
+def test_full_current_window_waits_for_next_window_and_share_of_previous():
+    window = make_window(LIMIT)
+
+    # до конца окна 50 сек., а потом доля предыдущего окна должна опуститься до 4 из 5: еще 60 * (1 - 4 / 5) = 12 сек.
+    assert window.seconds_until_allowed(LIMIT, 10.0) == pytest.approx(62.0)
+    assert window.seconds_until_allowed(LIMIT, 71.0) > 0
+    assert window.seconds_until_allowed(LIMIT, 72.0) == 0.0
+
+
+def test_previous_window_share_is_interpolated():
+    window = make_window(LIMIT)
+
+    # в новом окне текущий счетчик пуст, но 5 * (1 - 10 / 60) + 1 > 5, ждем, пока доля 5 отправок не станет 4
+    assert window.seconds_until_allowed(LIMIT, 70.0) == pytest.approx(2.0)
+    assert window.previous_count == LIMIT
+    assert window.current_count == 0
+
+
+def test_rollover_over_two_windows_forgets_previous_window():
+    window = make_window(LIMIT)
+
+    assert window.seconds_until_allowed(LIMIT, 130.0) == 0.0
+    assert window.window_start == 120.0
+    assert window.previous_count == 0
+    assert window.current_count == 0
+
+
+def test_amount_is_charged_as_several_submissions():
+    window = make_window(3, hit_at=1.0)
+
+    assert window.seconds_until_allowed(LIMIT, 1.0, amount=2) == 0.0
+    # 3 отправки в текущем окне и еще 3: ждем следующего окна (59 сек.) и снижения доли 3 отправок до 2 (20 сек.)
+    assert window.seconds_until_allowed(LIMIT, 1.0, amount=3) == pytest.approx(79.0)
+    assert window.seconds_until_allowed(LIMIT, 80.0, amount=3) == 0.0
+
+
+def test_amount_over_limit_is_never_allowed():
+    assert math.isinf(_SlidingWindow(window_seconds=WINDOW, window_start=0.0).seconds_until_allowed(LIMIT, 0.0, amount=LIMIT + 1))
+
+
+def test_release_returns_submissions_to_window_they_were_counted_in():
+    window = make_window(LIMIT)
+    window.release(20.0, acquired_at=10.0, amount=2)
+    assert window.current_count == 3
+
+    # после смены окна отправки уже в предыдущем окне
+    window.release(70.0, acquired_at=10.0)
+    assert (window.previous_count, window.current_count) == (2, 0)
+
+    # отправки старше двух окон на ограничение не влияют, возвращать нечего
+    window.release(200.0, acquired_at=10.0)
+    assert (window.previous_count, window.current_count) == (0, 0)
+
+
+def test_limiter_acquire_and_release():
+    limiter = SubmissionRateLimiter()
+    limits = RateLimits(burst=2, hourly=0, daily=10)
+
+    assert limiter.try_acquire(1, limits, amount=2) == 0.0
+    acquired_at = time.time()
+    assert limiter.try_acquire(1, limits) > 0
+    assert math.isinf(limiter.seconds_until_allowed(1, limits, amount=3))
+    assert limits.max_amount() == 2
+
+    # возврат отправки освобождает место во всех окнах пользователя, другие пользователи не затронуты
+    limiter.release(1, acquired_at)
+    assert limiter.try_acquire(1, limits) == 0.0
+    assert limiter.try_acquire(2, limits, amount=2) == 0.0
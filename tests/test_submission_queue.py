@@ -0,0 +1,64 @@
+# встроенные библиотеки
+import asyncio
+
+# самописные
+from app.api.submission_queue import SubmissionQueue
+
+
+# порядок, в котором задания получают единственное место для загрузки, пока оно сначала занято
+async def grant_order(submissions: list[tuple[str, int, int]], cancelled: frozenset[str] = frozenset()) -> list[str]:
+    queue = SubmissionQueue(max_concurrent=1)
+    granted: list[str] = []
+
+    async def submit(name: str, tg_user_id: int, check_priority: int) -> None:
+        async with queue.slot(tg_user_id, check_priority):
+            granted.append(name)
+
+    # место занято, поэтому все задания встают в очередь
+    await queue.acquire(tg_user_id=0, check_priority=1)
+    tasks = {name: asyncio.create_task(submit(name, tg_user_id, check_priority)) for name, tg_user_id, check_priority in submissions}
+    await asyncio.sleep(0)
+    assert len(queue) == len(submissions)
+
+    for name in cancelled:
+        tasks[name].cancel()
+    await asyncio.sleep(0)
+
+    queue.release()
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+    assert queue.active == 0 and len(queue) == 0
+    return granted
+
+
+def test_batch_of_one_user_does_not_delay_others():
+    order = asyncio.run(grant_order([
+        ("a1", 1, 1),
+        ("a2", 1, 1),
+        ("a3", 1, 1),
+        ("b1", 2, 1),
+    ]))
+
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_higher_priority_goes_first_without_starving_lower_priority():
+    order = asyncio.run(grant_order([
+        ("low1", 1, 1),
+        ("low2", 1, 1),
+        ("high1", 2, 2),
+        ("high2", 2, 2),
+        ("high3", 2, 2),
+    ]))
+
+    # шаг пользователя с приоритетом 2 вдвое меньше, поэтому на каждое задание с приоритетом 1 проходят два его задания
+    assert order == ["high1", "high2", "low1", "high3", "low2"]
+
+
+def test_cancelled_submission_leaves_queue():
+    order = asyncio.run(grant_order([
+        ("a1", 1, 1),
+        ("b1", 2, 1),
+        ("a2", 1, 1),
+    ], cancelled=frozenset({"b1"})))
+
+    assert order == ["a1", "a2"]
@@ -0,0 +1,38 @@
+# устанавливаемые библиотеки
+import pytest
+
+# самописные
+from app.bot.urls import canonicalize_url
+
+
+@pytest.mark.parametrize("raw_url, canonical_url", [
+    # схема, хост, порт по умолчанию и фрагмент приводятся к единому виду
+    ("HTTP://Example.COM:80/path#frag", "http://example.com/path"),
+    ("example.com", "http://example.com/"),
+    ("https://пример.рф/", "https://xn--e1afmkfd.xn--p1ai/"),
+    ("https://example.com:8443/", "https://example.com:8443/"),
+    # `/` в конце пути убирается, но корень остается корнем
+    ("https://example.com/a/", "https://example.com/a"),
+    ("https://example.com//", "https://example.com/"),
+    # параметры отслеживания удаляются, остальные сортируются, пустые значения сохраняются
+    ("https://example.com/path/?utm_source=x&b=2&a=1", "https://example.com/path?a=1&b=2"),
+    ("https://example.com/?fbclid=1&UTM_Medium=m", "https://example.com/"),
+    ("https://example.com/?utmost=1&q=", "https://example.com/?q=&utmost=1"),
+])
+def test_canonicalize_url(raw_url, canonical_url):
+    assert canonicalize_url(raw_url) == canonical_url
+
+
+def test_copies_from_mailing_share_canonical_url():
+    copies = [
+        "https://example.com/news/?id=7&utm_source=mail&utm_campaign=spring",
+        "https://EXAMPLE.com/news?utm_medium=tg&id=7#comments",
+        "https://example.com:443/news/?gclid=abc&id=7",
+    ]
+
+    assert {canonicalize_url(url) for url in copies} == {"https://example.com/news?id=7"}
+
+
+def test_different_content_keeps_different_canonical_urls():
+    assert canonicalize_url("https://example.com/news?id=7") != canonicalize_url("https://example.com/news?id=8")
+    assert canonicalize_url("https://example.com/news") != canonicalize_url("http://example.com/news")